@@ -0,0 +1,113 @@
+"""Approximate search evaluation: recall@k and latency against the exact find_top_matches path.
+
+A synthetic corpus is trained once per size (in a temporary directory, never
+model/), then dense vectors are added for every projection method and size
+(model/projection.py). Each synthetic CV is matched with mode='exact' (the
+reference) and with mode='approximate' for every shortlist size; the
+benchmark reports the find_top_matches latency, the build time and size of
+the dense vectors, and recall@k of the approximate top-k.
+
+Run from the repository root:
+    python -m benchmarks.approximate --sizes 10000,100000 --dims 64,128,256 --shortlists 0,100,500
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.compact import recall_at_k
+from benchmarks.report import environment, save_json, summarize
+from benchmarks.synthetic import make_cv_lines, make_job_corpus
+
+
+def _timed(fn, queries, repeats: int):
+    durations = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run_approximate_benchmark(sizes, methods, dims_list, shortlists, n_queries: int, k: int, repeats: int,
+                              workdir: str) -> dict:
+    # The web layer is imported only once the first synthetic index exists
+    index_dir = os.path.join(workdir, 'index')
+    os.environ['CV_INDEX_DIR'] = index_dir
+    os.environ['CV_CACHE_BACKEND'] = 'none'
+    from model.projection import add_dense_vectors
+    from model.train_model import TEXT_COLUMN_NAME, train_tfidf_model
+
+    results = {}
+    utils = None
+    for size in sizes:
+        print(f"Corpus of {size} job ads...")
+        csv_path = os.path.join(workdir, f'job_ads_{size}.csv')
+        make_job_corpus(size, seed=size).to_csv(csv_path, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            train_tfidf_model(csv_path, TEXT_COLUMN_NAME, os.path.join(workdir, 'vectorizer.pkl'),
+                              os.path.join(workdir, 'vectors.pkl'), index_dir=index_dir)
+        if utils is None:
+            from web import retrieval, utils
+        utils.index_registry.load()
+        cvs = [" ".join(make_cv_lines(40, seed=size + q)) for q in range(n_queries)]
+
+        reference = [utils.rank_job_ads(cv, k, 'exact')[1].rows.tolist() for cv in cvs]
+        durations = _timed(lambda cv: utils.find_top_matches(cv, k, 'exact'), cvs, repeats)
+        baseline_ms = summarize(durations)["p50_ms"]
+        results[f"find_top_matches[n={size},mode=exact]"] = {**summarize(durations), f"recall@{k}": 1.0, "speedup": 1.0}
+
+        for method in methods:
+            for dims in dims_list:
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    add_dense_vectors(index_dir, dims, method)
+                    index = utils.index_registry.load()
+                build_seconds = time.perf_counter() - start
+                for shortlist in shortlists:
+                    # Shortlist used by every approximate request of this run
+                    retrieval.APPROX_SHORTLIST = shortlist
+                    tops = [utils.rank_job_ads(cv, k, 'approximate')[1].rows.tolist() for cv in cvs]
+                    durations = _timed(lambda cv: utils.find_top_matches(cv, k, 'approximate'), cvs, repeats)
+                    stats = summarize(durations)
+                    results[f"find_top_matches[n={size},mode=approximate,method={method},dims={dims},"
+                            f"shortlist={shortlist}]"] = {
+                        **stats, f"recall@{k}": recall_at_k(tops, reference), "speedup": baseline_ms / stats["p50_ms"],
+                        "build_seconds": build_seconds, "dense_mb": index.dense.nbytes / 2 ** 20,
+                    }
+    return results
+
+
+def print_approximate_results(results: dict, k: int):
+    print(f"{'benchmark':<84} {'p50 ms':>8} {'speedup':>8} {'recall@' + str(k):>9}")
+    for name, stats in results.items():
+        print(f"{name:<84} {stats['p50_ms']:>8.2f} {stats['speedup']:>7.1f}x {stats[f'recall@{k}']:>9.4f}")
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item]
+
+
+if __name__ == "__main__":
+    from model.projection import DENSE_METHODS
+    parser = argparse.ArgumentParser(description="Recall and latency of the approximate search mode.")
+    parser.add_argument('--sizes', type=_int_list, default=[10000, 100000])
+    parser.add_argument('--methods', type=lambda value: value.split(','), default=list(DENSE_METHODS))
+    parser.add_argument('--dims', type=_int_list, default=[64, 128, 256])
+    parser.add_argument('--shortlists', type=_int_list, default=[0, 100, 500],
+                        help="rows re-ranked exactly (0: dense scores only)")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=9)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default='approximate_results.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cv-approximate-') as workdir:
+        results = run_approximate_benchmark(args.sizes, args.methods, args.dims, args.shortlists, args.queries,
+                                            args.k, args.repeats, workdir)
+    save_json(args.output, {"environment": environment(), "args": vars(args), "results": results})
+    print_approximate_results(results, args.k)
+    print(f"Results written to {args.output}")
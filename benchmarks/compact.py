@@ -0,0 +1,125 @@
+"""Compact index benchmark: memory, latency and ranking agreement per precision.
+
+A synthetic corpus is vectorized once, then written as one index version per
+storage variant (float64, float32, uint16, uint8, optionally with small
+weights pruned). For every variant the benchmark reports the size of the
+matrix files, the exact-search latency, and recall@k against the previous
+scoring path (cosine_similarity on the float64 matrix), which is also timed.
+
+Run from the repository root:
+    python -m benchmarks.compact --sizes 10000,100000 --queries 50 --min-weight 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.report import environment, save_json, summarize
+from benchmarks.synthetic import make_cv_lines, make_job_corpus
+
+MATRIX_FILES = ('data.npy', 'indices.npy', 'indptr.npy')
+
+
+def _file_mb(directory: str, names) -> float:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in names) / 2 ** 20
+
+
+def _timed(fn, queries, repeats: int):
+    """Top-k rows of every query, and the durations of `repeats` passes over the queries"""
+    tops = [fn(query) for query in queries]
+    durations = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            durations.append(time.perf_counter() - start)
+    return tops, durations
+
+
+def recall_at_k(tops, reference) -> float:
+    """Mean share of the reference top-k found in the top-k"""
+    return float(np.mean([len(set(top) & set(ref)) / len(ref) for top, ref in zip(tops, reference) if len(ref)]))
+
+
+def run_compact_benchmark(sizes, n_queries: int, k: int, repeats: int, min_weight: float, workdir: str) -> dict:
+    from scipy.sparse import csr_matrix
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    from model.index import PRECISIONS, VECTORIZER_PARAMS, encode_string_column, open_index, write_index_version
+    from model.preprocessing import preprocess_corpus
+    from model.train_model import VECTORIZER_OPTIONS
+    from web.retrieval import exact_search
+    from web.scoring import top_k_indices
+
+    variants = [(precision, 0.0) for precision in PRECISIONS]
+    if min_weight:
+        variants += [('float32', min_weight), ('uint8', min_weight)]
+    results = {}
+    for size in sizes:
+        print(f"Corpus of {size} job ads...")
+        corpus = make_job_corpus(size, seed=size)
+        vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
+        matrix = vectorizer.fit_transform(preprocess_corpus(corpus['Description'].tolist()))
+        queries = vectorizer.transform(preprocess_corpus(
+            [" ".join(make_cv_lines(40, seed=size + q)) for q in range(n_queries)]))
+        queries = [queries[q] for q in range(n_queries)]
+        params = vectorizer.get_params()
+        columns = {'Company': encode_string_column(corpus['Company'].tolist())}
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+
+        # The previous scoring path: cosine_similarity renormalizes the float64 matrix on every request
+        legacy = csr_matrix(matrix)
+        reference, durations = _timed(
+            lambda query: top_k_indices(cosine_similarity(query, legacy).ravel(), k).tolist(), queries, repeats)
+        baseline_ms = summarize(durations)["p50_ms"]
+        results[f"cosine_similarity[n={size},precision=float64]"] = {
+            **summarize(durations), "matrix_mb": (legacy.data.nbytes + legacy.indices.nbytes + legacy.indptr.nbytes) / 2 ** 20,
+            "nnz": int(legacy.nnz), f"recall@{k}": 1.0, "speedup": 1.0,
+        }
+
+        for precision, variant_min_weight in variants:
+            index_dir = os.path.join(workdir, f'{size}-{precision}-{variant_min_weight}')
+            write_index_version(index_dir, matrix, vectorizer.idf_, terms, columns,
+                                {name: params[name] for name in VECTORIZER_PARAMS}, precision=precision,
+                                min_weight=variant_min_weight)
+            index = open_index(index_dir)
+            tops, durations = _timed(lambda query: exact_search(index, query, k).rows.tolist(), queries, repeats)
+            stats = summarize(durations)
+            name = f"dot_product[n={size},precision={precision}" + (
+                f",min_weight={variant_min_weight}]" if variant_min_weight else "]")
+            results[name] = {
+                **stats, "matrix_mb": _file_mb(index.path, MATRIX_FILES), "nnz": int(index.matrix.nnz),
+                f"recall@{k}": recall_at_k(tops, reference), "speedup": baseline_ms / stats["p50_ms"],
+            }
+    return results
+
+
+def print_compact_results(results: dict, k: int):
+    print(f"{'variant':<56} {'matrix MB':>10} {'nnz':>10} {'p50 ms':>8} {'speedup':>8} {'recall@' + str(k):>9}")
+    for name, stats in results.items():
+        print(f"{name:<56} {stats['matrix_mb']:>10.2f} {stats['nnz']:>10} {stats['p50_ms']:>8.2f} "
+              f"{stats['speedup']:>7.1f}x {stats[f'recall@{k}']:>9.4f}")
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the compact index precisions with the float64 cosine path.")
+    parser.add_argument('--sizes', type=_int_list, default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=9)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--min-weight', type=float, default=0.05,
+                        help="also benchmark float32 and uint8 with weights below this dropped (0 to skip)")
+    parser.add_argument('--output', default='compact_results.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cv-compact-') as workdir:
+        results = run_compact_benchmark(args.sizes, args.queries, args.k, args.repeats, args.min_weight, workdir)
+    save_json(args.output, {"environment": environment(), "args": vars(args), "results": results})
+    print_compact_results(results, args.k)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,445 @@
+"""Load test: the app under the Procfile's gunicorn configuration, driven with synthetic CVs.
+
+For every corpus size a synthetic index is trained in a temporary directory
+(never model/). For every worker count the Procfile's web command is started
+locally, with its environment and gunicorn options (UvicornWorker) and only
+the worker count and bind address replaced. POST /api/analyze, POST /upload
+and GET /api/health then get a mix of requests with generated PDF and DOCX
+CVs, either from a fixed number of concurrent clients (closed loop) or at a
+fixed arrival rate (open loop, Poisson arrivals; latency counts from the
+scheduled arrival, so a saturated server shows up in the percentiles).
+
+Each load point reports throughput, p50/p95/p99 latency and the error rate,
+overall and per endpoint, and the peak RSS of every gunicorn worker alone
+and with its extraction processes, sampled from /proc (Linux only). Results
+are written as JSON and can be stored as a baseline and compared like
+benchmarks/run.py, so releases can be checked for regressions.
+
+Run from the repository root (needs httpx):
+    python -m benchmarks.loadtest --workers 1,2,4 --sizes 10000 --concurrency 4,16 --duration 20
+    python -m benchmarks.loadtest --workers 4 --rates 5,10,20,40     # find the saturation rate
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.report import compare_to_baseline, environment, load_json, print_comparison, save_json, summarize
+from benchmarks.synthetic import make_cv_docx, make_cv_pdf, make_job_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCFILE = os.path.join(ROOT, 'Procfile')
+ENDPOINTS = ('analyze', 'upload', 'health')
+DEFAULT_MIX = 'analyze=6,upload=2,health=2'
+PDF_CONTENT_TYPE = 'application/pdf'
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# Seconds between two RSS samples of the workers
+RSS_INTERVAL = 0.5
+
+
+def procfile_command(path: str = PROCFILE, process: str = 'web'):
+    """(environment, argv) of a Procfile process: the leading VAR=value words are the environment"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            name, _, command = line.partition(':')
+            if name.strip() != process:
+                continue
+            words = shlex.split(command)
+            env = {}
+            while words and '=' in words[0] and not words[0].startswith('-'):
+                key, _, value = words.pop(0).partition('=')
+                env[key] = value
+            return env, words
+    raise ValueError(f"No '{process}' process in {path}")
+
+
+def gunicorn_argv(argv, workers: int, bind: str):
+    """The Procfile's gunicorn command run by this interpreter, with the worker count and bind address replaced"""
+    if not argv or os.path.basename(argv[0]) != 'gunicorn':
+        raise ValueError(f"Not a gunicorn command: {' '.join(argv)}")
+    options = []
+    words = iter(argv[1:])
+    for word in words:
+        if word in ('-w', '--workers', '-b', '--bind'):
+            next(words, None)
+        elif not word.startswith(('--workers=', '--bind=')):
+            options.append(word)
+    return [sys.executable, '-m', 'gunicorn'] + options + ['-w', str(workers), '--bind', bind]
+
+
+def process_tree() -> dict:
+    """Children of every process, from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may contain spaces
+        ppid = int(stat[stat.rindex(b')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of a process (0 once it has exited)"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _descendants(tree: dict, pid: int):
+    stack, found = list(tree.get(pid, ())), []
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(tree.get(child, ()))
+    return found
+
+
+class RssSampler(threading.Thread):
+    """Peak RSS of every gunicorn worker, alone and with its extraction processes, sampled in the background"""
+
+    def __init__(self, master_pid: int, interval: float = RSS_INTERVAL):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peaks = {}
+        self._done = threading.Event()
+
+    def sample(self):
+        tree = process_tree()
+        for worker in tree.get(self.master_pid, ()):
+            own = rss_bytes(worker)
+            total = own + sum(rss_bytes(child) for child in _descendants(tree, worker))
+            peak = self.peaks.setdefault(worker, [0, 0])
+            peak[0], peak[1] = max(peak[0], own), max(peak[1], total)
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> dict:
+        self._done.set()
+        self.join()
+        self.sample()
+        return {
+            str(pid): {"rss_mb": own / 2 ** 20, "with_extraction_mb": total / 2 ** 20}
+            for pid, (own, total) in sorted(self.peaks.items())
+        }
+
+
+class Server:
+    """The Procfile's web process on a local port"""
+
+    def __init__(self, workers: int, env: dict, log_path: str, procfile: str = PROCFILE):
+        procfile_env, argv = procfile_command(procfile)
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.workers = workers
+        self.argv = gunicorn_argv(argv, workers, f'127.0.0.1:{self.port}')
+        self.env = {**os.environ, **procfile_env, **env, 'PORT': str(self.port)}
+        self.log_path = log_path
+        self.process = None
+
+    def start(self, timeout: float = 120):
+        """Start gunicorn and wait until every worker answers /api/ready"""
+        import httpx
+        self._log = open(self.log_path, 'ab')
+        self.process = subprocess.Popen(self.argv, cwd=ROOT, env=self.env, stdout=self._log,
+                                        stderr=subprocess.STDOUT, start_new_session=True)
+        deadline = time.monotonic() + timeout
+        ready = 0
+        # Requests land on any worker: several readiness answers in a row before the load starts
+        while ready < 3 * self.workers:
+            if self.process.poll() is not None:
+                self.stop()
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}:\n{self.log_tail()}")
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"Server not ready after {timeout}s:\n{self.log_tail()}")
+            try:
+                ready = ready + 1 if httpx.get(self.url + '/api/ready', timeout=5).status_code == 200 else 0
+            except httpx.HTTPError:
+                ready = 0
+            if not ready:
+                time.sleep(0.2)
+
+    def log_tail(self, lines: int = 20) -> str:
+        # The log is in the temporary directory of the run, gone once the load test ends
+        with open(self.log_path, 'r', encoding='utf-8', errors='replace') as f:
+            return ''.join(f.readlines()[-lines:])
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+        if self.process is not None:
+            self._log.close()
+
+
+def make_cvs(n: int, pages, docx_share: float, seed: int = 0):
+    """n distinct synthetic CVs as (file name, bytes, content type), about docx_share of them DOCX"""
+    rng = random.Random(seed)
+    cvs = []
+    for i in range(n):
+        n_pages = pages[i % len(pages)]
+        if rng.random() < docx_share:
+            cvs.append((f'cv{i}.docx', make_cv_docx(n_pages, seed=seed + i), DOCX_CONTENT_TYPE))
+        else:
+            cvs.append((f'cv{i}.pdf', make_cv_pdf(n_pages, seed=seed + i), PDF_CONTENT_TYPE))
+    return cvs
+
+
+async def _send(client, endpoint: str, cv) -> bool:
+    """One request; True when it succeeded"""
+    if endpoint == 'health':
+        response = await client.get('/api/health')
+        return response.status_code == 200
+    files = {'cvFile': cv}
+    if endpoint == 'analyze':
+        response = await client.post('/api/analyze', files=files)
+        return response.status_code == 200
+    # The legacy form redirects to /success, or back to / when it failed
+    response = await client.post('/upload', files=files)
+    return response.status_code == 303 and response.headers.get('location', '').endswith('/success')
+
+
+async def _drive(url: str, cvs, mix: dict, duration: float, concurrency: int, rate: float, timeout: float,
+                 seed: int):
+    """Send requests for `duration` seconds. Returns [(endpoint, seconds, ok)] and the wall time."""
+    import httpx
+    rng = random.Random(seed)
+    endpoints, weights = list(mix), list(mix.values())
+    samples = []
+
+    async def request(client, scheduled: float):
+        endpoint = rng.choices(endpoints, weights)[0]
+        ok = False
+        try:
+            ok = await _send(client, endpoint, rng.choice(cvs))
+        except httpx.HTTPError:
+            pass
+        samples.append((endpoint, time.perf_counter() - scheduled, ok))
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        if rate:
+            # Open loop: Poisson arrivals, whether or not the earlier requests are done
+            tasks, scheduled = [], start
+            while True:
+                scheduled += rng.expovariate(rate)
+                if scheduled >= deadline:
+                    break
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                tasks.append(asyncio.ensure_future(request(client, scheduled)))
+            await asyncio.gather(*tasks)
+        else:
+            # Closed loop: every client sends its next request once the previous one is answered
+            async def loop():
+                while time.perf_counter() < deadline:
+                    await request(client, time.perf_counter())
+            await asyncio.gather(*[loop() for _ in range(concurrency)])
+        wall = time.perf_counter() - start
+    return samples, wall
+
+
+def _latency_stats(samples, wall: float) -> dict:
+    durations = [seconds for _, seconds, _ in samples]
+    errors = sum(1 for _, _, ok in samples if not ok)
+    if not durations:
+        return {"requests": 0, "errors": 0, "error_rate": 0.0, "throughput_per_s": 0.0}
+    stats = summarize(durations)
+    stats.pop("peak_alloc_mb")
+    stats["p95_ms"] = float(np.percentile(np.asarray(durations) * 1000, 95))
+    stats["requests"] = len(durations)
+    stats["errors"] = errors
+    stats["error_rate"] = errors / len(durations)
+    # Successful responses per second of the run
+    stats["throughput_per_s"] = (len(durations) - errors) / wall
+    return stats
+
+
+def run_load_point(server: Server, cvs, mix: dict, duration: float, warmup: float, concurrency: int, rate: float,
+                   timeout: float, seed: int) -> dict:
+    """Traffic at one load level: warm-up (discarded) then the measured run, with the workers' RSS sampled"""
+    if warmup:
+        asyncio.run(_drive(server.url, cvs, mix, warmup, max(concurrency, server.workers), 0, timeout, seed))
+    sampler = RssSampler(server.process.pid)
+    sampler.start()
+    try:
+        samples, wall = asyncio.run(_drive(server.url, cvs, mix, duration, concurrency, rate, timeout, seed + 1))
+    finally:
+        workers = sampler.stop()
+    result = _latency_stats(samples, wall)
+    result["offered_rate_per_s"] = rate or None
+    result["endpoints"] = {
+        endpoint: _latency_stats([sample for sample in samples if sample[0] == endpoint], wall)
+        for endpoint in mix
+    }
+    result["workers"] = workers
+    result["max_worker_rss_mb"] = max((w["rss_mb"] for w in workers.values()), default=0.0)
+    result["total_rss_mb"] = sum(w["with_extraction_mb"] for w in workers.values())
+    return result
+
+
+def run_loadtest(sizes, worker_counts, concurrencies, rates, mix: dict, cvs, duration: float, warmup: float,
+                 timeout: float, cache: bool, workdir: str) -> dict:
+    from model.train_model import TEXT_COLUMN_NAME, train_tfidf_model
+
+    results = {}
+    for size in sizes:
+        print(f"Corpus of {size} job ads...")
+        index_dir = os.path.join(workdir, f'index-{size}')
+        csv_path = os.path.join(workdir, f'job_ads_{size}.csv')
+        make_job_corpus(size, seed=size).to_csv(csv_path, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            train_tfidf_model(csv_path, TEXT_COLUMN_NAME, os.path.join(workdir, 'vectorizer.pkl'),
+                              os.path.join(workdir, 'vectors.pkl'), index_dir=index_dir)
+
+        for workers in worker_counts:
+            run_dir = tempfile.mkdtemp(prefix=f'n{size}-w{workers}-', dir=workdir)
+            env = {
+                'CV_INDEX_DIR': index_dir,
+                # Result handles, sessions, the cache and the metrics of this run only
+                'CV_RESULTS_PATH': os.path.join(run_dir, 'results.sqlite'),
+                'CV_SESSION_PATH': os.path.join(run_dir, 'sessions.sqlite'),
+                'CV_CACHE_PATH': os.path.join(run_dir, 'cache.sqlite'),
+                'CV_METRICS_DIR': os.path.join(run_dir, 'metrics'),
+            }
+            if not cache:
+                # Every request is extracted and scored
+                env['CV_CACHE_BACKEND'] = 'none'
+            server = Server(workers, env, os.path.join(run_dir, 'gunicorn.log'))
+            print(f"  {workers} worker(s) on {server.url}...")
+            server.start()
+            try:
+                points = [(f"rate={rate:g}", 0, rate) for rate in rates] or \
+                         [(f"concurrency={c}", c, 0) for c in concurrencies]
+                for label, concurrency, rate in points:
+                    results[f"loadtest[n={size},workers={workers},{label}]"] = run_load_point(
+                        server, cvs, mix, duration, warmup, concurrency, rate, timeout, seed=size + workers)
+            finally:
+                server.stop()
+    return results
+
+
+def print_loadtest_results(results: dict):
+    print(f"{'load point':<46} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'worker MB':>9} {'total MB':>8}")
+    for name, stats in results.items():
+        if not stats["requests"]:
+            print(f"{name:<46} {'no requests':>7}")
+            continue
+        print(f"{name:<46} {stats['throughput_per_s']:>7.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {stats['error_rate']:>6.1%} {stats['max_worker_rss_mb']:>9.1f} "
+              f"{stats['total_rss_mb']:>8.1f}")
+        for endpoint, endpoint_stats in stats["endpoints"].items():
+            if endpoint_stats["requests"]:
+                print(f"  {endpoint:<44} {endpoint_stats['throughput_per_s']:>7.1f} {endpoint_stats['p50_ms']:>8.1f} "
+                      f"{endpoint_stats['p95_ms']:>8.1f} {endpoint_stats['p99_ms']:>8.1f} "
+                      f"{endpoint_stats['error_rate']:>6.1%}")
+
+
+def saturation_points(results: dict) -> dict:
+    """Load point with the highest throughput for every corpus size and worker count"""
+    best = {}
+    for name, stats in results.items():
+        group = name.rsplit(',', 1)[0] + ']'
+        if group not in best or stats["throughput_per_s"] > results[best[group]]["throughput_per_s"]:
+            best[group] = name
+    return best
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item]
+
+
+def _float_list(value: str):
+    return [float(item) for item in value.split(',') if item]
+
+
+def _mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(','):
+        endpoint, _, weight = item.partition('=')
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{endpoint}', use {', '.join(ENDPOINTS)}")
+        mix[endpoint] = float(weight or 1)
+    return {endpoint: weight for endpoint, weight in mix.items() if weight > 0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the app under the Procfile's gunicorn configuration.")
+    parser.add_argument('--sizes', type=_int_list, default=[10000], help="job corpus sizes")
+    parser.add_argument('--workers', type=_int_list, default=[1, 2, 4], help="gunicorn worker counts")
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16],
+                        help="concurrent clients per closed-loop load point")
+    parser.add_argument('--rates', type=_float_list, default=[],
+                        help="open-loop arrival rates in requests/s (replaces --concurrency)")
+    parser.add_argument('--mix', type=_mix, default=_mix(DEFAULT_MIX), help="endpoint weights")
+    parser.add_argument('--cvs', type=int, default=20, help="distinct synthetic CVs sent")
+    parser.add_argument('--pages', type=_int_list, default=[1, 2, 5], help="CV page counts")
+    parser.add_argument('--docx-share', type=float, default=0.3, help="share of the CVs that are DOCX files")
+    parser.add_argument('--duration', type=float, default=20, help="seconds measured per load point")
+    parser.add_argument('--warmup', type=float, default=3, help="seconds of discarded traffic before each load point")
+    parser.add_argument('--timeout', type=float, default=60, help="request timeout in seconds")
+    parser.add_argument('--cache', action='store_true', help="keep the analysis cache (off: every request is scored)")
+    parser.add_argument('--output', default='loadtest_results.json')
+    parser.add_argument('--baseline', default=None, help="compare the median latencies with a stored run")
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+    if not sys.platform.startswith('linux'):
+        parser.error("worker RSS is read from /proc: Linux only")
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+
+    cvs = make_cvs(args.cvs, args.pages, args.docx_share)
+    with tempfile.TemporaryDirectory(prefix='cv-loadtest-') as workdir:
+        results = run_loadtest(args.sizes, args.workers, args.concurrency, args.rates, args.mix, cvs,
+                               args.duration, args.warmup, args.timeout, args.cache, workdir)
+
+    save_json(args.output, {"environment": environment(), "args": vars(args), "results": results})
+    print_loadtest_results(results)
+    for group, name in saturation_points(results).items():
+        print(f"Highest throughput for {group}: {name} ({results[name]['throughput_per_s']:.1f} req/s)")
+    print(f"Results written to {args.output}")
+
+    regressed = False
+    if args.baseline and args.save_baseline:
+        save_json(args.baseline, {"environment": environment(), "args": vars(args), "results": results})
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline and os.path.exists(args.baseline):
+        measured = {name: stats for name, stats in results.items() if stats["requests"]}
+        rows = compare_to_baseline(measured, load_json(args.baseline)["results"])
+        print_comparison(rows)
+        regressed = any(row[4] for row in rows)
+    sys.exit(1 if regressed else 0)
@@ -0,0 +1,75 @@
+"""Benchmark statistics and comparison against a stored baseline."""
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+# A benchmark regresses when its median is this much slower than the baseline...
+DEFAULT_TOLERANCE = 0.2
+# ...and slower by at least this many milliseconds (timer noise on very fast calls)
+MIN_DELTA_MS = 0.05
+
+
+def summarize(durations, peak_alloc_mb=None, items_per_call: int = 1) -> dict:
+    """Latency percentiles (ms) and throughput (items/s) of a list of durations in seconds"""
+    ms = np.asarray(durations, dtype=np.float64) * 1000
+    total = float(ms.sum()) / 1000
+    return {
+        "calls": int(ms.shape[0]),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "throughput_per_s": ms.shape[0] * items_per_call / total if total else None,
+        "peak_alloc_mb": peak_alloc_mb,
+    }
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """One row per benchmark present in both runs: (name, baseline p50, current p50, ratio, regressed)"""
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else float('inf')
+        regressed = ratio > 1 + tolerance and current["p50_ms"] - previous["p50_ms"] > MIN_DELTA_MS
+        rows.append((name, previous["p50_ms"], current["p50_ms"], ratio, regressed))
+    return rows
+
+
+def print_results(results: dict):
+    print(f"{'benchmark':<48} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'peak MB':>8}")
+    for name, stats in results.items():
+        peak = f"{stats['peak_alloc_mb']:.1f}" if stats['peak_alloc_mb'] is not None else '-'
+        throughput = stats['throughput_per_s'] or 0
+        print(f"{name:<48} {stats['p50_ms']:>10.2f} {stats['p90_ms']:>10.2f} {stats['p99_ms']:>10.2f} "
+              f"{throughput:>10.1f} {peak:>8}")
+
+
+def print_comparison(rows):
+    print(f"{'benchmark':<48} {'base p50':>10} {'now p50':>10} {'ratio':>7}")
+    for name, before, after, ratio, regressed in rows:
+        print(f"{name:<48} {before:>10.2f} {after:>10.2f} {ratio:>7.2f}{'  REGRESSION' if regressed else ''}")
+
+
+def load_json(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
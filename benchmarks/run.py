@@ -0,0 +1,184 @@
+"""Benchmarks for preprocessing, PDF/DOCX extraction, vectorization, matching, match explanations, training and /api/analyze.
+
+Every run trains on synthetic job corpora of the requested sizes (written to
+a temporary directory, never to model/), then times each stage on its own and
+/api/analyze end to end through an in-process ASGI client (needs httpx).
+Results (latency percentiles, throughput, peak allocations) are written as
+JSON and compared against a stored baseline; the exit code is 1 when a
+benchmark regressed.
+
+Run from the repository root:
+    python -m benchmarks.run --sizes 1000,10000 --pages 1,5,20
+    python -m benchmarks.run --save-baseline      # store the results as the new baseline
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.report import (DEFAULT_TOLERANCE, compare_to_baseline, environment, load_json, print_comparison,
+                               print_results, save_json, summarize)
+from benchmarks.synthetic import make_cv_docx, make_cv_pdf, make_job_corpus
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def measure(fn, repeats: int, warmup: int = 1, memory: bool = True, items_per_call: int = 1) -> dict:
+    """Time `repeats` calls of fn; peak allocations come from one extra traced call"""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return summarize(durations, peak_mb, items_per_call)
+
+
+async def _measure_api(app, pdf: bytes, n_requests: int, concurrency: int) -> dict:
+    import httpx
+
+    durations = []
+    statuses = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze(client):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/analyze", files={"cvFile": ("cv.pdf", pdf, "application/pdf")})
+            durations.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            # Warm-up: starts the extraction processes
+            await analyze(client)
+            durations.clear()
+            statuses.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*[analyze(client) for _ in range(n_requests)])
+            wall = time.perf_counter() - start
+
+    stats = summarize(durations)
+    stats["throughput_per_s"] = n_requests / wall
+    stats["concurrency"] = concurrency
+    stats["errors"] = sum(1 for status in statuses if status != 200)
+    return stats
+
+
+def run_benchmarks(sizes, pages, repeats: int, api_requests: int, concurrency: int, workdir: str, memory: bool = True):
+    # The web layer is imported only once the first synthetic index exists
+    index_dir = os.path.join(workdir, 'index')
+    os.environ['CV_INDEX_DIR'] = index_dir
+    # Every request must really be extracted and scored
+    os.environ['CV_CACHE_BACKEND'] = 'none'
+    from model.train_model import TEXT_COLUMN_NAME, preprocess_text, train_tfidf_model
+
+    results = {}
+    texts = make_job_corpus(500, seed=1)[TEXT_COLUMN_NAME].tolist()
+    next_text = itertools.cycle(texts).__next__
+    results["preprocess_text"] = measure(lambda: preprocess_text(next_text()), repeats * 20, memory=memory)
+
+    utils = None
+    for size in sizes:
+        print(f"Corpus of {size} job ads...")
+        csv_path = os.path.join(workdir, f'job_ads_{size}.csv')
+        make_job_corpus(size, seed=size).to_csv(csv_path, index=False)
+
+        def train():
+            with contextlib.redirect_stdout(io.StringIO()):
+                train_tfidf_model(csv_path, TEXT_COLUMN_NAME, os.path.join(workdir, 'vectorizer.pkl'),
+                                  os.path.join(workdir, 'vectors.pkl'), index_dir=index_dir)
+        results[f"train_tfidf_model[n={size}]"] = measure(train, repeats=1, warmup=0, memory=memory)
+
+        if utils is None:
+            from web import utils
+            from web.extraction import extract_document
+        index = utils.index_registry.load()
+        cv_text = extract_document(make_cv_pdf(2, seed=size))
+        results[f"vectorizer.transform[n={size}]"] = measure(
+            lambda: index.vectorizer.transform([cv_text]), repeats, memory=memory)
+        for mode in utils.SEARCH_MODES:
+            results[f"find_top_matches[n={size},mode={mode}]"] = measure(
+                lambda: utils.find_top_matches(cv_text, 9, mode), repeats, memory=memory)
+        # Matched terms of the top 9 (?explain=true), the CV already vectorized
+        cv_vector = index.vectorizer.transform([cv_text])
+        top_rows = utils.rank_job_ads(cv_text, 9)[1].rows
+        results[f"explain_matches[n={size},k=9]"] = measure(
+            lambda: utils.explain_matches(index, cv_vector, top_rows), repeats * 20, memory=memory)
+
+        try:
+            from main import app
+            results[f"api_analyze[n={size},concurrency={concurrency}]"] = asyncio.run(
+                _measure_api(app, make_cv_pdf(2, seed=size), api_requests, concurrency))
+        except ImportError as e:
+            print(f"Skipping /api/analyze ({e}); install httpx to benchmark the HTTP endpoints.")
+
+    from web.extraction import PDF_MODES, extract_document_with_stats
+    for n_pages in pages:
+        pdf = make_cv_pdf(n_pages, seed=n_pages)
+        # The upload path per format, without the page and character caps
+        for pdf_mode in PDF_MODES:
+            results[f"extract_document[format=pdf,mode={pdf_mode},pages={n_pages}]"] = measure(
+                lambda: extract_document_with_stats(pdf, 0, 0, pdf_mode), max(3, repeats // n_pages), memory=memory)
+        docx = make_cv_docx(n_pages, seed=n_pages)
+        results[f"extract_document[format=docx,pages={n_pages}]"] = measure(
+            lambda: extract_document_with_stats(docx, 0, 0), repeats, memory=memory)
+    return results
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks.")
+    parser.add_argument('--sizes', type=_int_list, default=[1000, 10000], help="job corpus sizes, e.g. 1000,100000,1000000")
+    parser.add_argument('--pages', type=_int_list, default=[1, 5, 20], help="CV page counts for PDF extraction")
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--api-requests', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced peak-allocation runs")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown of the median before a benchmark counts as regressed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cv-benchmarks-') as workdir:
+        results = run_benchmarks(args.sizes, args.pages, args.repeats, args.api_requests, args.concurrency, workdir,
+                                 memory=not args.no_memory)
+
+    report = {"environment": environment(), "args": {k: v for k, v in vars(args).items()}, "results": results}
+    try:
+        import resource
+        report["environment"]["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass
+    save_json(args.output, report)
+    print_results(results)
+    print(f"Results written to {args.output}")
+
+    regressed = False
+    if args.save_baseline:
+        save_json(args.baseline, report)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        rows = compare_to_baseline(results, load_json(args.baseline)["results"], args.tolerance)
+        print_comparison(rows)
+        regressed = any(row[4] for row in rows)
+    sys.exit(1 if regressed else 0)
@@ -0,0 +1,107 @@
+"""Sharded exact search benchmark: latency against corpus size and thread count.
+
+A synthetic corpus is vectorized once (at most 100k job ads; larger corpora
+repeat its rows, which costs the scorer the same as new ads) and written as
+an index. Each synthetic CV is then searched with exact_search on one core
+and with sharded_search for every thread count (one shard per thread),
+checking that the sharded results are identical.
+
+Run from the repository root:
+    python -m benchmarks.sharded --sizes 100000,1000000 --threads 1,2,4,8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.report import environment, save_json, summarize
+from benchmarks.synthetic import make_cv_lines, make_job_corpus
+
+# Largest corpus actually vectorized; bigger sizes repeat its rows
+MAX_VECTORIZED = 100000
+
+
+def _timed(fn, queries, repeats: int):
+    durations = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run_sharded_benchmark(sizes, thread_counts, n_queries: int, k: int, repeats: int, precision: str,
+                          workdir: str) -> dict:
+    from scipy.sparse import vstack
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from model.index import VECTORIZER_PARAMS, encode_string_column, open_index, write_index_version
+    from model.preprocessing import preprocess_corpus
+    from model.train_model import VECTORIZER_OPTIONS
+    from web.retrieval import exact_search, sharded_search
+
+    results = {}
+    for size in sizes:
+        print(f"Corpus of {size} job ads...")
+        corpus = make_job_corpus(min(size, MAX_VECTORIZED), seed=size)
+        vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
+        matrix = vectorizer.fit_transform(preprocess_corpus(corpus['Description'].tolist()))
+        if size > matrix.shape[0]:
+            matrix = vstack([matrix] * -(-size // matrix.shape[0]), format='csr')[:size]
+        queries = vectorizer.transform(preprocess_corpus(
+            [" ".join(make_cv_lines(40, seed=size + q)) for q in range(n_queries)]))
+        queries = [queries[q] for q in range(n_queries)]
+        params = vectorizer.get_params()
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        columns = {'Company': encode_string_column([''] * size)}
+        index_dir = os.path.join(workdir, str(size))
+        write_index_version(index_dir, matrix, vectorizer.idf_, terms, columns,
+                            {name: params[name] for name in VECTORIZER_PARAMS}, precision=precision)
+        index = open_index(index_dir)
+        del matrix
+
+        reference = [exact_search(index, query, k) for query in queries]
+        stats = summarize(_timed(lambda query: exact_search(index, query, k), queries, repeats))
+        baseline_ms = stats["p50_ms"]
+        results[f"exact_search[n={size}]"] = {**stats, "speedup": 1.0, "identical": True}
+        for threads in thread_counts:
+            identical = all(
+                sharded_search(index, query, k, threads, threads).rows.tolist() == expected.rows.tolist()
+                for query, expected in zip(queries, reference))
+            stats = summarize(_timed(lambda query: sharded_search(index, query, k, threads, threads),
+                                     queries, repeats))
+            results[f"sharded_search[n={size},threads={threads}]"] = {
+                **stats, "speedup": baseline_ms / stats["p50_ms"], "identical": identical,
+            }
+    return results
+
+
+def print_sharded_results(results: dict):
+    print(f"{'benchmark':<42} {'p50 ms':>8} {'p99 ms':>8} {'speedup':>8} {'identical':>9}")
+    for name, stats in results.items():
+        print(f"{name:<42} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['speedup']:>7.2f}x "
+              f"{str(stats['identical']):>9}")
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item]
+
+
+if __name__ == "__main__":
+    from model.index import INDEX_PRECISION, PRECISIONS
+    parser = argparse.ArgumentParser(description="Latency of sharded exact search by corpus size and thread count.")
+    parser.add_argument('--sizes', type=_int_list, default=[100000, 1000000])
+    parser.add_argument('--threads', type=_int_list, default=[1, 2, 4, 8], help="thread counts (one shard per thread)")
+    parser.add_argument('--queries', type=int, default=30)
+    parser.add_argument('--k', type=int, default=9)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--precision', choices=PRECISIONS, default=INDEX_PRECISION)
+    parser.add_argument('--output', default='sharded_results.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cv-sharded-') as workdir:
+        results = run_sharded_benchmark(args.sizes, args.threads, args.queries, args.k, args.repeats,
+                                        args.precision, workdir)
+    save_json(args.output, {"environment": environment(), "args": vars(args), "results": results})
+    print_sharded_results(results)
+    print(f"Results written to {args.output}")
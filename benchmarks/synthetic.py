@@ -0,0 +1,105 @@
+"""Synthetic job corpora and CV PDFs/DOCX files for the benchmarks.
+
+Everything is generated from a seed, so two runs on the same machine
+benchmark exactly the same inputs.
+"""
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+SKILLS = (
+    "python java sql django flask react angular docker kubernetes aws azure linux git agile scrum marketing "
+    "sales finance accounting excel tableau spark hadoop kafka rust golang devops security network testing qa "
+    "selenium pandas numpy tensorflow pytorch nlp vision backend frontend fullstack mobile android ios swift "
+    "kotlin php laravel ruby rails dotnet csharp oracle postgres mongodb redis terraform ansible jenkins design "
+    "figma ux ui product manager analyst engineer data scientist consultant support"
+).split()
+FILLER = (
+    "we are looking for a candidate with experience in team work and strong skills to join our company "
+    "apply now full-time remote you will be responsible for in this role"
+).split()
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark", "Wayne", "Tyrell", "Soylent", "Cyberdyne"]
+ROLES = ["Backend Developer", "Data Scientist", "Frontend Engineer", "DevOps Engineer", "Product Manager", "QA Analyst"]
+SYLLABLES = "ka lo mi ne su ta ri po ve da zo fi gu he ja".split()
+
+
+def make_vocabulary(n_words: int = 20000, seed: int = 0):
+    """Skills, filler and pseudo-words, in decreasing order of frequency"""
+    rng = np.random.default_rng(seed)
+    pseudo = set()
+    while len(pseudo) < n_words:
+        pseudo.add(''.join(rng.choice(SYLLABLES, size=rng.integers(2, 5))))
+    return SKILLS + FILLER + sorted(pseudo)
+
+
+def make_job_corpus(n_ads: int, seed: int = 0, min_words: int = 20, max_words: int = 120) -> pd.DataFrame:
+    """DataFrame with the columns of model/job_ads.csv; word frequencies follow a Zipf law"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(seed=seed))
+    lengths = rng.integers(min_words, max_words + 1, size=n_ads)
+    words = vocabulary[np.minimum(rng.zipf(1.3, size=int(lengths.sum())) - 1, len(vocabulary) - 1)]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    return pd.DataFrame({
+        'Company': rng.choice(COMPANIES, size=n_ads),
+        'Role': rng.choice(ROLES, size=n_ads),
+        'Description': [' '.join(words[bounds[i]:bounds[i + 1]]) for i in range(n_ads)],
+        'Job Link': [f'https://jobs.example/{seed}/{i}' for i in range(n_ads)],
+    })
+
+
+def make_cv_lines(n_lines: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    words = np.array(SKILLS + FILLER)
+    return [' '.join(rng.choice(words, size=rng.integers(6, 12))) for _ in range(n_lines)]
+
+
+def make_cv_pdf(pages: int, seed: int = 0, lines_per_page: int = 45) -> bytes:
+    """Minimal text PDF (Helvetica, one content stream per page) that pdfminer can extract"""
+    lines = make_cv_lines(pages * lines_per_page, seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        text = b" ".join(b"(" + line.encode('latin-1') + b") '"
+                         for line in lines[page * lines_per_page:(page + 1) * lines_per_page])
+        stream = b"BT /F1 11 Tf 50 780 Td 14 TL " + text + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_cv_docx(pages: int, seed: int = 0, lines_per_page: int = 45) -> bytes:
+    """Minimal DOCX (one paragraph per line, a page break between pages) with the lines of make_cv_pdf"""
+    lines = make_cv_lines(pages * lines_per_page, seed)
+    paragraphs = []
+    for i, line in enumerate(lines):
+        page_break = '<w:r><w:br w:type="page"/></w:r>' if i and i % lines_per_page == 0 else ''
+        paragraphs.append(f'<w:p>{page_break}<w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>')
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+                + ''.join(paragraphs) + '</w:body></w:document>')
+    out = BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml',
+                         '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/'
+                         'package/2006/content-types"><Default Extension="xml" ContentType="application/xml"/>'
+                         '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-'
+                         'officedocument.wordprocessingml.document.main+xml"/></Types>')
+        archive.writestr('word/document.xml', document)
+    return out.getvalue()
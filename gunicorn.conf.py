@@ -0,0 +1,24 @@
+"""gunicorn settings shared by every deployment (the Procfile passes -c gunicorn.conf.py).
+
+Loaded by the master before any worker is forked, so the environment set
+here is inherited by all the workers.
+"""
+import os
+import tempfile
+
+# /api/metrics merges the snapshots of every worker found in this directory.
+# Without it each scrape would only see the counters of the worker answering.
+# Default: a directory of its own for this master process.
+# Set before importing web.*: web.metrics reads it at import time.
+os.environ.setdefault('CV_METRICS_DIR', os.path.join(tempfile.gettempdir(), f'cv-job-matching-metrics-{os.getpid()}'))
+
+from web.metrics import clear_snapshots  # noqa: E402
+
+
+def on_starting(server):
+    # Snapshots of the workers of a previous run would be summed with the new ones
+    clear_snapshots(os.environ['CV_METRICS_DIR'])
+
+
+def on_exit(server):
+    clear_snapshots(os.environ['CV_METRICS_DIR'])
@@ -1,11 +1,15 @@
 from fastapi import FastAPI
-from starlette.middleware.sessions import SessionMiddleware
-from web.api import router  
-import secrets
+from web.api import router, lifespan, metrics_middleware
+from web.sessions import ServerSessionMiddleware
+from web.uploads import UploadLimitMiddleware
 from fastapi.staticfiles import StaticFiles
 
-app = FastAPI()
-secret_key = secrets.token_urlsafe(32)
-app.add_middleware(SessionMiddleware, secret_key=secret_key)
+app = FastAPI(lifespan=lifespan)
+# Session data stays on the server (shared by the workers with CV_SESSION_BACKEND=sqlite),
+# the cookie only holds a random id: no secret key to keep in sync between workers
+app.add_middleware(ServerSessionMiddleware)
+app.middleware("http")(metrics_middleware)
+# Outermost: oversized uploads are refused before anything reads the body
+app.add_middleware(UploadLimitMiddleware)
 app.mount("/static", StaticFiles(directory="web/static"), name="static")
 app.include_router(router)
\ No newline at end of file
@@ -0,0 +1,297 @@
+"""Inverted indexes over the job metadata columns, used to filter before scoring.
+
+Company and Source match the whole value (case-insensitive), Role and
+Location match keywords (every word of the filter must appear), Posted At
+matches a date range. Every facet maps a term to the sorted list of rows
+that have it, so a filter costs O(rows matched), not O(corpus), and only the
+matching rows are scored.
+
+write_facets_sharded builds the same files from rows split into shards,
+one shard in memory at a time (model/train_streaming.py).
+
+On disk, in the facets/ directory of an index version:
+    <facet>.terms.json, <facet>.indptr.npy, <facet>.rows.npy   term -> rows
+    posted_at.days.npy, posted_at.rows.npy                      rows sorted by date
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import date
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# column -> how it is matched
+FACETS = {'Company': 'value', 'Source': 'value', 'Role': 'keywords', 'Location': 'keywords', 'Posted At': 'date'}
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize_value(value) -> str:
+    return ' '.join(str(value).casefold().split())
+
+
+def keywords(value):
+    return set(_WORD_RE.findall(str(value).casefold()))
+
+
+def parse_date(value):
+    """Day number (date.toordinal) of an ISO date or datetime string, None if it is not one"""
+    try:
+        return date.fromisoformat(str(value).strip()[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def _slug(column: str) -> str:
+    return column.lower().replace(' ', '_')
+
+
+@dataclass(frozen=True)
+class JobFilters:
+    """Structured filters of an analysis; empty fields do not filter"""
+    company: tuple = ()
+    role: str = ''
+    source: tuple = ()
+    location: str = ''
+    posted_after: str = ''
+    posted_before: str = ''
+
+    def __post_init__(self):
+        for name in ('posted_after', 'posted_before'):
+            if getattr(self, name) and parse_date(getattr(self, name)) is None:
+                raise ValueError(f"Invalid date for {name}: use YYYY-MM-DD.")
+
+    def __bool__(self):
+        return any(asdict(self).values())
+
+    def cache_key(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True) if self else ''
+
+
+class TermIndex:
+    """term -> sorted rows"""
+
+    def __init__(self, terms, indptr, rows):
+        self._lookup = {term: i for i, term in enumerate(terms)}
+        self._indptr = indptr
+        self._rows = rows
+
+    def rows_for(self, term: str):
+        i = self._lookup.get(term)
+        if i is None:
+            return np.empty(0, dtype=np.int32)
+        return self._rows[self._indptr[i]:self._indptr[i + 1]]
+
+
+class DateIndex:
+    """Rows sorted by posting date (rows without a date are left out)"""
+
+    def __init__(self, days, rows):
+        self._days = days
+        self._rows = rows
+
+    def rows_between(self, after: str = '', before: str = ''):
+        start = np.searchsorted(self._days, parse_date(after), side='left') if after else 0
+        end = np.searchsorted(self._days, parse_date(before), side='right') if before else len(self._days)
+        return np.sort(self._rows[start:end])
+
+
+def build_term_index(values, kind: str):
+    """(terms, indptr, rows) for one column; rows of a term are in increasing order"""
+    term_rows = defaultdict(list)
+    for row, value in enumerate(values):
+        terms = keywords(value) if kind == 'keywords' else (normalize_value(value),)
+        for term in terms:
+            if term:
+                term_rows[term].append(row)
+    terms = sorted(term_rows)
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(term_rows[term]) for term in terms], out=indptr[1:])
+    rows = np.fromiter((row for term in terms for row in term_rows[term]), dtype=np.int32, count=int(indptr[-1]))
+    return terms, indptr, rows
+
+
+def build_date_index(values):
+    """(days, rows): dated rows ordered by day, ties by row"""
+    days = np.array([parse_date(value) if value else None for value in values], dtype=object)
+    dated = np.flatnonzero(days != None)  # noqa: E711 (element-wise comparison)
+    day_numbers = days[dated].astype(np.int64)
+    order = np.lexsort((dated, day_numbers))
+    return day_numbers[order].astype(np.int32), dated[order].astype(np.int32)
+
+
+def write_facets(directory: str, columns):
+    """Build and save the facet indexes of every facet column present. columns maps name -> list of strings."""
+    os.makedirs(directory, exist_ok=True)
+    for name, kind in FACETS.items():
+        if name not in columns:
+            continue
+        slug = _slug(name)
+        if kind == 'date':
+            days, rows = build_date_index(columns[name])
+            np.save(os.path.join(directory, f'{slug}.days.npy'), days)
+            np.save(os.path.join(directory, f'{slug}.rows.npy'), rows)
+            continue
+        _save_term_index(directory, slug, *build_term_index(columns[name], kind))
+
+
+def _save_term_index(directory: str, slug: str, terms, indptr, rows):
+    with open(os.path.join(directory, f'{slug}.terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+    np.save(os.path.join(directory, f'{slug}.indptr.npy'), indptr)
+    np.save(os.path.join(directory, f'{slug}.rows.npy'), rows)
+
+
+def _load_term_index(directory: str, slug: str, mmap_mode=None):
+    with open(os.path.join(directory, f'{slug}.terms.json'), 'r', encoding='utf-8') as f:
+        terms = json.load(f)
+    return (terms, np.load(os.path.join(directory, f'{slug}.indptr.npy')),
+            np.load(os.path.join(directory, f'{slug}.rows.npy'), mmap_mode=mmap_mode))
+
+
+def write_facets_sharded(directory: str, n_shards: int, load_columns, work_dir: str):
+    """write_facets for rows split into shards, holding one shard's columns at a time.
+
+    load_columns(shard) returns the shard's {name: list of strings}. The facets
+    of every shard are written to work_dir, then merged term by term into the
+    final files, which are identical to those of write_facets on all the rows.
+    """
+    os.makedirs(directory, exist_ok=True)
+    names, shard_rows = None, []
+    for shard in range(n_shards):
+        columns = load_columns(shard)
+        names = [name for name in FACETS if name in columns]
+        shard_dir = os.path.join(work_dir, str(shard))
+        os.makedirs(shard_dir, exist_ok=True)
+        shard_rows.append(len(next(iter(columns.values()))) if columns else 0)
+        for name in names:
+            if FACETS[name] == 'date':
+                days, rows = build_date_index(columns[name])
+                np.save(os.path.join(shard_dir, f'{_slug(name)}.days.npy'), days)
+                np.save(os.path.join(shard_dir, f'{_slug(name)}.rows.npy'), rows)
+            else:
+                _save_term_index(shard_dir, _slug(name), *build_term_index(columns[name], FACETS[name]))
+        del columns
+    offsets = np.concatenate([[0], np.cumsum(shard_rows)]).astype(np.int64)
+    shard_dirs = [os.path.join(work_dir, str(shard)) for shard in range(n_shards)]
+
+    for name in names or ():
+        slug = _slug(name)
+        if FACETS[name] == 'date':
+            # One day and one row number per dated row
+            days = np.concatenate([np.load(os.path.join(d, f'{slug}.days.npy')) for d in shard_dirs])
+            rows = np.concatenate([np.load(os.path.join(d, f'{slug}.rows.npy')).astype(np.int64) + offsets[shard]
+                                   for shard, d in enumerate(shard_dirs)])
+            order = np.lexsort((rows, days))
+            np.save(os.path.join(directory, f'{slug}.days.npy'), days[order])
+            np.save(os.path.join(directory, f'{slug}.rows.npy'), rows[order].astype(np.int32))
+            continue
+        terms = sorted(set().union(*(_load_term_index(d, slug)[0] for d in shard_dirs)))
+        lookup = {term: i for i, term in enumerate(terms)}
+        counts = np.zeros(len(terms), dtype=np.int64)
+        for d in shard_dirs:
+            shard_terms, shard_indptr, _ = _load_term_index(d, slug)
+            counts[[lookup[term] for term in shard_terms]] += np.diff(shard_indptr)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        rows = open_memmap(os.path.join(directory, f'{slug}.rows.npy'), mode='w+', dtype=np.int32,
+                           shape=(int(indptr[-1]),))
+        # Shards in row order: appending each shard's rows to its terms keeps every list sorted
+        cursor = indptr[:-1].copy()
+        for shard, d in enumerate(shard_dirs):
+            shard_terms, shard_indptr, shard_rows_of = _load_term_index(d, slug, mmap_mode='r')
+            ids = np.array([lookup[term] for term in shard_terms], dtype=np.int64)
+            shard_counts = np.diff(shard_indptr)
+            positions = (np.repeat(cursor[ids] - shard_indptr[:-1], shard_counts)
+                         + np.arange(shard_indptr[-1], dtype=np.int64))
+            rows[positions] = shard_rows_of + offsets[shard]
+            cursor[ids] += shard_counts
+        rows.flush()
+        del rows
+        with open(os.path.join(directory, f'{slug}.terms.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, f'{slug}.indptr.npy'), indptr)
+
+
+class FacetIndex:
+    """All facet indexes of one index version"""
+
+    def __init__(self, indexes: dict):
+        self.indexes = indexes  # column name -> TermIndex or DateIndex
+
+    @classmethod
+    def load(cls, directory: str):
+        indexes = {}
+        for name, kind in FACETS.items():
+            slug = _slug(name)
+            rows_path = os.path.join(directory, f'{slug}.rows.npy')
+            if not os.path.exists(rows_path):
+                continue
+            rows = np.load(rows_path, mmap_mode='r')
+            if kind == 'date':
+                indexes[name] = DateIndex(np.load(os.path.join(directory, f'{slug}.days.npy'), mmap_mode='r'), rows)
+                continue
+            with open(os.path.join(directory, f'{slug}.terms.json'), 'r', encoding='utf-8') as f:
+                terms = json.load(f)
+            indexes[name] = TermIndex(terms, np.load(os.path.join(directory, f'{slug}.indptr.npy')), rows)
+        return cls(indexes)
+
+    @classmethod
+    def build(cls, columns):
+        """In-memory facets, for index versions written before facets existed"""
+        indexes = {}
+        for name, kind in FACETS.items():
+            if name not in columns:
+                continue
+            if kind == 'date':
+                indexes[name] = DateIndex(*build_date_index(columns[name]))
+            else:
+                indexes[name] = TermIndex(*build_term_index(columns[name], kind))
+        return cls(indexes)
+
+    def _index(self, column: str):
+        index = self.indexes.get(column)
+        if index is None:
+            raise ValueError(f"The job index has no '{column}' column to filter on.")
+        return index
+
+    def check(self, filters: JobFilters):
+        """Raise ValueError if a filter needs a column this index does not have"""
+        used = {'Company': filters.company, 'Source': filters.source, 'Role': filters.role,
+                'Location': filters.location, 'Posted At': filters.posted_after or filters.posted_before}
+        for column, value in used.items():
+            if value:
+                self._index(column)
+
+    def candidate_rows(self, filters: JobFilters):
+        """Sorted rows that pass every filter, or None when there is nothing to filter"""
+        if not filters:
+            return None
+        self.check(filters)
+        row_sets = []
+        for column, values in (('Company', filters.company), ('Source', filters.source)):
+            if values:
+                # any of the given values
+                index = self.indexes[column]
+                row_sets.append(np.unique(np.concatenate([index.rows_for(normalize_value(v)) for v in values])))
+        for column, text in (('Role', filters.role), ('Location', filters.location)):
+            if text:
+                # every keyword
+                row_sets.extend(self.indexes[column].rows_for(word) for word in keywords(text))
+        if filters.posted_after or filters.posted_before:
+            row_sets.append(self.indexes['Posted At'].rows_between(filters.posted_after, filters.posted_before))
+
+        if not row_sets:
+            # e.g. a role made only of punctuation
+            return np.empty(0, dtype=np.int64)
+        # Intersect starting from the smallest set
+        row_sets.sort(key=len)
+        rows = np.asarray(row_sets[0], dtype=np.int64)
+        for other in row_sets[1:]:
+            if rows.shape[0] == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
@@ -0,0 +1,732 @@
+"""On-disk job index shared by all web workers.
+
+Every artifact is stored as a flat file that can be memory-mapped read-only,
+so all gunicorn workers share one page-cache copy instead of unpickling their
+own. Layout of an index directory:
+
+    model/index/
+        CURRENT                 name of the version served by the web layer
+        <version>/
+            meta.json           shape, vectorizer parameters, column names, precision,
+                                write sequence (orders the versions when pruning)
+            data.npy            CSR data of the TF-IDF matrix: float64, float32, or
+                                uint16/uint8 codes times meta 'weight_scale'
+            indices.npy         CSR column indices
+            indptr.npy          CSR row pointers
+            idf.npy             IDF vector of the vectorizer
+            terms.json          vocabulary, ordered by feature index
+            postings_*.npy      inverted index: per-term posting lists sorted
+                                by weight, plus the max weight of every term
+            tombstones.npy      optional, True for expired rows (never matched)
+            minhash.npy         optional, MinHash signature of every row's description
+                                (near-duplicate detection on ingest)
+            dense.npy           optional, float32 low-dimensional projection of every row
+                                (approximate search mode, model/projection.py)
+            projection.npy      optional, projection matrix applied to the queries
+            columns/<n>.bin.npy       UTF-8 bytes of display column n, concatenated
+            columns/<n>.offsets.npy   row offsets into <n>.bin.npy
+            facets/             inverted indexes over the metadata columns,
+                                used to filter before scoring (model/facets.py)
+
+The rows are L2-normalized (the vectorizer's norm), so the cosine similarity
+with a normalized query is a plain dot product. A compact precision stores
+them as float32 or as 8/16-bit codes with one scale for the whole matrix, and
+weights below min_weight can be dropped (the rows are then renormalized).
+
+Each training run writes a new version directory and then switches CURRENT
+atomically, so files that running workers have mapped are never overwritten.
+write_index_version_sharded writes the same files from row shards, one shard
+in memory at a time, for the out-of-core trainer (model/train_streaming.py).
+"""
+import json
+import os
+import pickle
+import secrets
+import shutil
+import sys
+import time
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy.sparse import csr_matrix, vstack as sp_vstack
+
+from model.facets import FACETS, FacetIndex, write_facets, write_facets_sharded
+from model.projection import INDEX_DENSE_DIMS, INDEX_DENSE_METHOD, fit_projection, project_rows, svd_sample_rows
+
+INDEX_DIR = 'model/index'
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+POSTINGS_FILES = ['postings_indptr', 'postings_docs', 'postings_weights', 'term_max']
+# How the weights are stored: full precision, float32, or quantized to 16/8-bit codes
+PRECISIONS = ('float64', 'float32', 'uint16', 'uint8')
+# Defaults for newly trained versions (ingest keeps the precision of the version it extends)
+INDEX_PRECISION = os.environ.get('CV_INDEX_PRECISION', 'float64')
+INDEX_MIN_WEIGHT = float(os.environ.get('CV_INDEX_MIN_WEIGHT', '0'))
+
+# Columns returned to the client for every matched job ad
+DISPLAY_COLUMNS = ['Company', 'Role', 'Description', 'Job Link']
+# Optional columns, stored when the job ads have them, that can be filtered on
+METADATA_COLUMNS = ['Source', 'Location', 'Posted At']
+# Size of the cluster of near-identical ads a row stands for (model/near_duplicates.py),
+# returned with the display columns as an int
+DUPLICATE_COUNT_COLUMN = 'Duplicate Count'
+
+# TfidfVectorizer parameters needed to rebuild an identical query vectorizer
+VECTORIZER_PARAMS = [
+    'analyzer', 'binary', 'lowercase', 'max_df', 'min_df', 'ngram_range', 'norm',
+    'smooth_idf', 'stop_words', 'strip_accents', 'sublinear_tf', 'token_pattern', 'use_idf',
+]
+
+
+class StringColumn:
+    """Read-only string column backed by a memory-mapped UTF-8 blob and row offsets"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+class JobIndex:
+    """A single, read-only version of the job index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format {self.meta.get('format')} in '{path}'")
+        self.version = self.meta['version']
+
+        data = np.load(os.path.join(path, 'data.npy'), mmap_mode='r')
+        indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode='r')
+        indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+        # Stored weights: for a quantized index, codes to multiply by weight_scale
+        self.matrix = csr_matrix((data, indices, indptr), shape=tuple(self.meta['shape']), copy=False)
+        self.precision = self.meta.get('precision', 'float64')
+        self.weight_scale = self.meta.get('weight_scale', 1.0)
+        # Scores are computed in float32 for every compact precision
+        self.score_dtype = np.float64 if self.precision == 'float64' else np.float32
+        # Unit-length rows: scoring is a dot product, no per-request normalization
+        self.normalized = self.meta.get('normalized', self.meta['vectorizer'].get('norm') == 'l2')
+
+        self.idf = np.load(os.path.join(path, 'idf.npy'))
+        with open(os.path.join(path, 'terms.json'), 'r', encoding='utf-8') as f:
+            self.terms = json.load(f)
+
+        self.columns = {}
+        for i, name in enumerate(self.meta['columns']):
+            blob = np.load(os.path.join(path, 'columns', f'{i}.bin.npy'), mmap_mode='r')
+            offsets = np.load(os.path.join(path, 'columns', f'{i}.offsets.npy'), mmap_mode='r')
+            self.columns[name] = StringColumn(blob, offsets)
+        # Returned for every match: all but the metadata columns, which are only there to filter on
+        self.record_columns = [name for name in self.columns if name not in METADATA_COLUMNS]
+
+        signatures_path = os.path.join(path, 'minhash.npy')
+        self.signatures = np.load(signatures_path, mmap_mode='r') if os.path.exists(signatures_path) else None
+
+        # Dense vectors and query projection of the approximate search mode (None when not built)
+        self.dense, self.projection = None, None
+        if os.path.exists(os.path.join(path, 'dense.npy')):
+            self.dense = np.load(os.path.join(path, 'dense.npy'), mmap_mode='r')
+            self.projection = np.load(os.path.join(path, 'projection.npy'), mmap_mode='r')
+
+        tombstones_path = os.path.join(path, 'tombstones.npy')
+        self.tombstones = np.load(tombstones_path) if os.path.exists(tombstones_path) else None
+        # Rows that can be returned (not tombstoned)
+        self.n_live = self.n_rows - (int(np.count_nonzero(self.tombstones)) if self.tombstones is not None else 0)
+
+        self._vectorizer = None
+        self._term_array = None
+        self._postings = None
+        self._facets = None
+        # Map the postings now: a pruned old version must stay usable by in-flight requests
+        paths = [os.path.join(path, f'{name}.npy') for name in POSTINGS_FILES]
+        if all(os.path.exists(p) for p in paths):
+            self._postings = tuple(np.load(p, mmap_mode='r') for p in paths)
+
+    @property
+    def n_rows(self) -> int:
+        return self.matrix.shape[0]
+
+    def float_matrix(self):
+        """The TF-IDF weights as a float64 CSR matrix (a copy for a compact index)"""
+        if self.precision == 'float64':
+            return self.matrix
+        return decode_matrix(self.matrix, self.weight_scale, np.float64)
+
+    @property
+    def vectorizer(self):
+        """TfidfVectorizer rebuilt from the stored vocabulary and IDF, no refit needed"""
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            params = dict(self.meta['vectorizer'])
+            params['ngram_range'] = tuple(params['ngram_range'])
+            vectorizer = TfidfVectorizer(vocabulary={term: i for i, term in enumerate(self.terms)}, **params)
+            vectorizer.idf_ = self.idf
+            self._vectorizer = vectorizer
+        return self._vectorizer
+
+    @property
+    def term_array(self):
+        """Terms as an array indexed by feature, for looking up many feature indices at once"""
+        if self._term_array is None:
+            self._term_array = np.array(self.terms, dtype=object)
+        return self._term_array
+
+    @property
+    def postings(self):
+        """Inverted index (indptr, docs, weights, term_max).
+
+        Versions written before the inverted index existed get it built in memory.
+        """
+        if self._postings is None:
+            self._postings = build_postings(decode_matrix(self.matrix, self.weight_scale, self.score_dtype))
+        return self._postings
+
+    @property
+    def facets(self) -> FacetIndex:
+        """Metadata filters. Versions written before facets existed get them built in memory."""
+        if self._facets is None:
+            path = os.path.join(self.path, 'facets')
+            if os.path.isdir(path):
+                self._facets = FacetIndex.load(path)
+            else:
+                self._facets = FacetIndex.build({name: list(column) for name, column in self.columns.items()})
+        return self._facets
+
+    def record(self, row: int) -> dict:
+        """Display columns of one job ad, with its Duplicate Count when the index has one"""
+        record = {name: self.columns[name][row] for name in self.record_columns}
+        if DUPLICATE_COUNT_COLUMN in record:
+            record[DUPLICATE_COUNT_COLUMN] = int(record[DUPLICATE_COUNT_COLUMN] or 1)
+        return record
+
+
+def build_postings(matrix):
+    """Build per-term posting lists from a CSR matrix.
+
+    Returns (indptr, docs, weights, term_max): the postings of term t are
+    docs[indptr[t]:indptr[t+1]], sorted by decreasing weight (ties by row), and
+    term_max[t] is the largest weight of term t in any document.
+    """
+    csc = csr_matrix(matrix).tocsc()
+    terms = np.repeat(np.arange(csc.shape[1]), np.diff(csc.indptr))
+    order = np.lexsort((csc.indices, -csc.data, terms))
+    docs = csc.indices[order].astype(np.int32)
+    weights = csc.data[order]
+    indptr = csc.indptr.astype(np.int64)
+    term_max = np.zeros(csc.shape[1], dtype=weights.dtype)
+    non_empty = indptr[:-1] < indptr[1:]
+    term_max[non_empty] = weights[indptr[:-1][non_empty]]
+    return indptr, docs, weights, term_max
+
+
+def compact_matrix(matrix, precision: str = 'float64', min_weight: float = 0.0, normalized: bool = True,
+                   scale: float = None):
+    """Stored form of a TF-IDF matrix: (CSR matrix, weight scale).
+
+    Weights below min_weight are dropped and, for an L2-normalized matrix, the
+    rows renormalized. float32 halves the data; uint16/uint8 store
+    round(weight / scale) with scale = max weight / max code, never rounding a
+    kept weight down to 0. A given scale encodes the rows with the codes of an
+    existing version (see quantization_fits). Column indices are stored as int32.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Expected one of {', '.join(PRECISIONS)}.")
+    matrix = csr_matrix(matrix, dtype=np.float64)
+    # Never modify the caller's arrays: the stored matrix may share its indices
+    if not matrix.has_sorted_indices:
+        matrix = matrix.sorted_indices()
+    if min_weight > 0:
+        matrix = matrix.copy()
+        matrix.data[matrix.data < min_weight] = 0
+        matrix.eliminate_zeros()
+        if normalized:
+            norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+    indices = matrix.indices.astype(np.int32, copy=False)
+    if precision in ('float64', 'float32'):
+        data = matrix.data.astype(precision)
+        scale = 1.0
+    else:
+        max_code = np.iinfo(precision).max
+        if scale is None:
+            scale = float(matrix.data.max()) / max_code if matrix.nnz else 1.0
+        data = np.clip(np.rint(matrix.data / scale), 1, max_code).astype(precision)
+    return csr_matrix((data, indices, matrix.indptr), shape=matrix.shape), scale
+
+
+def quantization_fits(matrix, precision: str, scale: float) -> bool:
+    """Whether every weight of matrix can be stored as a code of the given scale without clipping"""
+    if precision in ('float64', 'float32') or not matrix.nnz:
+        return True
+    return float(matrix.data.max()) <= scale * (np.iinfo(precision).max + 0.5)
+
+
+def decode_matrix(matrix, scale: float, dtype=np.float64):
+    """Weights of a stored matrix in the given float dtype (the matrix itself when nothing changes)"""
+    if matrix.dtype == dtype and scale == 1.0:
+        return matrix
+    data = np.asarray(matrix.data, dtype=dtype)
+    if scale != 1.0:
+        data = data * dtype(scale)
+    return csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _new_version() -> str:
+    return time.strftime('%Y%m%dT%H%M%S') + '-' + secrets.token_hex(3)
+
+
+def encode_string_column(values):
+    """Encode strings as (UTF-8 blob, row offsets); missing values become ''"""
+    encoded = [('' if v is None or v != v else str(v)).encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def append_string_column(column: StringColumn, values):
+    """Existing column plus new values, without decoding the existing rows"""
+    blob, offsets = encode_string_column(values)
+    old_offsets = np.asarray(column._offsets)
+    return (
+        np.concatenate([np.asarray(column._blob), blob]),
+        np.concatenate([old_offsets, old_offsets[-1] + offsets[1:]]),
+    )
+
+
+def current_version(index_dir: str = INDEX_DIR):
+    """Name of the version CURRENT points to, or None if no index was written yet"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current_version(index_dir: str, version: str):
+    """Atomically point CURRENT to the given version"""
+    tmp_path = os.path.join(index_dir, f'{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(index_dir, CURRENT_FILE))
+
+
+def write_index_version(index_dir: str, matrix, idf, terms, columns, vectorizer_params, tombstones=None,
+                        signatures=None, extra_meta=None, keep: int = 3, precision: str = INDEX_PRECISION,
+                        min_weight: float = INDEX_MIN_WEIGHT, dense_dims: int = INDEX_DENSE_DIMS,
+                        dense_method: str = INDEX_DENSE_METHOD, projection=None, weight_scale: float = None) -> str:
+    """Write a new index version from its parts and make it the current one.
+
+    columns maps each display column name to its (blob, offsets) encoding;
+    the facet indexes are built from them. precision and min_weight select
+    the stored form of the matrix (see compact_matrix); with weight_scale the
+    matrix is already in that stored form, with that scale, and is written as
+    it is (model/ingest.py appending rows to a version). Dense vectors for the
+    approximate search mode are written with the given projection, or with
+    one fitted on the matrix when dense_dims > 0. Returns the version name.
+    """
+    for name, (_, offsets) in columns.items():
+        if len(offsets) - 1 != matrix.shape[0]:
+            raise ValueError(f"Column '{name}' has {len(offsets) - 1} rows but the matrix has {matrix.shape[0]}.")
+    if signatures is not None and len(signatures) != matrix.shape[0]:
+        raise ValueError(f"There are {len(signatures)} signatures but the matrix has {matrix.shape[0]} rows.")
+    version = _new_version()
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_dir = os.path.join(index_dir, f'.{version}.tmp')
+    os.makedirs(os.path.join(tmp_dir, 'columns'))
+
+    normalized = vectorizer_params.get('norm') == 'l2'
+    if weight_scale is None:
+        matrix, scale = compact_matrix(matrix, precision, min_weight, normalized)
+    else:
+        matrix, scale = csr_matrix(matrix), weight_scale
+        matrix.indices = matrix.indices.astype(np.int32, copy=False)
+    np.save(os.path.join(tmp_dir, 'data.npy'), matrix.data)
+    np.save(os.path.join(tmp_dir, 'indices.npy'), matrix.indices)
+    np.save(os.path.join(tmp_dir, 'indptr.npy'), matrix.indptr)
+    np.save(os.path.join(tmp_dir, 'idf.npy'), np.asarray(idf))
+    # Posting weights are the values the scorer sees, so pruning bounds hold
+    score_dtype = np.float64 if precision == 'float64' else np.float32
+    scored = decode_matrix(matrix, scale, score_dtype)
+    for name, array in zip(POSTINGS_FILES, build_postings(scored)):
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+    # Dense vectors of the weights the exact scorer sees, so a re-rank agrees with them
+    if projection is None and dense_dims > 0:
+        projection = fit_projection(scored, dense_dims, dense_method)
+    if projection is not None:
+        projection = np.asarray(projection, dtype=np.float32)
+        np.save(os.path.join(tmp_dir, 'dense.npy'), project_rows(scored, projection))
+        np.save(os.path.join(tmp_dir, 'projection.npy'), projection)
+    if tombstones is not None and np.any(tombstones):
+        np.save(os.path.join(tmp_dir, 'tombstones.npy'), np.asarray(tombstones, dtype=bool))
+    if signatures is not None:
+        np.save(os.path.join(tmp_dir, 'minhash.npy'), np.asarray(signatures, dtype=np.uint32))
+
+    with open(os.path.join(tmp_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(list(terms), f, ensure_ascii=False)
+
+    for i, (blob, offsets) in enumerate(columns.values()):
+        np.save(os.path.join(tmp_dir, 'columns', f'{i}.bin.npy'), blob)
+        np.save(os.path.join(tmp_dir, 'columns', f'{i}.offsets.npy'), offsets)
+    write_facets(os.path.join(tmp_dir, 'facets'), {
+        name: list(StringColumn(blob, offsets)) for name, (blob, offsets) in columns.items()
+    })
+
+    _commit_version(index_dir, tmp_dir, version, {
+        'shape': list(matrix.shape),
+        'nnz': int(matrix.nnz),
+        'precision': precision,
+        'weight_scale': scale,
+        'min_weight': min_weight,
+        'normalized': normalized,
+        'dense': {'method': dense_method, 'dims': int(projection.shape[1])} if projection is not None else None,
+        'columns': list(columns),
+        'vectorizer': vectorizer_params,
+    }, extra_meta, keep)
+    return version
+
+
+def _commit_version(index_dir: str, tmp_dir: str, version: str, meta: dict, extra_meta, keep: int):
+    """Write meta.json, move the finished version in place and make it the current one"""
+    now = time.time()
+    meta = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        # Orders the versions for prune_versions, whatever their names
+        'sequence': max((m.get('sequence', 0) for m in _version_metas(index_dir).values()), default=0) + 1,
+        'created_at': now,
+        'idf_computed_at': now,
+        **meta,
+    }
+    meta.update(extra_meta or {})
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    os.replace(tmp_dir, os.path.join(index_dir, version))
+    set_current_version(index_dir, version)
+    prune_versions(index_dir, keep=keep)
+
+
+def _merge_postings(tmp_dir: str, shard_postings, row_offsets, n_features: int, score_dtype, block: int):
+    """Write the postings of the whole matrix from the postings of its row shards.
+
+    Every shard's postings are already in the final order (term, decreasing
+    weight, row), so the files are a k-way merge of the shards, done with
+    about `block` postings in memory: each round reads the next block / k
+    postings of every shard and writes those that sort before the last one
+    read from a shard that is not exhausted. The files are identical to
+    build_postings on the assembled matrix.
+    """
+    counts = np.zeros(n_features, dtype=np.int64)
+    term_max = np.zeros(n_features, dtype=score_dtype)
+    for shard_indptr, _, _, shard_max in shard_postings:
+        counts += np.diff(shard_indptr)
+        np.maximum(term_max, shard_max, out=term_max)
+    indptr = np.zeros(n_features + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    total = int(indptr[-1])
+    docs = open_memmap(os.path.join(tmp_dir, 'postings_docs.npy'), mode='w+', dtype=np.int32, shape=(total,))
+    weights = open_memmap(os.path.join(tmp_dir, 'postings_weights.npy'), mode='w+', dtype=score_dtype, shape=(total,))
+
+    step = max(1, block // max(1, len(shard_postings)))
+    positions = [0] * len(shard_postings)
+    written = 0
+    while written < total:
+        parts, cutoff = [], None
+        for shard, (shard_indptr, shard_docs, shard_weights, _) in enumerate(shard_postings):
+            first = positions[shard]
+            last = min(first + step, int(shard_indptr[-1]))
+            part_terms = np.searchsorted(shard_indptr, np.arange(first, last), side='right') - 1
+            part = (part_terms, -shard_weights[first:last], shard_docs[first:last].astype(np.int64) + row_offsets[shard])
+            parts.append(part)
+            if last < shard_indptr[-1]:
+                # Postings of this shard not read yet sort after its last one read
+                key = tuple(column[-1] for column in part)
+                cutoff = key if cutoff is None or key < cutoff else cutoff
+        merged = [np.concatenate(columns) for columns in zip(*parts)]
+        if cutoff is not None:
+            terms_, neg_weights, rows = merged
+            ready = ((terms_ < cutoff[0]) | ((terms_ == cutoff[0]) & (neg_weights < cutoff[1]))
+                     | ((terms_ == cutoff[0]) & (neg_weights == cutoff[1]) & (rows <= cutoff[2])))
+            start = 0
+            for shard, part in enumerate(parts):
+                positions[shard] += int(np.count_nonzero(ready[start:start + len(part[0])]))
+                start += len(part[0])
+            merged = [column[ready] for column in merged]
+        else:
+            positions = [int(shard_indptr[-1]) for shard_indptr, _, _, _ in shard_postings]
+        terms_, neg_weights, rows = merged
+        order = np.lexsort((rows, neg_weights, terms_))
+        docs[written:written + len(order)] = rows[order]
+        weights[written:written + len(order)] = -neg_weights[order]
+        written += len(order)
+    docs.flush()
+    weights.flush()
+    np.save(os.path.join(tmp_dir, 'postings_indptr.npy'), indptr)
+    np.save(os.path.join(tmp_dir, 'term_max.npy'), term_max)
+
+
+def write_index_version_sharded(index_dir: str, n_shards: int, load_shard, n_features: int, idf, terms, column_names,
+                                vectorizer_params, extra_meta=None, keep: int = 3, precision: str = INDEX_PRECISION,
+                                min_weight: float = INDEX_MIN_WEIGHT, dense_dims: int = INDEX_DENSE_DIMS,
+                                dense_method: str = INDEX_DENSE_METHOD) -> str:
+    """write_index_version for a matrix split into row shards, holding one shard in memory at a time.
+
+    load_shard(shard) returns (CSR rows of the shard, {column name: (blob,
+    offsets)} of its rows, MinHash signatures of its rows or None). The
+    stored matrix, postings, dense vectors, columns and facets are built
+    shard by shard and merged into memory-mapped files; the files are the
+    same as those write_index_version writes for the assembled matrix. Only
+    arrays with a few bytes per row (row pointers, column offsets, dates)
+    span the whole corpus. Returns the version name.
+    """
+    version = _new_version()
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_dir = os.path.join(index_dir, f'.{version}.tmp')
+    work_dir = os.path.join(tmp_dir, 'shards')
+    os.makedirs(os.path.join(tmp_dir, 'columns'))
+    os.makedirs(work_dir)
+    normalized = vectorizer_params.get('norm') == 'l2'
+    score_dtype = np.float64 if precision == 'float64' else np.float32
+
+    def shard_path(shard, name):
+        return os.path.join(work_dir, f'{name}-{shard}.npy')
+
+    # 1. Weights below min_weight dropped per shard; the largest weight left fixes the quantization scale
+    shard_rows, shard_nnz, blob_sizes, max_weight, has_signatures = [], [], {}, 0.0, False
+    for shard in range(n_shards):
+        matrix, columns, signatures = load_shard(shard)
+        matrix, _ = compact_matrix(matrix, 'float64', min_weight, normalized)
+        for name in ('data', 'indices', 'indptr'):
+            np.save(shard_path(shard, name), getattr(matrix, name))
+        shard_rows.append(matrix.shape[0])
+        shard_nnz.append(matrix.nnz)
+        max_weight = max(max_weight, float(matrix.data.max()) if matrix.nnz else 0.0)
+        for name in column_names:
+            blob_sizes[name] = blob_sizes.get(name, 0) + len(columns[name][0])
+        has_signatures = signatures is not None
+        del matrix, columns, signatures
+    row_offsets = np.concatenate([[0], np.cumsum(shard_rows)]).astype(np.int64)
+    n_rows, nnz = int(row_offsets[-1]), int(sum(shard_nnz))
+    scale = 1.0
+    if precision not in ('float64', 'float32') and nnz:
+        scale = max_weight / np.iinfo(precision).max
+
+    # 2. Stored matrix, columns and signatures appended shard by shard; postings and the SVD sample per shard
+    index_dtype = np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+    data = open_memmap(os.path.join(tmp_dir, 'data.npy'), mode='w+', dtype=precision, shape=(nnz,))
+    indices = open_memmap(os.path.join(tmp_dir, 'indices.npy'), mode='w+', dtype=np.int32, shape=(nnz,))
+    indptr = np.zeros(n_rows + 1, dtype=index_dtype)
+    blobs = {name: open_memmap(os.path.join(tmp_dir, 'columns', f'{i}.bin.npy'), mode='w+', dtype=np.uint8,
+                               shape=(blob_sizes.get(name, 0),))
+             for i, name in enumerate(column_names)}
+    offsets = {name: np.zeros(n_rows + 1, dtype=np.int64) for name in column_names}
+    signatures_out = None
+    sample = svd_sample_rows(n_rows) if dense_dims > 0 and dense_method == 'svd' else None
+    sample_parts = []
+    position = 0
+    for shard in range(n_shards):
+        _, columns, signatures = load_shard(shard)
+        first, last = row_offsets[shard], row_offsets[shard + 1]
+        matrix = csr_matrix(tuple(np.load(shard_path(shard, name)) for name in ('data', 'indices', 'indptr')),
+                            shape=(last - first, n_features))
+        matrix, _ = compact_matrix(matrix, precision, 0.0, normalized, scale=scale)
+        data[position:position + matrix.nnz] = matrix.data
+        indices[position:position + matrix.nnz] = matrix.indices
+        indptr[first + 1:last + 1] = position + matrix.indptr[1:]
+        position += matrix.nnz
+        scored = decode_matrix(matrix, scale, score_dtype)
+        for name, array in zip(POSTINGS_FILES, build_postings(scored)):
+            np.save(shard_path(shard, name), array)
+        if dense_dims > 0 and dense_method == 'svd':
+            local = np.arange(last - first) if sample is None else (
+                sample[(sample >= first) & (sample < last)] - first)
+            sample_parts.append(scored[local])
+        for name in column_names:
+            blob, column_offsets = columns[name]
+            blob_start = offsets[name][first]
+            blobs[name][blob_start:blob_start + len(blob)] = blob
+            offsets[name][first + 1:last + 1] = blob_start + np.asarray(column_offsets[1:])
+        if has_signatures:
+            if signatures_out is None:
+                signatures_out = open_memmap(os.path.join(tmp_dir, 'minhash.npy'), mode='w+', dtype=np.uint32,
+                                             shape=(n_rows, signatures.shape[1]))
+            signatures_out[first:last] = signatures
+        os.remove(shard_path(shard, 'data'))
+        os.remove(shard_path(shard, 'indices'))
+        del matrix, scored, columns, signatures
+    for array in (data, indices, signatures_out, *blobs.values()):
+        if array is not None:
+            array.flush()
+    del data, indices, signatures_out, blobs
+    np.save(os.path.join(tmp_dir, 'indptr.npy'), indptr)
+    np.save(os.path.join(tmp_dir, 'idf.npy'), np.asarray(idf))
+    for i, name in enumerate(column_names):
+        np.save(os.path.join(tmp_dir, 'columns', f'{i}.offsets.npy'), offsets[name])
+    del offsets
+
+    # 3. Postings merged on disk, term block by term block
+    shard_postings = [tuple(np.load(shard_path(shard, name), mmap_mode='r') for name in POSTINGS_FILES)
+                      for shard in range(n_shards)]
+    # Blocks the size of the largest shard: sorting one costs about as much memory as a shard
+    _merge_postings(tmp_dir, shard_postings, row_offsets[:-1], n_features, score_dtype, max(shard_nnz, default=1))
+    del shard_postings
+
+    # 4. Dense vectors: projection fitted on the sampled rows, rows projected shard by shard
+    stored_matrix = csr_matrix((np.load(os.path.join(tmp_dir, 'data.npy'), mmap_mode='r'),
+                                np.load(os.path.join(tmp_dir, 'indices.npy'), mmap_mode='r'),
+                                np.load(os.path.join(tmp_dir, 'indptr.npy'), mmap_mode='r')),
+                               shape=(n_rows, n_features), copy=False)
+    projection = None
+    if dense_dims > 0:
+        if dense_method == 'svd':
+            fitted_on = sp_vstack(sample_parts, format='csr') if sample_parts else csr_matrix((0, n_features))
+        else:
+            fitted_on = csr_matrix((0, n_features))
+        projection = fit_projection(fitted_on, dense_dims, dense_method)
+        del fitted_on, sample_parts
+        dense = open_memmap(os.path.join(tmp_dir, 'dense.npy'), mode='w+', dtype=np.float32,
+                            shape=(n_rows, projection.shape[1]))
+        for shard in range(n_shards):
+            first, last = row_offsets[shard], row_offsets[shard + 1]
+            dense[first:last] = project_rows(decode_matrix(stored_matrix[first:last], scale, score_dtype), projection)
+        dense.flush()
+        del dense
+        np.save(os.path.join(tmp_dir, 'projection.npy'), projection)
+    del stored_matrix
+
+    with open(os.path.join(tmp_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(list(terms), f, ensure_ascii=False)
+
+    # 5. Facets built per shard and merged on disk
+    def load_columns(shard):
+        columns = load_shard(shard)[1]
+        return {name: list(StringColumn(*columns[name])) for name in column_names if name in FACETS}
+    write_facets_sharded(os.path.join(tmp_dir, 'facets'), n_shards, load_columns, os.path.join(work_dir, 'facets'))
+    shutil.rmtree(work_dir)
+
+    _commit_version(index_dir, tmp_dir, version, {
+        'shape': [n_rows, n_features],
+        'nnz': nnz,
+        'precision': precision,
+        'weight_scale': scale,
+        'min_weight': min_weight,
+        'normalized': normalized,
+        'dense': {'method': dense_method, 'dims': int(projection.shape[1])} if projection is not None else None,
+        'columns': list(column_names),
+        'vectorizer': vectorizer_params,
+    }, extra_meta, keep)
+    return version
+
+
+def index_columns(available, display_columns=DISPLAY_COLUMNS):
+    """Columns to store: the display columns plus the metadata columns the job ads have"""
+    return list(display_columns) + [
+        name for name in METADATA_COLUMNS + [DUPLICATE_COUNT_COLUMN] if name in available
+    ]
+
+
+def write_index(index_dir: str, vectorizer, tfidf_matrix, job_ads_df, display_columns=DISPLAY_COLUMNS, keep: int = 3,
+                signatures=None, precision: str = INDEX_PRECISION, min_weight: float = INDEX_MIN_WEIGHT,
+                dense_dims: int = INDEX_DENSE_DIMS, dense_method: str = INDEX_DENSE_METHOD) -> str:
+    """Write a new index version from a fitted vectorizer and make it the current one. Returns the version name."""
+    if tfidf_matrix.shape[0] != len(job_ads_df):
+        raise ValueError(f"The TF-IDF matrix has {tfidf_matrix.shape[0]} rows but there are {len(job_ads_df)} job ads.")
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, i in vectorizer.vocabulary_.items():
+        terms[i] = term
+    columns = {
+        name: encode_string_column(job_ads_df[name].tolist())
+        for name in index_columns(job_ads_df.columns, display_columns)
+    }
+    params = vectorizer.get_params()
+    return write_index_version(
+        index_dir, tfidf_matrix, vectorizer.idf_, terms, columns,
+        {name: params[name] for name in VECTORIZER_PARAMS}, signatures=signatures, keep=keep,
+        precision=precision, min_weight=min_weight, dense_dims=dense_dims, dense_method=dense_method,
+    )
+
+
+def open_index(index_dir: str = INDEX_DIR, version: str = None) -> JobIndex:
+    """Open the current (or the given) index version read-only"""
+    version = version or current_version(index_dir)
+    if version is None:
+        raise FileNotFoundError(f"No index found in '{index_dir}'. Run model/train_model.py first.")
+    return JobIndex(os.path.join(index_dir, version))
+
+
+def _version_metas(index_dir: str) -> dict:
+    """meta.json of every complete version in index_dir, by version name"""
+    metas = {}
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name, 'meta.json')
+        if name.startswith('.') or not os.path.isfile(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                metas[name] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return metas
+
+
+def _version_order(name: str, meta: dict):
+    """Sort key of a version: its write sequence, then creation time (versions written before sequences existed)"""
+    return meta.get('sequence', 0), meta.get('created_at', 0), name
+
+
+def prune_versions(index_dir: str, keep: int = 3):
+    """Delete all but the newest `keep` versions (never the current one).
+
+    Workers that still map files of a deleted version keep working: the data
+    stays alive until they unmap it.
+    """
+    current = current_version(index_dir)
+    # Oldest first by write sequence: names written in the same second only differ by a random suffix
+    versions = sorted(_version_metas(index_dir).items(), key=lambda item: _version_order(item[0], item[1]))
+    versions = [name for name, _ in versions]
+    for name in versions[:-keep] if keep > 0 else versions:
+        if name != current:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+
+def vector_rows_path(vectors_path: str) -> str:
+    """CSV of the job ads behind the rows of a pickled TF-IDF matrix.
+
+    train_model writes it when near-duplicates were collapsed, since the
+    matrix then has fewer rows than the original CSV.
+    """
+    return os.path.splitext(vectors_path)[0] + '.rows.csv'
+
+
+def build_index_from_pickles(model_path: str, vectors_path: str, csv_path: str, index_dir: str = INDEX_DIR) -> str:
+    """Convert the legacy pickled vectorizer/matrix and CSV into the index format"""
+    import pandas as pd
+    with open(model_path, 'rb') as f:
+        vectorizer = pickle.load(f)
+    with open(vectors_path, 'rb') as f:
+        tfidf_matrix = pickle.load(f)
+    # With near-duplicates collapsed, the matrix rows are the job ads saved next to it, not the whole CSV
+    rows_path = vector_rows_path(vectors_path)
+    job_ads_df = pd.read_csv(rows_path if os.path.exists(rows_path) else csv_path)
+    return write_index(index_dir, vectorizer, tfidf_matrix, job_ads_df)
+
+
+if __name__ == "__main__":
+    # Usage: python -m model.index [model.pkl vectors.pkl job_ads.csv [index_dir]]
+    from model.train_model import MODEL_SAVE_PATH, VECTORS_SAVE_PATH, CSV_FILE_PATH
+    args = sys.argv[1:] or [MODEL_SAVE_PATH, VECTORS_SAVE_PATH, CSV_FILE_PATH]
+    version = build_index_from_pickles(*args)
+    print(f"Index version '{version}' written and set as current.")
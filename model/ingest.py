@@ -0,0 +1,222 @@
+"""Incremental updates of the job index, without refitting the vectorizer.
+
+New job ads (e.g. the JSON written by JobScraperManager.save_to_json) are
+vectorized with the vocabulary and IDF of the current index version and
+appended as new rows. Expired ads are tombstoned: they stay in the matrix but
+are never returned. Every update is written as a new index version, and
+running web workers switch to it on their next request.
+
+IDF is only refreshed on a schedule (IDF_MAX_AGE): the refresh recomputes it
+from the live rows and drops the tombstoned rows for good. The vocabulary
+itself only changes with a full retrain (model/train_model.py).
+
+Usage:
+    python -m model.ingest job_results.json [--expired expired_links.txt] [--refresh-idf]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, vstack
+from sklearn.preprocessing import normalize
+
+from model.index import (INDEX_DIR, DUPLICATE_COUNT_COLUMN, METADATA_COLUMNS, open_index, write_index_version,
+                         append_string_column, compact_matrix, encode_string_column, quantization_fits)
+from model.near_duplicates import NUM_PERM, cluster_labels, duplicate_counts, minhash_signatures
+from model.preprocessing import preprocess_corpus
+from model.train_model import TEXT_COLUMN_NAME
+
+# Recompute IDF (and drop tombstoned rows) when the current one is older than this
+IDF_MAX_AGE = 24 * 3600
+
+# save_to_json field -> index display column
+SCRAPED_FIELDS = {
+    'company': 'Company', 'title': 'Role', 'description': 'Description', 'link': 'Job Link',
+    'source': 'Source', 'location': 'Location', 'posted_at': 'Posted At',
+}
+LINK_COLUMN = 'Job Link'
+
+
+def load_scraped_jobs(json_path: str) -> pd.DataFrame:
+    """Read the output of JobScraperManager.save_to_json as a DataFrame with the index columns"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)['jobs']
+    df = pd.DataFrame(jobs, columns=list(SCRAPED_FIELDS))
+    return df.rename(columns=SCRAPED_FIELDS)
+
+
+def recompute_idf(matrix, idf, live_mask, smooth_idf: bool = True, norm: str = 'l2'):
+    """New IDF from the live rows, and the matrix re-weighted with it.
+
+    Rows are (tf * idf) / ||tf * idf||, so rescaling every column by
+    new_idf / old_idf and normalizing again gives exactly the rows a fresh
+    TfidfVectorizer with the same vocabulary would produce.
+    """
+    live = matrix[np.flatnonzero(live_mask)]
+    n_docs = live.shape[0]
+    df = np.bincount(live.indices, minlength=matrix.shape[1])
+    if smooth_idf:
+        new_idf = np.log((1 + n_docs) / (1 + df)) + 1
+    else:
+        new_idf = np.log(n_docs / np.maximum(df, 1)) + 1
+    reweighted = csr_matrix(matrix.multiply(new_idf / np.asarray(idf)))
+    if norm:
+        reweighted = normalize(reweighted, norm=norm)
+    return new_idf, reweighted
+
+
+def index_signatures(index, text_col: str = TEXT_COLUMN_NAME):
+    """MinHash signatures of every row; computed from the stored descriptions for versions written without them"""
+    if index.signatures is not None:
+        return np.asarray(index.signatures)
+    column = index.columns.get(text_col)
+    if column is None:
+        return np.full((index.n_rows, NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    return minhash_signatures(list(column))
+
+
+def collapse_new_jobs(base, base_signatures, new_jobs: pd.DataFrame, text_col: str = TEXT_COLUMN_NAME):
+    """Collapse near-duplicates among the new job ads and against the live rows of the index.
+
+    A new ad that repeats indexed ones replaces them: the newest copy is kept
+    (its link is the one still online) with the summed Duplicate Count, and the
+    old rows are tombstoned. Returns (kept new ads, their signatures, replaced rows).
+    """
+    live_rows = np.arange(base.n_rows) if base.tombstones is None else np.flatnonzero(~base.tombstones)
+    n_live = live_rows.shape[0]
+    new_signatures = minhash_signatures(new_jobs[text_col].tolist())
+    labels = cluster_labels(np.concatenate([base_signatures[live_rows], new_signatures]), new_from=n_live)
+
+    new_labels = labels[n_live:]
+    _, first = np.unique(new_labels, return_index=True)
+    keep = np.sort(first)
+    kept_labels = new_labels[keep]
+    totals = np.bincount(new_labels, weights=duplicate_counts(new_jobs), minlength=labels.max() + 1).astype(np.int64)
+    in_cluster = np.isin(labels[:n_live], kept_labels)
+    replaced = live_rows[in_cluster]
+    counts = base.columns.get(DUPLICATE_COUNT_COLUMN)
+    for row, label in zip(replaced, labels[:n_live][in_cluster]):
+        totals[label] += int(counts[row] or 1) if counts is not None else 1
+
+    new_jobs = new_jobs.iloc[keep].copy()
+    new_jobs[DUPLICATE_COUNT_COLUMN] = totals[kept_labels]
+    return new_jobs, new_signatures[keep], replaced
+
+
+def ingest_jobs(new_jobs: pd.DataFrame, index_dir: str = INDEX_DIR, expired_links=(), refresh_idf: bool = None,
+                idf_max_age: float = IDF_MAX_AGE, text_col: str = TEXT_COLUMN_NAME,
+                collapse_duplicates: bool = True) -> str:
+    """Append new job ads and tombstone expired ones. Returns the new index version."""
+    base = open_index(index_dir)
+    links = base.columns.get(LINK_COLUMN)
+    link_rows = {links[row]: row for row in range(base.n_rows)} if links is not None else {}
+
+    # Skip ads that are already indexed (same link)
+    if LINK_COLUMN in new_jobs:
+        new_jobs = new_jobs[~new_jobs[LINK_COLUMN].isin(link_rows)].drop_duplicates(subset=LINK_COLUMN)
+
+    signatures = None
+    replaced_rows = np.empty(0, dtype=np.int64)
+    if collapse_duplicates and len(new_jobs):
+        signatures = index_signatures(base, text_col)
+        n_new = len(new_jobs)
+        new_jobs, new_signatures, replaced_rows = collapse_new_jobs(base, signatures, new_jobs, text_col)
+        signatures = np.concatenate([signatures, new_signatures])
+        print(f"Near-duplicates: kept {len(new_jobs)} of {n_new} new job ads, "
+              f"replacing {len(replaced_rows)} indexed copies.")
+    elif base.signatures is not None:
+        signatures = np.concatenate([np.asarray(base.signatures), minhash_signatures(new_jobs[text_col].tolist())])
+
+    print(f"1. Vectorizing {len(new_jobs)} new job ads with the current vocabulary...")
+    docs = preprocess_corpus(new_jobs[text_col].fillna('').tolist()) if len(new_jobs) else []
+    new_rows = base.vectorizer.transform(docs) if docs else csr_matrix((0, base.matrix.shape[1]))
+    n_rows = base.n_rows + new_rows.shape[0]
+
+    tombstones = np.zeros(n_rows, dtype=bool)
+    if base.tombstones is not None:
+        tombstones[:base.n_rows] = base.tombstones
+    expired_rows = [link_rows[link] for link in set(expired_links) if link in link_rows]
+    if expired_rows:
+        tombstones[expired_rows] = True
+        print(f"2. Tombstoned {len(expired_rows)} expired job ads.")
+    # Older copies of reposted ads
+    tombstones[replaced_rows] = True
+
+    columns = {}
+    for name, column in base.columns.items():
+        default = '1' if name == DUPLICATE_COUNT_COLUMN else ''
+        values = new_jobs[name].tolist() if name in new_jobs else [default] * len(new_jobs)
+        columns[name] = append_string_column(column, values)
+    # Metadata the current version does not have yet (e.g. built from a CSV without Location)
+    for name in METADATA_COLUMNS + [DUPLICATE_COUNT_COLUMN]:
+        if name not in columns and name in new_jobs:
+            default = '1' if name == DUPLICATE_COUNT_COLUMN else ''
+            columns[name] = encode_string_column([default] * base.n_rows + new_jobs[name].tolist())
+
+    idf = base.idf
+    idf_computed_at = base.meta.get('idf_computed_at', base.meta['created_at'])
+    if refresh_idf is None:
+        refresh_idf = time.time() - idf_computed_at > idf_max_age
+    precision, min_weight = base.precision, base.meta.get('min_weight', 0.0)
+    weight_scale = None
+    if not refresh_idf:
+        # The indexed rows are unchanged: only the new ones are encoded, with the
+        # codes of the current version (unless they need a wider quantization range)
+        new_rows, _ = compact_matrix(new_rows, 'float64', min_weight, base.normalized)
+        if quantization_fits(new_rows, precision, base.weight_scale):
+            stored, weight_scale = compact_matrix(new_rows, precision, scale=base.weight_scale)
+            matrix = vstack([base.matrix, stored], format='csr')
+    if weight_scale is None:
+        # A new IDF changes every row: decoded and re-encoded with the same precision
+        matrix = vstack([base.float_matrix(), new_rows], format='csr')
+    if refresh_idf:
+        print("3. Scheduled refresh: recomputing IDF and dropping tombstoned rows...")
+        params = base.meta['vectorizer']
+        idf, matrix = recompute_idf(matrix, idf, ~tombstones, params.get('smooth_idf', True), params.get('norm', 'l2'))
+        live_rows = np.flatnonzero(~tombstones)
+        matrix = matrix[live_rows]
+        columns = {name: _take_rows(blob, offsets, live_rows) for name, (blob, offsets) in columns.items()}
+        if signatures is not None:
+            signatures = signatures[live_rows]
+        tombstones = None
+        idf_computed_at = time.time()
+
+    version = write_index_version(
+        index_dir, matrix, idf, base.terms, columns, base.meta['vectorizer'], tombstones=tombstones,
+        signatures=signatures, extra_meta={'idf_computed_at': idf_computed_at, 'parent_version': base.version},
+        precision=precision, min_weight=min_weight, weight_scale=weight_scale,
+        # New rows are projected like the indexed ones; the projection is only refitted by a retrain
+        dense_dims=0, projection=base.projection, dense_method=(base.meta.get('dense') or {}).get('method', 'svd'),
+    )
+    print(f"Index version '{version}' is now current ({matrix.shape[0]} rows).")
+    return version
+
+
+def _take_rows(blob, offsets, rows):
+    """Keep only the given rows of an encoded string column"""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return blob[positions], new_offsets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add scraped job ads to the job index without retraining.")
+    parser.add_argument('jobs_json', nargs='?', help="output of JobScraperManager.save_to_json")
+    parser.add_argument('--expired', help="file with one expired job link per line")
+    parser.add_argument('--keep-duplicates', action='store_true', help="do not collapse near-duplicate job ads")
+    parser.add_argument('--refresh-idf', action='store_true', default=None, help="recompute IDF now")
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    args = parser.parse_args()
+
+    new_jobs = load_scraped_jobs(args.jobs_json) if args.jobs_json else pd.DataFrame(columns=list(SCRAPED_FIELDS.values()))
+    expired = []
+    if args.expired:
+        with open(args.expired, 'r', encoding='utf-8') as f:
+            expired = [line.strip() for line in f if line.strip()]
+    ingest_jobs(new_jobs, args.index_dir, expired_links=expired, refresh_idf=args.refresh_idf,
+                collapse_duplicates=not args.keep_duplicates)
@@ -0,0 +1,240 @@
+"""Near-duplicate job ads: MinHash signatures with LSH banding.
+
+Reposts, the same ad on several sites and templated agency ads have almost
+the same description. Each description is reduced to its set of word
+shingles (SHINGLE_SIZE consecutive words) and to a MinHash signature of
+NUM_PERM values; two signatures agree on a position with probability equal
+to the Jaccard similarity of the two shingle sets. The signatures are cut
+into BANDS bands: ads with an identical band are candidates (one sort per
+band, so O(n log n) instead of comparing every pair), and candidates whose
+estimated similarity is at least THRESHOLD are merged into clusters.
+
+Each cluster is collapsed into its first row, which gets a 'Duplicate Count'
+column with the size of the cluster.
+
+Usage (shrink and query speed-up on a CSV, without writing an index):
+    python -m model.near_duplicates [model/job_ads.csv] [--queries 50]
+"""
+import argparse
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from model.index import DUPLICATE_COUNT_COLUMN
+
+SHINGLE_SIZE = 3
+# Shorter texts ("Python developer") are too short to tell a copy from a different ad: never collapsed
+MIN_SHINGLES = 5
+NUM_PERM = 64
+BANDS = 16
+# Estimated Jaccard similarity above which two descriptions are the same ad
+THRESHOLD = 0.8
+
+_WORD_RE = re.compile(r'\w+')
+_PRIME = 4294967311  # smallest prime above 2^32
+_MASK = np.uint64(0xFFFFFFFF)
+# Fixed permutations: signatures written to an index must stay comparable with later ones
+_rng = np.random.RandomState(20240501)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+
+def shingle_hashes(text: str):
+    """32-bit hashes of the word shingles of a text (case and punctuation ignored)"""
+    words = _WORD_RE.findall(str(text).lower())
+    if len(words) < SHINGLE_SIZE:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.array([zlib.crc32(word.encode('utf-8')) for word in words], dtype=np.uint64)
+    combined = np.zeros(hashes.shape[0] - SHINGLE_SIZE + 1, dtype=np.uint64)
+    for i in range(SHINGLE_SIZE):
+        # polynomial hash of the word hashes, so word order matters
+        combined = (combined * np.uint64(1000003) + hashes[i:i + combined.shape[0]]) & _MASK
+    return np.unique(combined)
+
+
+def minhash(text: str):
+    """MinHash signature (NUM_PERM uint32 values); all 0xFFFFFFFF (never matched) below MIN_SHINGLES"""
+    shingles = shingle_hashes(text)
+    if shingles.shape[0] < MIN_SHINGLES:
+        return np.full(NUM_PERM, _EMPTY, dtype=np.uint32)
+    values = (_PERM_A[:, None] * shingles[None, :] + _PERM_B[:, None]) % np.uint64(_PRIME)
+    return (values.min(axis=1) & _MASK).astype(np.uint32)
+
+
+def _signature_chunk(texts):
+    return np.array([minhash(text) for text in texts], dtype=np.uint32).reshape(len(texts), NUM_PERM)
+
+
+def minhash_signatures(texts, n_jobs: int = None, chunk_size: int = 10000):
+    """Signatures of many texts as an (n, NUM_PERM) uint32 array, split across processes for large corpora"""
+    texts = ['' if text is None or text != text else str(text) for text in texts]
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(texts) <= chunk_size:
+        return _signature_chunk(texts)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return np.concatenate(list(executor.map(_signature_chunk, chunks)))
+
+
+def candidate_pairs(signatures, bands: int = BANDS):
+    """(a, b) row pairs that share at least one band. b is compared with the first row a of its bucket."""
+    n, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    valid = signatures[:, 0] != _EMPTY
+    firsts, others = [], []
+    for band in range(bands):
+        block = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        # one 64-bit key per band (collisions only add candidates, they are verified anyway)
+        keys = np.zeros(n, dtype=np.uint64)
+        for column in range(rows_per_band):
+            keys = keys * np.uint64(1000003) ^ block[:, column]
+        order = np.flatnonzero(valid)
+        order = order[np.argsort(keys[order], kind='stable')]
+        sorted_keys = keys[order]
+        starts = np.ones(order.shape[0], dtype=bool)
+        starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        bucket_first = order[np.flatnonzero(starts)[np.cumsum(starts) - 1]]
+        firsts.append(bucket_first[~starts])
+        others.append(order[~starts])
+    if not firsts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.stack([np.concatenate(firsts), np.concatenate(others)], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def similar_pairs(signatures, bands: int = BANDS, threshold: float = THRESHOLD, batch: int = 1 << 18):
+    """Candidate pairs whose estimated Jaccard similarity is at least threshold"""
+    a, b = candidate_pairs(signatures, bands)
+    keep = np.zeros(a.shape[0], dtype=bool)
+    for start in range(0, a.shape[0], batch):
+        agreement = (signatures[a[start:start + batch]] == signatures[b[start:start + batch]]).mean(axis=1)
+        keep[start:start + batch] = agreement >= threshold
+    return a[keep], b[keep]
+
+
+def cluster_labels(signatures, bands: int = BANDS, threshold: float = THRESHOLD, new_from: int = 0):
+    """Cluster label of every row: rows linked by a chain of similar pairs share a label.
+
+    With new_from, only pairs involving a row >= new_from link rows (the rows
+    before it were collapsed already).
+    """
+    n = signatures.shape[0]
+    a, b = similar_pairs(signatures, bands, threshold)
+    if new_from:
+        involves_new = np.maximum(a, b) >= new_from
+        a, b = a[involves_new], b[involves_new]
+    graph = coo_matrix((np.ones(a.shape[0], dtype=np.int8), (a, b)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def collapse(labels, counts=None):
+    """(kept rows, duplicate count of each kept row): the first row of every cluster, in row order.
+
+    counts are the duplicate counts the rows already carry (1 each by default).
+    """
+    counts = np.ones(labels.shape[0], dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    _, first = np.unique(labels, return_index=True)
+    keep = np.sort(first)
+    totals = np.bincount(labels, weights=counts).astype(np.int64)
+    return keep, totals[labels[keep]]
+
+
+def duplicate_counts(df):
+    """Duplicate counts already in a DataFrame (e.g. an earlier collapsed export), 1 when missing"""
+    if DUPLICATE_COUNT_COLUMN not in df:
+        return np.ones(len(df), dtype=np.int64)
+    return df[DUPLICATE_COUNT_COLUMN].fillna(1).astype(np.int64).to_numpy()
+
+
+def collapse_near_duplicates(df, text_col: str, n_jobs: int = None):
+    """Keep one row per cluster of near-identical texts.
+
+    Returns (collapsed DataFrame with a Duplicate Count column, signatures of
+    the kept rows, report dict).
+    """
+    start = time.perf_counter()
+    signatures = minhash_signatures(df[text_col].tolist(), n_jobs)
+    labels = cluster_labels(signatures)
+    keep, counts = collapse(labels, duplicate_counts(df))
+    collapsed = df.iloc[keep].copy()
+    collapsed[DUPLICATE_COUNT_COLUMN] = counts
+    return collapsed, signatures[keep], collapse_report(labels, keep, time.perf_counter() - start)
+
+
+def collapse_report(labels, keep, seconds: float) -> dict:
+    n = labels.shape[0]
+    return {
+        "rows_before": n,
+        "rows_after": int(keep.shape[0]),
+        "clusters": int(np.count_nonzero(np.bincount(labels) > 1)) if n else 0,
+        "shrink": round(1 - keep.shape[0] / n, 4) if n else 0.0,
+        "seconds": round(seconds, 2),
+    }
+
+
+def print_report(report):
+    print(f"Near-duplicates: {report['rows_before']} -> {report['rows_after']} job ads "
+          f"({report['shrink']:.1%} fewer, {report['clusters']} clusters collapsed) in {report['seconds']}s")
+
+
+def _query_seconds(matrix, queries, k: int = 9):
+    from sklearn.metrics.pairwise import cosine_similarity
+    start = time.perf_counter()
+    tops = []
+    for q in range(queries.shape[0]):
+        similarities = cosine_similarity(queries[q], matrix).ravel()
+        tops.append(np.argpartition(-similarities, min(k, similarities.shape[0] - 1))[:k])
+    return (time.perf_counter() - start) / queries.shape[0], tops
+
+
+def compare(csv_path: str, text_col: str, n_queries: int = 50, n_jobs: int = None):
+    """Train on the CSV with and without collapsing; index size and query latency of both"""
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from model.preprocessing import preprocess_corpus
+    from model.train_model import VECTORIZER_OPTIONS
+
+    df = pd.read_csv(csv_path)
+    df[text_col] = df[text_col].fillna('')
+    collapsed, _, report = collapse_near_duplicates(df, text_col, n_jobs)
+    print_report(report)
+
+    rng = np.random.RandomState(0)
+    query_texts = preprocess_corpus(df[text_col].iloc[rng.choice(len(df), min(n_queries, len(df)), replace=False)])
+    labels = None
+    results = {}
+    for name, frame in (("all", df), ("collapsed", collapsed)):
+        vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
+        matrix = vectorizer.fit_transform(preprocess_corpus(frame[text_col].tolist(), n_jobs=n_jobs))
+        seconds, tops = _query_seconds(matrix, vectorizer.transform(query_texts))
+        results[name] = {"rows": matrix.shape[0], "nnz": int(matrix.nnz), "query_ms": round(seconds * 1000, 3)}
+        if name == "all":
+            # share of the top-9 slots taken by a copy of a better-ranked result
+            labels = cluster_labels(minhash_signatures(df[text_col].tolist(), n_jobs))
+            copies = sum(9 - np.unique(labels[top]).shape[0] for top in tops)
+            results[name]["duplicate_slots"] = round(copies / (9 * len(tops)), 4)
+    speedup = results["all"]["query_ms"] / results["collapsed"]["query_ms"] if results["collapsed"]["query_ms"] else None
+    for name, result in results.items():
+        print(f"{name:>9}: {result['rows']} rows, {result['nnz']} non-zeros, {result['query_ms']} ms/query")
+    print(f"Index non-zeros: {1 - results['collapsed']['nnz'] / results['all']['nnz']:.1%} smaller; "
+          f"queries {speedup:.2f}x faster; duplicate slots in the top 9 before: {results['all']['duplicate_slots']:.1%}")
+    return {"collapse": report, "results": results, "speedup": speedup}
+
+
+if __name__ == "__main__":
+    from model.train_model import CSV_FILE_PATH, TEXT_COLUMN_NAME
+
+    parser = argparse.ArgumentParser(description="Report how much near-duplicate collapsing shrinks the index and speeds up queries.")
+    parser.add_argument('csv', nargs='?', default=CSV_FILE_PATH)
+    parser.add_argument('--text-col', default=TEXT_COLUMN_NAME)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--jobs', type=int, default=None, help="processes (default: all CPUs)")
+    args = parser.parse_args()
+    compare(args.csv, args.text_col, args.queries, args.jobs)
@@ -0,0 +1,123 @@
+"""Text preprocessing shared by training and the web layer.
+
+Only depends on the standard library, so importing it (e.g. in a web
+worker or an extraction process) does not pull in pandas or scikit-learn.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+common_words = [
+    "looking", "join", "seeking", "role", "position", "candidate", "experience",
+    "skills", "team", "work", "opportunity", "company", "apply", "apply now",
+    "apply today", "and", "competitive", "salary", "benefits", "full-time", "part-time",
+    "remote", "hybrid", "flexible", "culture", "environment", "innovative",
+    "dynamic", "collaborative", "leadership", "development", "growth",
+    "responsibilities", "comprehensive", "talented", "supportive", "inclusive",
+    "diverse", "mission", "vision", "values", "strategic", "impactful",
+    "contribute", "success", "achieve", "goals", "objectives", "projects",
+    "initiatives", "strong", "excellent", "proven", "ability", "manage",
+    "deliver", "ensure", "drive", "solve", "foster", "optimize", "lead",
+    "implement", "support", "develop", "high", "standards", "key", "best practices",
+    "solutions", "effective", "successful", "outstanding", "advanced", "extensive",
+    "demonstrate", "commitment", "continuous improvement", "forward-thinking",
+    "analytical", "communication", "shape", "strategies", "complex", "mentor",
+    "colleagues", "essential", "ambitious", "proactive", "detail-oriented",
+    "passionate", "making a difference", "background", "strategic planning",
+    "process improvement", "execution", "stakeholders", "coordination",
+    "requirements gathering", "executive leadership", "will be responsible for",
+    "you will", "we are", "our company is", "become part of", "who excels in",
+    "with", "with expertise in", "in this role", "we value"
+]
+
+_WORD_RE = re.compile(r'\w+')
+_SPLIT_RE = re.compile(r'(\W+)')
+
+
+class StopPhraseStripper:
+    r"""Removes stop phrases from a text in a single pass over its words.
+
+    The phrases are compiled once into a trie keyed by words (and by the
+    separator between two words, e.g. ' ' or '-'). Walking the words of the
+    text, the trie finds every phrase that starts at a word; when several
+    match, the one listed first wins. This gives exactly the same result as
+    re.sub(r'\b(?:' + '|'.join(phrases) + r')\b', '', text), without trying
+    every alternative at every position of the text.
+    """
+
+    def __init__(self, phrases):
+        self._root = {}
+        for priority, phrase in enumerate(phrases):
+            words = list(_WORD_RE.finditer(phrase))
+            if not words or words[0].start() != 0 or words[-1].end() != len(phrase):
+                raise ValueError(f"Stop phrase {phrase!r} must start and end with a word character")
+            key = words[0].group()
+            children = self._root
+            for prev, word in zip([None] + words[:-1], words):
+                if prev is not None:
+                    key = (phrase[prev.end():word.start()], word.group())
+                # node = [priority of the phrase ending here, children]
+                node = children.setdefault(key, [None, {}])
+                children = node[1]
+            if node[0] is None:
+                node[0] = priority
+
+    def strip(self, text: str) -> str:
+        # parts alternates words and the separators between them: [word, sep, word, ...]
+        parts = _SPLIT_RE.split(text)
+        words = parts[0::2]
+        n_words = len(words)
+        root = self._root
+        next_free = 0
+        for i in [i for i, word in enumerate(words) if word in root]:
+            if i < next_free:
+                continue
+            node = root[words[i]]
+            best_priority, best_end = None, i
+            j = i
+            while True:
+                if node[0] is not None and (best_priority is None or node[0] < best_priority):
+                    best_priority, best_end = node[0], j
+                if j + 1 >= n_words or not node[1]:
+                    break
+                node = node[1].get((parts[2 * j + 1], words[j + 1]))
+                if node is None:
+                    break
+                j += 1
+            if best_priority is not None:
+                # drop the phrase words and the separators inside the phrase
+                parts[2 * i:2 * best_end + 1] = [''] * (2 * (best_end - i) + 1)
+                next_free = best_end + 1
+        return ''.join(parts)
+
+
+# built once at import, not on every call
+_stop_phrases = StopPhraseStripper(common_words)
+
+
+def preprocess_text(text: str) -> str:
+    #clean the text of the csv file
+    processed_text = str(text).lower()
+    
+   
+    # processed_text = re.sub(r'[^\w\s]', '', processed_text) 
+    processed_text = _stop_phrases.strip(processed_text)
+    processed_text = ' '.join(processed_text.split())  # Rimuove spazi multipli e strip 
+    return processed_text
+
+
+def _preprocess_chunk(texts):
+    return [preprocess_text(text) for text in texts]
+
+
+def preprocess_corpus(texts, n_jobs: int = None, chunk_size: int = 10000):
+    """Preprocess many documents, split in chunks across processes for large corpora"""
+    texts = list(texts)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(texts) <= chunk_size:
+        return _preprocess_chunk(texts)
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        # map keeps the chunks in order
+        return [doc for chunk in executor.map(_preprocess_chunk, chunks) for doc in chunk]
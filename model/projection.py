@@ -0,0 +1,96 @@
+"""Dense low-dimensional job vectors for the approximate search mode.
+
+The sparse TF-IDF rows (up to max_features columns) are projected onto `dims`
+directions: the top singular vectors of the matrix (truncated SVD) or random
+Gaussian directions. The projected rows are stored in the index as one
+contiguous float32 array (dense.npy) next to the projection itself
+(projection.npy), which maps a vectorized CV into the same space. A query is
+then a dense matrix-vector product over n_rows x dims floats instead of a
+sparse product over the whole vocabulary.
+
+Rows are not renormalized after the projection: the projected dot product
+approximates the TF-IDF dot product (the cosine, since rows and queries have
+unit length), so the approximate scores stay on the same scale as the exact
+ones.
+
+Usage (add dense vectors to the current index without retraining):
+    python -m model.projection --dims 128 --method svd
+"""
+import argparse
+import os
+
+import numpy as np
+
+DENSE_METHODS = ('svd', 'random')
+# Defaults for newly trained versions; 0 writes no dense vectors (ingest keeps the projection of its parent)
+INDEX_DENSE_DIMS = int(os.environ.get('CV_INDEX_DENSE_DIMS', '0'))
+INDEX_DENSE_METHOD = os.environ.get('CV_INDEX_DENSE_METHOD', 'svd')
+# The SVD is fitted on a random sample of at most this many rows
+SVD_SAMPLE_ROWS = 100000
+# Rows projected at a time (bounds the temporaries of the sparse x dense product)
+PROJECT_BLOCK_ROWS = 65536
+
+
+def svd_sample_rows(n_rows: int, seed: int = 0):
+    """Sorted rows the SVD is fitted on, None when it is fitted on all of them"""
+    if n_rows <= SVD_SAMPLE_ROWS:
+        return None
+    return np.sort(np.random.default_rng(seed).choice(n_rows, SVD_SAMPLE_ROWS, replace=False))
+
+
+def fit_projection(matrix, dims: int, method: str = 'svd', seed: int = 0):
+    """(n_features, dims) float32 projection for the rows of a TF-IDF matrix.
+
+    The SVD only sees the rows of svd_sample_rows, so passing just those rows
+    (as an index written shard by shard does) gives the same projection.
+    """
+    if method not in DENSE_METHODS:
+        raise ValueError(f"Unknown projection method '{method}'. Expected one of {', '.join(DENSE_METHODS)}.")
+    n_rows, n_features = matrix.shape
+    dims = min(int(dims), n_features - 1)
+    if method == 'random':
+        # Gaussian directions scaled so the projected dot products are unbiased
+        projection = np.random.default_rng(seed).standard_normal((n_features, dims)) / np.sqrt(dims)
+    else:
+        from sklearn.decomposition import TruncatedSVD
+        sample = svd_sample_rows(n_rows, seed)
+        if sample is not None:
+            matrix = matrix[sample]
+        svd = TruncatedSVD(n_components=dims, algorithm='randomized', random_state=seed)
+        projection = svd.fit(matrix).components_.T
+    return np.ascontiguousarray(projection, dtype=np.float32)
+
+
+def project_rows(matrix, projection, block_rows: int = PROJECT_BLOCK_ROWS):
+    """Dense (n_rows, dims) float32 vectors of the rows, projected block by block"""
+    dense = np.empty((matrix.shape[0], projection.shape[1]), dtype=np.float32)
+    for start in range(0, matrix.shape[0], block_rows):
+        dense[start:start + block_rows] = matrix[start:start + block_rows] @ projection
+    return dense
+
+
+def add_dense_vectors(index_dir: str, dims: int, method: str = 'svd') -> str:
+    """Write the current index again with (new) dense vectors, as a new version. Returns the version name."""
+    from model.index import open_index, write_index_version
+    base = open_index(index_dir)
+    columns = {name: (np.asarray(column._blob), np.asarray(column._offsets)) for name, column in base.columns.items()}
+    extra_meta = {'idf_computed_at': base.meta.get('idf_computed_at', base.meta['created_at']),
+                  'parent_version': base.version}
+    return write_index_version(
+        index_dir, base.matrix, base.idf, base.terms, columns, base.meta['vectorizer'],
+        tombstones=base.tombstones, signatures=base.signatures, extra_meta=extra_meta,
+        # The stored weights are written as they are
+        precision=base.precision, min_weight=base.meta.get('min_weight', 0.0), weight_scale=base.weight_scale,
+        dense_dims=dims, dense_method=method,
+    )
+
+
+if __name__ == "__main__":
+    from model.index import INDEX_DIR
+    parser = argparse.ArgumentParser(description="Add dense vectors for the approximate search mode to the job index.")
+    parser.add_argument('--dims', type=int, default=INDEX_DENSE_DIMS or 128)
+    parser.add_argument('--method', choices=DENSE_METHODS, default=INDEX_DENSE_METHOD)
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    args = parser.parse_args()
+    version = add_dense_vectors(args.index_dir, args.dims, args.method)
+    print(f"Index version '{version}' with {args.method} vectors is now current.")
@@ -1,6 +1,9 @@
+import os
 import pickle
+import numpy as np
 import pandas as pd
 # from scipy.sparse import csr_matrix 
+from model.index import vector_rows_path
 
 MODEL_PATH = 'model/tfidf_vectorizer.pkl'
 VECTORS_PATH = 'model/job_ads_tfidf_vectors.pkl'
@@ -11,7 +14,9 @@ try:
         loaded_vectorizer = pickle.load(f)
     with open(VECTORS_PATH, 'rb') as f:
         loaded_vectors = pickle.load(f)
-    original_df = pd.read_csv(ORIGINAL_DATA_PATH)
+    # Con gli annunci quasi duplicati collassati, le righe della matrice sono quelle salvate accanto ai vettori
+    rows_path = vector_rows_path(VECTORS_PATH)
+    original_df = pd.read_csv(rows_path if os.path.exists(rows_path) else ORIGINAL_DATA_PATH)
 except FileNotFoundError as e:
     print(f"Errore: Assicurati che tutti i file necessari siano presenti. {e}")
     exit() # Esci se i file non sono trovati
@@ -29,13 +34,12 @@ print(top_idf_terms)
 
 print("\n--- Termini più importanti per il primo annuncio ---")
 first_doc_vector = loaded_vectors[0]
-first_doc_vector_dense = first_doc_vector.toarray().flatten()
-
-# Crea una serie Pandas per associare i pesi TF-IDF ai nomi dei termini
-tfidf_scores = pd.DataFrame({'term': feature_names, 'tfidf_score': first_doc_vector_dense})
-# Ordina per TF-IDF score in ordine decrescente
-top_tfidf_terms_for_doc = tfidf_scores.sort_values(by='tfidf_score', ascending=False).head(10)
+# Solo i termini non nulli della riga: niente vettore denso lungo quanto il vocabolario
+top = np.argsort(-first_doc_vector.data, kind='stable')[:10]
+top_tfidf_terms_for_doc = pd.DataFrame({'term': feature_names[first_doc_vector.indices[top]],
+                                        'tfidf_score': first_doc_vector.data[top]})
 print(top_tfidf_terms_for_doc)
+# Per spiegare perché un annuncio corrisponde a un CV: python -m web.explain cv.pdf
 
 if not original_df.empty:
     print("\nTesto originale del PRIMO annuncio:")
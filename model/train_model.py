@@ -1,7 +1,10 @@
+import os
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 import pickle # save the model and vectors
-import re
+from model.index import INDEX_DIR, DISPLAY_COLUMNS, vector_rows_path, write_index
+from model.preprocessing import common_words, preprocess_text, preprocess_corpus
+from model.near_duplicates import collapse_near_duplicates, print_report
 
 CSV_FILE_PATH = 'model/job_ads.csv' 
 # the name of the Csv coloums containing the job descriptions
@@ -10,43 +13,13 @@ TEXT_COLUMN_NAME = 'Description'
 MODEL_SAVE_PATH = 'model/tfidf_vectorizer.pkl'
 # Il nome del file dove verrà salvata la matrice TF-IDF dei tuoi annunci
 VECTORS_SAVE_PATH = 'model/job_ads_tfidf_vectors.pkl'
+# 'stop_words="english"' removes common English words (e.g. "the", "is", "in").
+# max 5000 terms, max dimension of the vector space
+VECTORIZER_OPTIONS = {'stop_words': 'english', 'max_features': 5000}
 
 
-common_words = [
-    "looking", "join", "seeking", "role", "position", "candidate", "experience",
-    "skills", "team", "work", "opportunity", "company", "apply", "apply now",
-    "apply today", "and", "competitive", "salary", "benefits", "full-time", "part-time",
-    "remote", "hybrid", "flexible", "culture", "environment", "innovative",
-    "dynamic", "collaborative", "leadership", "development", "growth",
-    "responsibilities", "comprehensive", "talented", "supportive", "inclusive",
-    "diverse", "mission", "vision", "values", "strategic", "impactful",
-    "contribute", "success", "achieve", "goals", "objectives", "projects",
-    "initiatives", "strong", "excellent", "proven", "ability", "manage",
-    "deliver", "ensure", "drive", "solve", "foster", "optimize", "lead",
-    "implement", "support", "develop", "high", "standards", "key", "best practices",
-    "solutions", "effective", "successful", "outstanding", "advanced", "extensive",
-    "demonstrate", "commitment", "continuous improvement", "forward-thinking",
-    "analytical", "communication", "shape", "strategies", "complex", "mentor",
-    "colleagues", "essential", "ambitious", "proactive", "detail-oriented",
-    "passionate", "making a difference", "background", "strategic planning",
-    "process improvement", "execution", "stakeholders", "coordination",
-    "requirements gathering", "executive leadership", "will be responsible for",
-    "you will", "we are", "our company is", "become part of", "who excels in",
-    "with", "with expertise in", "in this role", "we value"
-]
-
-def preprocess_text(text: str) -> str:
-    #clean the text of the csv file
-    processed_text = str(text).lower()
-    
-   
-    # processed_text = re.sub(r'[^\w\s]', '', processed_text) 
-    processed_text = re.sub(r'\b(?:' + '|'.join(common_words) + r')\b', '', processed_text) 
-    processed_text = re.sub(r'\s+', ' ', processed_text).strip()  # Rimuove spazi multipli e strip 
-    return processed_text
-
-
-def train_tfidf_model(csv_path: str, text_col: str, model_path: str, vectors_path: str):
+def train_tfidf_model(csv_path: str, text_col: str, model_path: str, vectors_path: str, index_dir: str = INDEX_DIR, n_jobs: int = None,
+                      collapse_duplicates: bool = True):
     print(f"loading file '{csv_path}'...")
     try:
         # load the Csv file
@@ -59,17 +32,21 @@ def train_tfidf_model(csv_path: str, text_col: str, model_path: str, vectors_pat
         print(f"Column '{text_col}' has not been found in the csv file.")
         return
 
-    
+    # Reposts and copies of the same ad become one row with a Duplicate Count
+    signatures = None
+    if collapse_duplicates:
+        print("1. Collapsing near-duplicate job ads...")
+        df, signatures, report = collapse_near_duplicates(df, text_col, n_jobs)
+        print_report(report)
+
     # df['combined_text'] = df['title'].fillna('') + ' ' + df[text_col].fillna('') + ' ' + df['requirements'].fillna('')
     text_data = df[text_col].fillna('') #fills the NaN values with empty strings
 
     print(f"2. Preprocessing {len(text_data)} documents...")
-    processed_docs = text_data.apply(preprocess_text)
+    processed_docs = preprocess_corpus(text_data.tolist(), n_jobs=n_jobs)
 
     print("3. Initializing and training the TfidfVectorizer...")
-    # 'stop_words="english"' removes common English words (e.g. "the", "is", "in").
-    # max 5000 terms, max dimension of the vector space
-    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+    vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
 
     #  Learns the vocabulary and computes the IDF from 'processed_docs'.
     #  Transforms each document in 'processed_docs' into a TF-IDF vector.
@@ -85,6 +62,17 @@ def train_tfidf_model(csv_path: str, text_col: str, model_path: str, vectors_pat
     print(f"5. Saving TF-IDF matrix of job ads to '{vectors_path}'...")
     with open(vectors_path, 'wb') as f:
         pickle.dump(tfidf_matrix, f)
+    # The matrix rows are the collapsed job ads: save them next to it for model.index and read_model.py
+    rows_path = vector_rows_path(vectors_path)
+    if collapse_duplicates:
+        df.to_csv(rows_path, index=False)
+    elif os.path.exists(rows_path):
+        os.remove(rows_path)
+
+    print(f"6. Writing memory-mapped index to '{index_dir}'...")
+    display_columns = [col for col in DISPLAY_COLUMNS if col in df.columns]
+    version = write_index(index_dir, vectorizer, tfidf_matrix, df, display_columns, signatures=signatures)
+    print(f"Index version '{version}' is now current.")
 
     print("Training completed successfully!")
 
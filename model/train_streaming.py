@@ -0,0 +1,317 @@
+"""Out-of-core training for job-ad CSVs that do not fit in memory.
+
+Gives the same vocabulary, IDF and TF-IDF rows as train_model.train_tfidf_model,
+in two passes and without ever holding more than one chunk of text:
+
+1. The CSV is read in chunks. Each chunk is preprocessed, its term and
+   document frequencies are added to running totals, and the preprocessed
+   text and the display columns are written to shard files.
+   With near-duplicate collapsing (the default), the MinHash signatures of
+   every chunk are written too; once all rows are read, the clusters are
+   found on the signatures, the shards are rewritten with the kept rows
+   only, and the term counts are taken from those.
+2. The vocabulary (the max_features most frequent terms, picked exactly like
+   TfidfVectorizer does) and the IDF are fixed from the totals, and every text
+   shard is vectorized and written as a CSR shard.
+
+The shards are then written as a new index version one at a time
+(model.index.write_index_version_sharded): the stored matrix, postings, dense
+vectors, columns and facets are merged on disk, so memory stays bounded by
+the chunk size, apart from a few bytes per row (row pointers and offsets) and
+the MinHash signatures that the near-duplicate clustering needs all at once.
+The pickled TF-IDF matrix of the in-memory path is not written (it would need
+the whole matrix in memory); the vectorizer pickle is.
+
+Usage:
+    python -m model.train_streaming [--csv model/job_ads.csv] [--chunksize 50000]
+"""
+import argparse
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from model.index import (INDEX_DIR, INDEX_MIN_WEIGHT, INDEX_PRECISION, DISPLAY_COLUMNS, DUPLICATE_COUNT_COLUMN, PRECISIONS,
+                         VECTORIZER_PARAMS, StringColumn, encode_string_column, index_columns, write_index_version_sharded)
+from model.near_duplicates import _signature_chunk, cluster_labels, collapse, collapse_report, duplicate_counts, print_report
+from model.preprocessing import _preprocess_chunk
+from model.projection import DENSE_METHODS, INDEX_DENSE_DIMS, INDEX_DENSE_METHOD
+from model.train_model import CSV_FILE_PATH, TEXT_COLUMN_NAME, MODEL_SAVE_PATH, VECTORIZER_OPTIONS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CHUNK_SIZE = 50000
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children, in MB"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"self": own / 1024, "children": children / 1024}
+
+
+class TermCounts:
+    """Running term frequencies (total counts) and document frequencies over chunks of documents"""
+
+    def __init__(self, vectorizer_options=VECTORIZER_OPTIONS):
+        # Same tokenization as the final vectorizer; the max_features cut is applied at the end
+        self.options = {name: value for name, value in vectorizer_options.items() if name != 'max_features'}
+        self.max_features = vectorizer_options.get('max_features')
+        self.vocabulary = {}
+        self.tf = np.zeros(0, dtype=np.int64)
+        self.df = np.zeros(0, dtype=np.int64)
+        self.n_docs = 0
+
+    def add(self, docs):
+        self.n_docs += len(docs)
+        counter = CountVectorizer(**self.options)
+        try:
+            counts = counter.fit_transform(docs)
+        except ValueError:
+            # Only empty documents (or stop words) in this chunk
+            return
+        ids = np.array([self.vocabulary.setdefault(term, len(self.vocabulary))
+                        for term in counter.get_feature_names_out()], dtype=np.int64)
+        if len(self.vocabulary) > self.tf.shape[0]:
+            grow = len(self.vocabulary) - self.tf.shape[0]
+            self.tf = np.concatenate([self.tf, np.zeros(grow, dtype=np.int64)])
+            self.df = np.concatenate([self.df, np.zeros(grow, dtype=np.int64)])
+        # ids are unique, so plain fancy-index addition is safe
+        self.tf[ids] += np.asarray(counts.sum(axis=0)).ravel()
+        self.df[ids] += np.bincount(counts.indices, minlength=counts.shape[1])
+
+    def select(self):
+        """(terms, document frequencies) of the kept vocabulary, in TfidfVectorizer column order"""
+        if not self.vocabulary:
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+        terms = sorted(self.vocabulary)
+        ids = np.array([self.vocabulary[term] for term in terms], dtype=np.int64)
+        tfs, dfs = self.tf[ids], self.df[ids]
+        if self.max_features is not None and len(terms) > self.max_features:
+            # Same selection (and tie order) as CountVectorizer._limit_features
+            keep = np.sort((-tfs).argsort()[:self.max_features])
+            terms = [terms[i] for i in keep]
+            dfs = dfs[keep]
+        return terms, dfs
+
+
+def compute_idf(dfs, n_docs: int, smooth_idf: bool = True):
+    """IDF exactly as TfidfTransformer computes it"""
+    dfs = dfs.astype(np.float64) + int(smooth_idf)
+    return np.log((n_docs + int(smooth_idf)) / dfs) + 1
+
+
+def _preprocess(texts, executor, n_jobs: int):
+    if executor is None:
+        return _preprocess_chunk(texts)
+    size = max(1, -(-len(texts) // n_jobs))
+    parts = executor.map(_preprocess_chunk, [texts[i:i + size] for i in range(0, len(texts), size)])
+    return [doc for part in parts for doc in part]
+
+
+def _signatures(texts, executor, n_jobs: int):
+    if executor is None:
+        return _signature_chunk(texts)
+    size = max(1, -(-len(texts) // n_jobs))
+    return np.concatenate(list(executor.map(_signature_chunk, [texts[i:i + size] for i in range(0, len(texts), size)])))
+
+
+def _collapse_shards(shard_dir: str, n_shards: int, n_columns: int, counts: TermCounts):
+    """Collapse near-duplicates across all shards: rewrite them with the kept rows and count their terms.
+
+    Adds the Duplicate Count as column n_columns and writes the signatures of
+    the kept rows of every shard (kept-minhash-<shard>.npy). Returns the report.
+    """
+    start_time = time.perf_counter()
+    signatures = np.concatenate([np.load(path) for path in _shard_paths(shard_dir, 'minhash', n_shards)])
+    labels = cluster_labels(signatures)
+    prior_counts = np.concatenate([np.load(path) for path in _shard_paths(shard_dir, 'counts', n_shards)])
+    keep, totals = collapse(labels, prior_counts)
+    start = 0
+    for shard in range(n_shards):
+        docs = _load_column(shard_dir, f'docs-{shard}')
+        in_shard = (keep >= start) & (keep < start + len(docs))
+        rows = keep[in_shard] - start
+        start += len(docs)
+        kept_docs = [docs[row] for row in rows]
+        counts.add(kept_docs)
+        _save_column(shard_dir, f'docs-{shard}', kept_docs)
+        for i in range(n_columns):
+            column = _load_column(shard_dir, f'col{i}-{shard}')
+            _save_column(shard_dir, f'col{i}-{shard}', [column[row] for row in rows])
+        _save_column(shard_dir, f'col{n_columns}-{shard}', totals[in_shard].tolist())
+        np.save(os.path.join(shard_dir, f'kept-minhash-{shard}.npy'), signatures[keep[in_shard]])
+    return collapse_report(labels, keep, time.perf_counter() - start_time)
+
+
+def _save_column(shard_dir: str, name: str, values):
+    blob, offsets = encode_string_column(values)
+    np.save(os.path.join(shard_dir, f'{name}.bin.npy'), blob)
+    np.save(os.path.join(shard_dir, f'{name}.offsets.npy'), offsets)
+
+
+def _load_column(shard_dir: str, name: str) -> StringColumn:
+    return StringColumn(np.load(os.path.join(shard_dir, f'{name}.bin.npy')),
+                        np.load(os.path.join(shard_dir, f'{name}.offsets.npy')))
+
+
+def _shard_paths(shard_dir: str, name: str, n_shards: int, suffix: str = '.npy'):
+    return [os.path.join(shard_dir, f'{name}-{shard}{suffix}') for shard in range(n_shards)]
+
+
+def train_tfidf_streaming(csv_path: str = CSV_FILE_PATH, text_col: str = TEXT_COLUMN_NAME, model_path: str = MODEL_SAVE_PATH,
+                          index_dir: str = INDEX_DIR, chunksize: int = CHUNK_SIZE, n_jobs: int = None,
+                          shard_dir: str = None, keep_shards: bool = False, collapse_duplicates: bool = True,
+                          precision: str = INDEX_PRECISION, min_weight: float = INDEX_MIN_WEIGHT,
+                          dense_dims: int = INDEX_DENSE_DIMS, dense_method: str = INDEX_DENSE_METHOD):
+    """Train the TF-IDF model chunk by chunk and write a new index version.
+
+    Returns a dict with the index version, the row count, rows per second and peak RSS.
+    """
+    start_time = time.perf_counter()
+    try:
+        header = pd.read_csv(csv_path, nrows=0).columns
+    except FileNotFoundError:
+        print(f"file '{csv_path}' was not found. Please check the file path.")
+        return None
+    if text_col not in header:
+        print(f"Column '{text_col}' has not been found in the csv file.")
+        return None
+    display_columns = index_columns(header, [col for col in DISPLAY_COLUMNS if col in header])
+    usecols = list(dict.fromkeys([text_col] + display_columns))
+    if collapse_duplicates:
+        # rebuilt from the clusters and added last, as in the in-memory path
+        display_columns = [name for name in display_columns if name != DUPLICATE_COUNT_COLUMN]
+
+    shard_dir = shard_dir or os.path.join(index_dir, f'.shards-{os.getpid()}')
+    os.makedirs(shard_dir, exist_ok=True)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    counts = TermCounts()
+    n_shards = 0
+    rows_read = 0
+
+    try:
+        print(f"1. Reading '{csv_path}' in chunks of {chunksize} rows: preprocessing and counting terms...")
+        for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize):
+            texts = chunk[text_col].fillna('').tolist()
+            docs = _preprocess(texts, executor, n_jobs)
+            if collapse_duplicates:
+                # terms are counted once the kept rows are known
+                np.save(os.path.join(shard_dir, f'minhash-{n_shards}.npy'), _signatures(texts, executor, n_jobs))
+                np.save(os.path.join(shard_dir, f'counts-{n_shards}.npy'), duplicate_counts(chunk))
+            else:
+                counts.add(docs)
+            _save_column(shard_dir, f'docs-{n_shards}', docs)
+            for i, name in enumerate(display_columns):
+                _save_column(shard_dir, f'col{i}-{n_shards}', chunk[name].tolist())
+            n_shards += 1
+            rows_read += len(docs)
+            elapsed = time.perf_counter() - start_time
+            print(f"   {rows_read} rows ({rows_read / elapsed:.0f} rows/s)")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if collapse_duplicates:
+        print("   Collapsing near-duplicate job ads...")
+        collapse_stats = _collapse_shards(shard_dir, n_shards, len(display_columns), counts)
+        display_columns = display_columns + [DUPLICATE_COUNT_COLUMN]
+        print_report(collapse_stats)
+    pass1_time = time.perf_counter() - start_time
+
+    terms, dfs = counts.select()
+    vectorizer = TfidfVectorizer(vocabulary={term: i for i, term in enumerate(terms)}, **VECTORIZER_OPTIONS)
+    vectorizer.idf_ = compute_idf(dfs, counts.n_docs, vectorizer.smooth_idf)
+    print(f"2. Vocabulary size: {len(terms)} terms. Vectorizing {n_shards} shards...")
+
+    for shard in range(n_shards):
+        docs = _load_column(shard_dir, f'docs-{shard}')
+        matrix = vectorizer.transform([docs[row] for row in range(len(docs))])
+        matrix.sort_indices()
+        np.save(os.path.join(shard_dir, f'data-{shard}.npy'), matrix.data)
+        np.save(os.path.join(shard_dir, f'indices-{shard}.npy'), matrix.indices)
+        np.save(os.path.join(shard_dir, f'indptr-{shard}.npy'), matrix.indptr)
+        os.remove(os.path.join(shard_dir, f'docs-{shard}.bin.npy'))
+        os.remove(os.path.join(shard_dir, f'docs-{shard}.offsets.npy'))
+    pass2_time = time.perf_counter() - start_time - pass1_time
+
+    print(f"3. Writing memory-mapped index to '{index_dir}' shard by shard...")
+
+    def load_shard(shard):
+        data, indices, indptr = (np.load(os.path.join(shard_dir, f'{name}-{shard}.npy'), mmap_mode='r')
+                                 for name in ('data', 'indices', 'indptr'))
+        matrix = csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(terms)), copy=False)
+        columns = {
+            name: (np.load(os.path.join(shard_dir, f'col{i}-{shard}.bin.npy'), mmap_mode='r'),
+                   np.load(os.path.join(shard_dir, f'col{i}-{shard}.offsets.npy'), mmap_mode='r'))
+            for i, name in enumerate(display_columns)
+        }
+        signatures = None
+        if collapse_duplicates:
+            signatures = np.load(os.path.join(shard_dir, f'kept-minhash-{shard}.npy'), mmap_mode='r')
+        return matrix, columns, signatures
+
+    params = vectorizer.get_params()
+    version = write_index_version_sharded(
+        index_dir, n_shards, load_shard, len(terms), vectorizer.idf_, terms, display_columns,
+        {name: params[name] for name in VECTORIZER_PARAMS},
+        extra_meta={'training': {'mode': 'streaming', 'chunksize': chunksize}},
+        precision=precision, min_weight=min_weight, dense_dims=dense_dims, dense_method=dense_method,
+    )
+    if model_path:
+        with open(model_path, 'wb') as f:
+            pickle.dump(vectorizer, f)
+    if not keep_shards:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    total_time = time.perf_counter() - start_time
+    report = {
+        "version": version,
+        "rows": counts.n_docs,
+        "rows_read": rows_read,
+        "terms": len(terms),
+        "seconds": {"pass1": pass1_time, "pass2": pass2_time, "total": total_time},
+        "rows_per_second": rows_read / total_time if total_time else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"Index version '{version}' is now current.")
+    print(f"Trained on {report['rows']} rows in {total_time:.1f}s ({report['rows_per_second']:.0f} rows/s), "
+          f"peak RSS {report['peak_rss_mb']} MB")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the TF-IDF model on a large CSV without loading it in memory.")
+    parser.add_argument('--csv', default=CSV_FILE_PATH)
+    parser.add_argument('--text-col', default=TEXT_COLUMN_NAME)
+    parser.add_argument('--model-path', default=MODEL_SAVE_PATH)
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--jobs', type=int, default=None, help="preprocessing processes (default: all CPUs)")
+    parser.add_argument('--keep-shards', action='store_true')
+    parser.add_argument('--keep-duplicates', action='store_true', help="do not collapse near-duplicate job ads")
+    parser.add_argument('--precision', choices=PRECISIONS, default=INDEX_PRECISION,
+                        help="stored weights: float64, float32, or quantized uint16/uint8")
+    parser.add_argument('--min-weight', type=float, default=INDEX_MIN_WEIGHT,
+                        help="drop TF-IDF weights below this value (rows are renormalized)")
+    parser.add_argument('--dense-dims', type=int, default=INDEX_DENSE_DIMS,
+                        help="also write dense vectors of this size for the approximate search mode (0: none)")
+    parser.add_argument('--dense-method', choices=DENSE_METHODS, default=INDEX_DENSE_METHOD)
+    args = parser.parse_args()
+    train_tfidf_streaming(args.csv, args.text_col, args.model_path, args.index_dir, args.chunksize, args.jobs,
+                          keep_shards=args.keep_shards, collapse_duplicates=not args.keep_duplicates,
+                          precision=args.precision, min_weight=args.min_weight, dense_dims=args.dense_dims,
+                          dense_method=args.dense_method)
@@ -1,9 +1,20 @@
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 from bs4 import BeautifulSoup
+import asyncio
+import hashlib
 import json
+import os
+import sqlite3
+import tempfile
+import threading
 import time
 import random
-from urllib.parse import urljoin, quote_plus
+import zlib
+from dataclasses import dataclass
+from urllib.parse import urljoin, quote_plus, urlparse, urlunparse, parse_qsl, urlencode
 from abc import ABC, abstractmethod
 import logging
 
@@ -11,15 +22,182 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Cache HTTP su disco condivisa da tutti gli scraper ('' per disattivarla)
+SCRAPER_CACHE_PATH = os.environ.get('SCRAPER_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'cv-job-matching-scraper-cache.sqlite'))
+# Da incrementare quando cambia il parsing: le offerte già estratte dalle pagine in cache vengono ricalcolate
+PARSER_VERSION = 1
+
+
+class CachedSession(requests.Session):
+    """Session di requests con cache HTTP persistente (SQLite) per le richieste GET.
+    
+    - Una pagina scaricata da meno di `freshness` secondi viene restituita
+      dalla cache senza richiesta.
+    - Altrimenti, se la risposta salvata ha ETag o Last-Modified, la richiesta
+      è condizionale (If-None-Match / If-Modified-Since): con 304 il server non
+      ritrasmette la pagina e si usa quella salvata.
+    - I body sono salvati compressi con zlib, insieme alle offerte già estratte
+      dalla pagina, così una pagina non cambiata non viene nemmeno riparsata.
+    
+    Le risposte dalla cache hanno `from_cache = True`. Le statistiche
+    (hit, revalidated, miss, byte scaricati e risparmiati) sono in `stats`.
+    """
+    
+    def __init__(self, path=SCRAPER_CACHE_PATH, freshness=0):
+        super().__init__()
+        self.path = path or None
+        self.freshness = freshness
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset_stats()
+    
+    def reset_stats(self):
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+    
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+    
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " url TEXT PRIMARY KEY, body BLOB, size INTEGER, digest TEXT, content_type TEXT,"
+                " etag TEXT, last_modified TEXT, fetched_at REAL, parser TEXT, jobs TEXT)"
+            )
+            self._local.db = db
+        return db
+    
+    def _load(self, url):
+        row = self._connection().execute(
+            "SELECT body, size, content_type, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("body", "size", "content_type", "etag", "last_modified", "fetched_at")
+        return dict(zip(keys, row))
+    
+    def _cached_response(self, url, entry):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = zlib.decompress(entry["body"])
+        response.cache_url = url
+        response.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"] or "text/html"})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+    
+    def request(self, method, url, *args, **kwargs):
+        if method.upper() != 'GET' or self.path is None:
+            return super().request(method, url, *args, **kwargs)
+        
+        entry = self._load(url)
+        if entry is not None and time.time() - entry["fetched_at"] < self.freshness:
+            self._count("hits")
+            self._count("bytes_saved", entry["size"])
+            return self._cached_response(url, entry)
+        
+        # Richiesta condizionale se abbiamo i validatori della versione salvata
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None and entry["etag"]:
+            headers['If-None-Match'] = entry["etag"]
+        if entry is not None and entry["last_modified"]:
+            headers['If-Modified-Since'] = entry["last_modified"]
+        response = super().request(method, url, *args, headers=headers, **kwargs)
+        
+        if response.status_code == 304 and entry is not None:
+            self._connection().execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._count("revalidated")
+            self._count("bytes_saved", entry["size"])
+            return self._cached_response(url, entry)
+        
+        self._count("misses")
+        self._count("bytes_downloaded", len(response.content))
+        response.from_cache = False
+        response.cache_url = url  # url richiesto, response.url può essere quello dopo un redirect
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if response.status_code == 200 and (self.freshness > 0 or etag or last_modified):
+            self._connection().execute(
+                "INSERT OR REPLACE INTO responses (url, body, size, digest, content_type, etag, last_modified, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, zlib.compress(response.content), len(response.content), hashlib.sha256(response.content).hexdigest(),
+                 response.headers.get('Content-Type'), etag, last_modified, time.time()),
+            )
+        return response
+    
+    def load_jobs(self, response, parser):
+        """Offerte già estratte da questa pagina, se è quella salvata e il parser non è cambiato"""
+        if self.path is None or not getattr(response, 'from_cache', False):
+            return None
+        row = self._connection().execute(
+            "SELECT jobs FROM responses WHERE url = ? AND parser = ? AND digest = ?",
+            (response.cache_url, parser, hashlib.sha256(response.content).hexdigest()),
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+    
+    def save_jobs(self, response, parser, jobs):
+        if self.path is None or not hasattr(response, 'cache_url'):
+            return
+        self._connection().execute(
+            "UPDATE responses SET parser = ?, jobs = ? WHERE url = ? AND digest = ?",
+            (parser, json.dumps(jobs, ensure_ascii=False), response.cache_url, hashlib.sha256(response.content).hexdigest()),
+        )
+
+
+# Parametri di tracciamento che cambiano tra pagine e ricerche senza cambiare l'offerta
+TRACKING_PARAMS = {'refid', 'trackingid', 'position', 'pagenum', 'from', 'tk', 'vjs', 'fromage', 'advn', 'ad', 'sjdu'}
+
+
+def normalize_link(link):
+    """Link canonico: schema e host minuscoli, senza frammento, parametri di tracciamento e slash finale"""
+    if not link or link == "N/A":
+        return ""
+    parts = urlparse(link.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_')]
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), '', urlencode(sorted(query)), ''))
+
+
+def _normalize_text(text):
+    return ' '.join(str(text or '').casefold().split())
+
+
+def job_key(job):
+    """Chiave di deduplicazione: il link normalizzato, o titolo + azienda se manca il link"""
+    link = normalize_link(job.get("link"))
+    if link:
+        return link
+    return f"{_normalize_text(job.get('title'))}|{_normalize_text(job.get('company'))}"
+
+
+def deduplicate_jobs(jobs):
+    """Tiene la prima occorrenza di ogni offerta (stessa chiave), nell'ordine originale"""
+    seen = set()
+    unique = []
+    for job in jobs:
+        key = job_key(job)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(job)
+    return unique
+
+
 class JobScraper(ABC):
     """Classe astratta per definire l'interfaccia dei scraper"""
     
-    def __init__(self, base_url, headers=None):
+    # Secondi per cui una pagina di risultati in cache è usata senza richiesta (0: sempre richiesta condizionale)
+    cache_freshness = 0
+    
+    def __init__(self, base_url, headers=None, cache_path=SCRAPER_CACHE_PATH):
         self.base_url = base_url
         self.headers = headers or {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        self.session = requests.Session()
+        self.session = CachedSession(cache_path, self.cache_freshness)
         self.session.headers.update(self.headers)
     
     @abstractmethod
@@ -37,13 +215,17 @@ class JobScraper(ABC):
         """Estrae i dettagli di una singola offerta"""
         pass
     
+    def fetch(self, url):
+        """Singola richiesta HTTP, solleva requests.RequestException in caso di errore"""
+        response = self.session.get(url, timeout=10)
+        response.raise_for_status()
+        return response
+    
     def get_page(self, url, max_retries=3):
         """Effettua la richiesta HTTP con retry automatico"""
         for attempt in range(max_retries):
             try:
-                response = self.session.get(url, timeout=10)
-                response.raise_for_status()
-                return response
+                return self.fetch(url)
             except requests.RequestException as e:
                 logger.warning(f"Tentativo {attempt + 1} fallito per {url}: {e}")
                 if attempt < max_retries - 1:
@@ -52,6 +234,34 @@ class JobScraper(ABC):
                     logger.error(f"Impossibile recuperare {url}")
                     return None
     
+    def parse_page(self, response):
+        """Estrae le offerte da una pagina di risultati; None se la pagina non ha offerte"""
+        # Pagina non cambiata dall'ultima volta: le offerte sono già in cache
+        parser = f"{self.__class__.__name__}:{PARSER_VERSION}"
+        jobs = self.session.load_jobs(response, parser)
+        if jobs is not None:
+            return jobs
+        jobs = self._parse_page(response)
+        if jobs is not None:
+            self.session.save_jobs(response, parser, jobs)
+        return jobs
+    
+    def _parse_page(self, response):
+        soup = BeautifulSoup(response.content, 'html.parser')
+        job_listings = self.parse_job_listings(soup)
+        if not job_listings:
+            return None
+        
+        jobs = []
+        for job_element in job_listings:
+            try:
+                job_data = self.parse_job_details(job_element)
+                if job_data:
+                    jobs.append(job_data)
+            except Exception as e:
+                logger.warning(f"Errore nel parsing di un'offerta: {e}")
+        return jobs
+    
     def scrape_jobs(self, keyword, location="", max_pages=3):
         """Metodo principale per il scraping"""
         all_jobs = []
@@ -65,20 +275,13 @@ class JobScraper(ABC):
             if not response:
                 continue
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            job_listings = self.parse_job_listings(soup)
+            page_jobs = self.parse_page(response)
             
-            if not job_listings:
+            if page_jobs is None:
                 logger.info("Nessuna offerta trovata, interruzione")
                 break
             
-            for job_element in job_listings:
-                try:
-                    job_data = self.parse_job_details(job_element)
-                    if job_data:
-                        all_jobs.append(job_data)
-                except Exception as e:
-                    logger.warning(f"Errore nel parsing di un'offerta: {e}")
+            all_jobs.extend(page_jobs)
             
             # Pausa tra le richieste per evitare di essere bloccati
             time.sleep(random.uniform(1, 3))
@@ -88,6 +291,8 @@ class JobScraper(ABC):
 class IndeedScraper(JobScraper):
     """Scraper per Indeed.it"""
     
+    cache_freshness = 3600
+    
     def __init__(self):
         super().__init__("https://it.indeed.com")
     
@@ -127,11 +332,16 @@ class IndeedScraper(JobScraper):
             company_elem = job_element.find('span', class_='companyName') or job_element.find('a', {'data-testid': 'company-name'})
             company = company_elem.get_text(strip=True) if company_elem else "N/A"
             
+            # Località (la data di Indeed è solo relativa, "3 giorni fa", quindi non la salviamo)
+            location_elem = job_element.find('div', class_='companyLocation') or job_element.find('div', {'data-testid': 'text-location'})
+            location = location_elem.get_text(strip=True) if location_elem else ""
+            
             return {
                 "title": title,
                 "link": link,
                 "description": description,
                 "company": company,
+                "location": location,
                 "source": "Indeed"
             }
         except Exception as e:
@@ -141,6 +351,8 @@ class IndeedScraper(JobScraper):
 class LinkedInScraper(JobScraper):
     """Scraper for LinkedIn """
     
+    cache_freshness = 1800
+    
     def __init__(self):
         super().__init__("https://www.linkedin.com")
     
@@ -170,11 +382,19 @@ class LinkedInScraper(JobScraper):
             # Descrizione (limitata su LinkedIn)
             description = f"Posizione presso {company}"
             
+            # Località e data di pubblicazione (ISO, es. 2024-05-10)
+            location_elem = job_element.find('span', class_='job-search-card__location')
+            location = location_elem.get_text(strip=True) if location_elem else ""
+            time_elem = job_element.find('time')
+            posted_at = time_elem.get('datetime', "") if time_elem else ""
+            
             return {
                 "title": title,
                 "link": link,
                 "description": description,
                 "company": company,
+                "location": location,
+                "posted_at": posted_at,
                 "source": "LinkedIn"
             }
         except Exception as e:
@@ -184,6 +404,8 @@ class LinkedInScraper(JobScraper):
 class InfoJobsScraper(JobScraper):
     """Scraper per InfoJobs.it"""
     
+    cache_freshness = 3600
+    
     def __init__(self):
         super().__init__("https://www.infojobs.it")
     
@@ -212,32 +434,211 @@ class InfoJobsScraper(JobScraper):
             company_elem = job_element.find('div', class_='company-name') or job_element.find('strong')
             company = company_elem.get_text(strip=True) if company_elem else "N/A"
             
+            # Località
+            location_elem = job_element.find(class_='location') or job_element.find(class_='city')
+            location = location_elem.get_text(strip=True) if location_elem else ""
+            
             return {
                 "title": title,
                 "link": link,
                 "description": description,
                 "company": company,
+                "location": location,
                 "source": "InfoJobs"
             }
         except Exception as e:
             logger.error(f"Errore nel parsing InfoJobs: {e}")
             return None
 
+@dataclass
+class ScrapeJob:
+    """Una ricerca da eseguire: sito, keyword, location e numero di pagine"""
+    site: str
+    keyword: str
+    location: str = ""
+    max_pages: int = 2
+
+
+def build_scrape_jobs(keywords, locations=("",), sites=None, max_pages=2, available_sites=()):
+    """Crea la lista di ricerche per tutte le combinazioni keyword x location x sito"""
+    sites = list(sites) if sites is not None else list(available_sites)
+    return [
+        ScrapeJob(site, keyword, location, max_pages)
+        for keyword in keywords
+        for location in locations
+        for site in sites
+    ]
+
+
+class TokenBucket:
+    """Rate limiter a token bucket: `rate` richieste al secondo con burst fino a `capacity`"""
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncScrapeEngine:
+    """Esegue molte ricerche in parallelo su tutti i siti.
+    
+    Siti e pagine vengono scaricati in concorrenza (al massimo `concurrency`
+    richieste in volo), con un token bucket per host al posto delle pause fisse
+    e backoff esponenziale con jitter sui retry. Le richieste passano dalla
+    `session` di ogni scraper (connection pooling di requests/urllib3) in un
+    thread, quindi build_search_url / parse_job_listings / parse_job_details
+    delle sottoclassi funzionano senza modifiche.
+    """
+    
+    def __init__(self, scrapers, concurrency=8, rate_per_host=0.5, burst=2, rate_limits=None,
+                 max_retries=3, backoff_base=1.0, backoff_max=30.0):
+        self.scrapers = scrapers
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.rate_limits = rate_limits or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets = {}
+        self._semaphore = None
+        
+        # Un pool di connessioni per host grande quanto la concorrenza
+        for scraper in scrapers.values():
+            adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            scraper.session.mount('http://', adapter)
+            scraper.session.mount('https://', adapter)
+    
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_limits.get(host, self.rate_per_host), self.burst)
+        return self._buckets[host]
+    
+    def _backoff(self, attempt):
+        """Backoff esponenziale con full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    async def fetch(self, scraper, url):
+        """Scarica una pagina rispettando rate limit e concorrenza, con retry"""
+        for attempt in range(self.max_retries):
+            await self._bucket(url).acquire()
+            try:
+                async with self._semaphore:
+                    return await asyncio.to_thread(scraper.fetch, url)
+            except requests.RequestException as e:
+                logger.warning(f"Tentativo {attempt + 1} fallito per {url}: {e}")
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self._backoff(attempt))
+        logger.error(f"Impossibile recuperare {url}")
+        return None
+    
+    async def _scrape_page(self, scraper, job, page):
+        url = scraper.build_search_url(job.keyword, job.location, page)
+        response = await self.fetch(scraper, url)
+        if response is None:
+            return []
+        # Il parsing HTML è CPU-bound: fuori dall'event loop
+        return await asyncio.to_thread(scraper.parse_page, response)
+    
+    async def scrape_job(self, job):
+        """Tutte le pagine di una ricerca in parallelo, nello stesso ordine della versione sequenziale"""
+        scraper = self.scrapers.get(job.site)
+        if scraper is None:
+            logger.warning(f"Scraper per {job.site} non trovato")
+            return []
+        
+        logger.info(f"Scraping di {job.max_pages} pagine per '{job.keyword}' su {scraper.__class__.__name__}")
+        pages = await asyncio.gather(*[self._scrape_page(scraper, job, page) for page in range(job.max_pages)])
+        
+        jobs = []
+        for page_jobs in pages:
+            if page_jobs is None:
+                # Come in scrape_jobs: le pagine dopo una pagina vuota non contano
+                break
+            jobs.extend(page_jobs)
+        logger.info(f"Trovate {len(jobs)} offerte su {job.site} per '{job.keyword}'")
+        return jobs
+    
+    async def run(self, jobs):
+        """Esegue tutte le ricerche e restituisce le offerte nell'ordine delle ricerche"""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*[self.scrape_job(job) for job in jobs], return_exceptions=True)
+        
+        all_results = []
+        for job, jobs_found in zip(jobs, results):
+            if isinstance(jobs_found, Exception):
+                logger.error(f"Errore durante lo scraping di {job.site}: {jobs_found}")
+                continue
+            all_results.extend(jobs_found)
+        return all_results
+
 class JobScraperManager:
     """Manager per gestire multiple scrapers"""
     
-    def __init__(self):
+    def __init__(self, cache_freshness=None):
         self.scrapers = {
             'indeed': IndeedScraper(),
             'linkedin': LinkedInScraper(),
             'infojobs': InfoJobsScraper()
         }
+        # Freschezza della cache per sito, es. {'linkedin': 600}
+        for site_name, seconds in (cache_freshness or {}).items():
+            if site_name in self.scrapers:
+                self.scrapers[site_name].session.freshness = seconds
+    
+    def _start_run(self):
+        for scraper in self.scrapers.values():
+            scraper.session.reset_stats()
+    
+    def _finish_run(self, results):
+        """Deduplica le offerte della run e riporta le statistiche della cache"""
+        unique = deduplicate_jobs(results)
+        if len(unique) < len(results):
+            logger.info(f"Rimossi {len(results) - len(unique)} duplicati ({len(unique)} offerte uniche)")
+        self.log_cache_stats()
+        return unique
+    
+    def cache_stats(self):
+        """Statistiche della cache HTTP per sito e totali dall'inizio dell'ultima run"""
+        per_site = {name: dict(scraper.session.stats) for name, scraper in self.scrapers.items()}
+        total = {key: sum(stats[key] for stats in per_site.values()) for key in ("hits", "revalidated", "misses",
+                                                                                  "bytes_downloaded", "bytes_saved")}
+        for stats in list(per_site.values()) + [total]:
+            requests_count = stats["hits"] + stats["revalidated"] + stats["misses"]
+            stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / requests_count, 3) if requests_count else 0.0
+        return {"sites": per_site, "total": total}
+    
+    def log_cache_stats(self):
+        stats = self.cache_stats()
+        for name, site in list(stats["sites"].items()) + [("totale", stats["total"])]:
+            if site["hits"] + site["revalidated"] + site["misses"] == 0:
+                continue
+            logger.info(
+                f"Cache HTTP {name}: hit rate {site['hit_rate']:.0%} ({site['hits']} fresche, "
+                f"{site['revalidated']} non modificate, {site['misses']} scaricate), "
+                f"{site['bytes_downloaded'] / 1024:.0f} KB scaricati, {site['bytes_saved'] / 1024:.0f} KB risparmiati"
+            )
     
     def scrape_all_sites(self, keyword, location="", max_pages=2, sites=None):
         """Scrape da tutti i siti o solo da quelli specificati"""
         if sites is None:
             sites = list(self.scrapers.keys())
         
+        self._start_run()
         all_results = []
         
         for site_name in sites:
@@ -253,7 +654,26 @@ class JobScraperManager:
             else:
                 logger.warning(f"Scraper per {site_name} non trovato")
         
-        return all_results
+        return self._finish_run(all_results)
+    
+    async def scrape_many_async(self, jobs, concurrency=8, **engine_options):
+        """Esegue in parallelo una lista di ScrapeJob (più siti, keyword e location)"""
+        self._start_run()
+        engine = AsyncScrapeEngine(self.scrapers, concurrency=concurrency, **engine_options)
+        return self._finish_run(await engine.run(jobs))
+    
+    def scrape_many(self, jobs, concurrency=8, **engine_options):
+        """Versione sincrona di scrape_many_async"""
+        return asyncio.run(self.scrape_many_async(jobs, concurrency, **engine_options))
+    
+    def scrape_all_sites_async(self, keywords, locations=("",), max_pages=2, sites=None, concurrency=8, **engine_options):
+        """Come scrape_all_sites, ma concorrente e con più keyword/location"""
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        if isinstance(locations, str):
+            locations = [locations]
+        jobs = build_scrape_jobs(keywords, locations, sites, max_pages, available_sites=self.scrapers.keys())
+        return self.scrape_many(jobs, concurrency, **engine_options)
     
     def save_to_json(self, data, filename="job_results.json"):
         """Salva i risultati in un file JSON"""
@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import zipfile
+from io import BytesIO
+import httpx
+import pytest
+from benchmarks.synthetic import make_cv_docx, make_cv_pdf
+from web.batch import MAX_FILE_SIZE, BatchError, close_documents, read_zip_documents
+
+def make_zip(members):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+def test_zip_members_are_checked_first_then_spooled_one_by_one():
+    pdf, docx = make_cv_pdf(1, seed=1), make_cv_docx(1, seed=2)
+    content = make_zip([('a.pdf', pdf), ('notes.txt', b'skipped'), ('b.docx', docx),
+                        ('huge.pdf', b'0' * (MAX_FILE_SIZE + 1))])
+
+    documents = read_zip_documents(content)
+    assert [name for name, _ in documents] == ['a.pdf', 'b.docx', 'huge.pdf']
+    (_, first), (_, second), (_, huge) = documents
+    assert huge is None
+    # every CV in its own temporary file, deleted with the batch
+    assert first.on_disk and second.on_disk
+    with open(first.source(), 'rb') as f:
+        assert f.read() == pdf
+    paths = [first.source(), second.source()]
+    close_documents(documents)
+    assert not any(os.path.exists(path) for path in paths)
+
+    # limits checked on the archive's directory, before anything is decompressed
+    with pytest.raises(BatchError, match="Too many files"):
+        read_zip_documents(content, max_files=1)
+    with pytest.raises(BatchError, match="too large once decompressed"):
+        read_zip_documents(content, max_bytes=len(pdf) + len(docx) - 1)
+    with pytest.raises(BatchError, match="Invalid zip"):
+        read_zip_documents(b'PK\x03\x04 not a zip')
+
+def test_batch_k_is_bounded():
+    from fastapi import FastAPI
+    from web.api import router
+    app = FastAPI()
+    app.include_router(router)
+
+    async def post(k):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(f"/api/analyze/batch?k={k}",
+                                     files={"cvFiles": ("cv.txt", b"text", "text/plain")})
+
+    for k in (0, -1, 100000):
+        assert asyncio.run(post(k)).status_code == 422
+    # a valid k gets as far as the file type check
+    assert asyncio.run(post(9)).status_code == 400
+
+class FakePool:
+    """Pool with 1 worker and 1 queued job: rejects anything beyond that, like ExtractionPool"""
+    max_workers, queue_size = 1, 1
+
+    def __init__(self):
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def run(self, fn, source):
+        from web.extraction_pool import ExtractionQueueFull
+        if self.in_flight >= self.max_workers + self.queue_size:
+            self.rejected += 1
+            raise ExtractionQueueFull()
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(0.01)
+            if source == b'broken':
+                raise RuntimeError("worker died")
+            return "python developer"
+        finally:
+            self.in_flight -= 1
+
+class FakeSpool:
+    def __init__(self, content):
+        self.content = content
+
+    def source(self):
+        return self.content
+
+    def close(self):
+        pass
+
+def test_batch_waits_for_slots_and_reports_failures_per_file(monkeypatch):
+    import json
+    import web.batch as batch
+    pool = FakePool()
+    monkeypatch.setattr(batch, 'extraction_pool', pool)
+    monkeypatch.setattr(batch, 'find_top_matches_batch', lambda texts, k, filters=None: [[] for _ in texts])
+    documents = [(f'cv{i}.pdf', FakeSpool(b'broken' if i == 3 else b'pdf')) for i in range(30)]
+
+    async def collect():
+        return [json.loads(line) async for line in batch.stream_batch_results(documents)]
+
+    lines = asyncio.run(collect())
+    # far more files than slots: none is rejected, they wait their turn
+    assert pool.rejected == 0
+    assert len(lines) == 30
+    failed = [line for line in lines if not line['success']]
+    assert [line['file'] for line in failed] == ['cv3.pdf']
+    assert failed[0]['error'] == "Could not read this file."
@@ -0,0 +1,40 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from io import BytesIO
+from pdfminer.high_level import extract_text
+from benchmarks.report import compare_to_baseline, summarize
+from benchmarks.synthetic import make_cv_lines, make_cv_pdf, make_job_corpus
+
+def test_synthetic_inputs_are_deterministic_and_extractable():
+    assert make_job_corpus(50, seed=3).equals(make_job_corpus(50, seed=3))
+    pdf = make_cv_pdf(3, seed=7, lines_per_page=5)
+    text = extract_text(BytesIO(pdf))
+    assert make_cv_lines(15, seed=7)[0] in text
+    assert make_cv_lines(15, seed=7)[-1] in text
+
+def test_compare_to_baseline_flags_slower_medians_only():
+    baseline = {"fast": summarize([0.010] * 5), "slow": summarize([0.010] * 5), "tiny": summarize([0.00001] * 5)}
+    results = {"fast": summarize([0.011] * 5), "slow": summarize([0.020] * 5), "tiny": summarize([0.00003] * 5),
+               "new": summarize([0.5])}
+
+    rows = {row[0]: row for row in compare_to_baseline(results, baseline, tolerance=0.2)}
+
+    assert set(rows) == {"fast", "slow", "tiny"}
+    assert rows["slow"][4] and not rows["fast"][4]
+    # 3x slower, but only by 0.02 ms: timer noise
+    assert not rows["tiny"][4]
+
+def test_load_test_runs_the_procfile_command_with_its_own_workers_and_port():
+    from benchmarks.loadtest import gunicorn_argv, procfile_command
+
+    env, argv = procfile_command()
+    assert env["CV_CACHE_BACKEND"] == env["CV_SESSION_BACKEND"] == 'sqlite' and argv[0] == 'gunicorn'
+    command = gunicorn_argv(argv, 2, '127.0.0.1:8123')
+
+    assert command[:3] == [sys.executable, '-m', 'gunicorn']
+    # every other option of the Procfile is kept
+    assert 'main:app' in command and command[command.index('-k') + 1] == 'uvicorn.workers.UvicornWorker'
+    assert command.count('-w') == 1 and command[command.index('-w') + 1] == '2'
+    assert command.count('--bind') == 1 and command[command.index('--bind') + 1] == '127.0.0.1:8123'
@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import pytest
+from web.cache import LRUCache, SqliteCache, AnalysisCache
+
+def test_lru_cache_evicts_least_recently_used_entries():
+    cache = LRUCache(max_entries=2, max_bytes=10_000, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_respects_byte_limit_and_ttl():
+    cache = LRUCache(max_entries=100, max_bytes=200, ttl=0.01)
+    cache.set("big", "x" * 500)
+    assert cache.get("big") is None
+
+    cache.set("small", "y")
+    time.sleep(0.02)
+    assert cache.get("small") is None
+
+
+def test_analysis_cache_drops_results_of_old_index_versions(tmp_path):
+    cache = AnalysisCache(SqliteCache(path=str(tmp_path / "cache.sqlite"), max_entries=10, max_bytes=10_000, ttl=60))
+    cache.set_text("filehash", "python developer")
+    cache.set_matches("python developer", 9, "exact", "v1", ["match"])
+    assert cache.get_matches("python developer", 9, "exact", "v1") == ["match"]
+
+    assert cache.get_matches("python developer", 9, "exact", "v2") is None
+    assert cache.stats()["entries"] == 1
+    assert cache.get_text("filehash") == "python developer"
+
+
+def test_sqlite_cache_trims_by_count_and_bytes_in_one_statement(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SqliteCache(path=path, max_entries=3, max_bytes=10_000, ttl=60)
+    for key in "abcd":
+        cache.set(key, key)
+        time.sleep(0.001)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 3
+
+    # a second worker sees the totals kept by the triggers, and byte overflows evict oldest first
+    other = SqliteCache(path=path, max_entries=100, max_bytes=600, ttl=60)
+    other.set("big", "x" * 560)
+    assert other.get("b") is None and other.get("big") == "x" * 560
+    stats = other.stats()
+    assert stats["bytes"] <= 600
+    assert stats["entries"] == len([key for key in ("c", "d", "big") if other.get(key) is not None])
+
+
+def test_default_sqlite_path_is_in_a_private_directory(tmp_path):
+    from web.cache import private_state_path
+    state_dir = tmp_path / "state"
+    state_dir.mkdir(mode=0o777)
+    os.chmod(state_dir, 0o777)
+    path = private_state_path("cache.sqlite", str(state_dir))
+    assert path == str(state_dir / "cache.sqlite")
+    assert os.stat(state_dir).st_mode & 0o777 == 0o700
+
+    link = tmp_path / "link"
+    link.symlink_to(state_dir)
+    with pytest.raises(RuntimeError):
+        private_state_path("cache.sqlite", str(link))
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import random as sparse_random
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from model.index import encode_string_column, open_index, write_index, write_index_version
+from web.explain import explain_matches
+from web.retrieval import exact_search
+
+def test_contributions_add_up_to_the_similarity_in_every_precision(tmp_path):
+    matrix = normalize(sparse_random(300, 200, density=0.05, format='csr', random_state=0))
+    queries = normalize(sparse_random(10, 200, density=0.1, format='csr', random_state=1))
+    columns = {'Company': encode_string_column([f'Company {i}' for i in range(300)])}
+
+    for precision in ('float64', 'float32', 'uint8'):
+        write_index_version(str(tmp_path / precision), matrix, np.ones(200), [f't{i}' for i in range(200)],
+                            columns, {'norm': 'l2'}, precision=precision)
+        index = open_index(str(tmp_path / precision))
+        for q in range(queries.shape[0]):
+            result = exact_search(index, queries[q], 9)
+            every_term = explain_matches(index, queries[q], result.rows, n_terms=200)
+            for row, score, terms in zip(result.rows, result.scores, every_term):
+                assert np.isclose(sum(t["contribution"] for t in terms), score, rtol=1e-4, atol=1e-6)
+                # only the terms the CV and the job ad share, largest first
+                shared = set(queries[q].indices) & set(index.matrix[row].indices)
+                assert {t["term"] for t in terms} == {f't{i}' for i in shared}
+                contributions = [t["contribution"] for t in terms]
+                assert contributions == sorted(contributions, reverse=True)
+            top = explain_matches(index, queries[q], result.rows, n_terms=3)
+            assert [terms[:3] for terms in every_term] == top
+
+def test_explanation_names_the_shared_words(tmp_path):
+    jobs = pd.DataFrame({
+        'Company': ['Acme', 'Globex'],
+        'Role': ['Developer', 'Analyst'],
+        'Description': ['python developer django python', 'data analyst sql excel'],
+        'Job Link': ['https://jobs.example/0', 'https://jobs.example/1'],
+    })
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(jobs['Description'])
+
+    write_index(str(tmp_path), vectorizer, matrix, jobs, precision='float64')
+    index = open_index(str(tmp_path))
+    query = index.vectorizer.transform(["senior python and sql developer"])
+    explanation = explain_matches(index, query, [0, 1])
+
+    assert [t["term"] for t in explanation[0]] == ['python', 'developer']
+    assert [t["term"] for t in explanation[1]] == ['sql']
+    # no shared term, nothing to explain
+    assert explain_matches(index, index.vectorizer.transform(["gardening"]), [0]) == [[]]
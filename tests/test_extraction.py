@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from io import BytesIO
+from benchmarks.synthetic import make_cv_docx, make_cv_lines, make_cv_pdf
+from web.extraction import (detect_format, extract_docx_text, extract_document_with_stats, extract_pdf_text_capped,
+                            extract_pdf_text_fast)
+
+def test_docx_text_is_streamed_from_the_document_xml(tmp_path):
+    docx = make_cv_docx(2, seed=4, lines_per_page=5)
+    lines = make_cv_lines(10, seed=4)
+
+    text, truncated = extract_docx_text(docx)
+    # one line per paragraph, an empty one for the page break
+    assert text.split('\n') == lines[:5] + [''] + lines[5:] + ['']
+    assert not truncated
+
+    text, truncated = extract_docx_text(docx, max_chars=30)
+    assert truncated and len(text) == 30 and text == lines[0][:30]
+
+    # dispatched on the content, spooled to disk or not
+    path = tmp_path / "cv.bin"
+    path.write_bytes(docx)
+    for source in (docx, str(path)):
+        assert detect_format(source) == 'docx'
+        processed, stats = extract_document_with_stats(source)
+        assert stats["format"] == 'docx' and stats["extract"] > 0 and not stats["truncated"]
+        assert processed.split()[:3] == ['be', 'csharp', 'will']
+    assert detect_format(b"plain text") is None
+    assert extract_document_with_stats(b"PK\x03\x04 not a zip")[0] == ""
+
+def test_pdf_fast_mode_keeps_the_words_and_stops_early():
+    pdf = make_cv_pdf(4, seed=5, lines_per_page=5)
+
+    fast, pages_read, truncated = extract_pdf_text_fast(BytesIO(pdf))
+    full, _, _ = extract_pdf_text_capped(BytesIO(pdf))
+    assert sorted(fast.split()) == sorted(full.split())
+    # one line per text line, as with the layout analysis
+    assert [line for line in fast.split('\n') if line] == make_cv_lines(20, seed=5)
+    assert pages_read == 4 and not truncated
+
+    # the character cap stops in the middle of the first page
+    text, pages_read, truncated = extract_pdf_text_fast(BytesIO(pdf), max_chars=40)
+    assert pages_read == 1 and truncated and len(text) == 40
+
+    _, stats = extract_document_with_stats(pdf, max_pages=2, max_chars=0, pdf_mode='fast')
+    assert stats["format"] == 'pdf' and stats["pages"] == 4 and stats["pages_read"] == 2 and stats["truncated"]
+
+def test_pdf_read_to_the_end_is_not_parsed_again_for_its_page_count(monkeypatch):
+    import web.extraction
+    pdf = make_cv_pdf(3, seed=6, lines_per_page=5)
+    counted = []
+    monkeypatch.setattr(web.extraction, 'count_pdf_pages', lambda source: counted.append(source) or 3)
+
+    for mode in ('fast', 'full'):
+        _, stats = extract_document_with_stats(pdf, max_pages=5, max_chars=0, pdf_mode=mode)
+        assert stats["pages"] == stats["pages_read"] == 3 and not stats["truncated"]
+    assert counted == []
+
+    _, stats = extract_document_with_stats(pdf, max_pages=1, max_chars=0, pdf_mode='fast')
+    assert stats["pages"] == 3 and stats["pages_read"] == 1 and len(counted) == 1
+
+def test_the_app_imports_without_pdfminer():
+    import subprocess
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    # only the extraction processes load pdfminer, on their first PDF
+    loaded = subprocess.run(
+        [sys.executable, '-c', "import sys, main; print(sorted({m.split('.')[0] for m in sys.modules}))"],
+        cwd=root, capture_output=True, text=True, check=True).stdout
+    assert 'pdfminer' not in loaded and 'sklearn' not in loaded and 'pandas' not in loaded
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import time
+import pytest
+from web.extraction_pool import ExtractionPool, ExtractionQueueFull, ExtractionTimeout
+
+def test_jobs_beyond_the_workers_and_the_queue_are_rejected():
+    from web.api import server_busy_error
+    pool = ExtractionPool(max_workers=1, queue_size=1, timeout=10)
+
+    async def run():
+        running = [asyncio.ensure_future(pool.run(time.sleep, 0.5)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert pool.in_flight == 2
+        with pytest.raises(ExtractionQueueFull):
+            await pool.run(abs, -1)
+        await asyncio.gather(*running)
+        # slots are given back once the jobs finish
+        assert pool.in_flight == 0
+        assert await pool.run(abs, -1) == 1
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert server_busy_error().status_code == 503
+
+def test_a_timed_out_job_keeps_its_slot_until_it_really_finishes():
+    from web.api import extraction_timeout_error
+    pool = ExtractionPool(max_workers=1, queue_size=0, timeout=0.3)
+
+    async def run():
+        # warm up the process, so the timeout only covers the job
+        await pool.run(abs, -1)
+        with pytest.raises(ExtractionTimeout):
+            await pool.run(time.sleep, 1.5)
+        # still running in its process: no room for another job
+        assert pool.in_flight == 1
+        with pytest.raises(ExtractionQueueFull):
+            await pool.run(abs, -1)
+        deadline = time.monotonic() + 10
+        while pool.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert pool.in_flight == 0
+        assert await pool.run(abs, -2) == 2
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert extraction_timeout_error().status_code == 504
+
+def test_a_dead_worker_process_is_replaced():
+    from concurrent.futures.process import BrokenProcessPool
+    pool = ExtractionPool(max_workers=1, queue_size=0, timeout=10)
+
+    async def run():
+        # the worker process exits as if killed by the OOM killer
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(os._exit, 1)
+        assert pool.in_flight == 0
+        # the broken executor is rebuilt on the next submission
+        assert await pool.run(abs, -3) == 3
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
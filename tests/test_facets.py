@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+from sklearn.preprocessing import normalize
+from model.facets import FacetIndex, JobFilters, write_facets
+from web.retrieval import exact_search, filtered_search
+from test_retrieval import InMemoryIndex
+
+COLUMNS = {
+    'Company': ['Acme', 'Globex', 'acme ', 'Initech', 'ACME', 'Globex'],
+    'Role': ['Python Developer', 'Data Engineer', 'Senior Python Engineer', 'Java Developer', 'Data Scientist', ''],
+    'Source': ['LinkedIn', 'Indeed', 'LinkedIn', 'InfoJobs', 'Indeed', 'LinkedIn'],
+    'Location': ['Milano, Lombardia', 'Roma', 'Milano', 'Torino', 'Roma, Lazio', ''],
+    'Posted At': ['2024-05-01', '2024-05-03T10:00:00', '', '2024-04-20', '2024-05-03', 'ieri'],
+}
+
+
+@pytest.mark.parametrize("stored", [False, True])
+def test_candidate_rows_combine_facets(tmp_path, stored):
+    if stored:
+        write_facets(str(tmp_path), COLUMNS)
+        facets = FacetIndex.load(str(tmp_path))
+    else:
+        facets = FacetIndex.build(COLUMNS)
+
+    assert facets.candidate_rows(JobFilters()) is None
+    assert facets.candidate_rows(JobFilters(company=('acme',))).tolist() == [0, 2, 4]
+    assert facets.candidate_rows(JobFilters(company=('Acme', 'initech'))).tolist() == [0, 2, 3, 4]
+    assert facets.candidate_rows(JobFilters(role='python engineer')).tolist() == [2]
+    assert facets.candidate_rows(JobFilters(company=('acme',), source=('Indeed',))).tolist() == [4]
+    assert facets.candidate_rows(JobFilters(location='milano')).tolist() == [0, 2]
+    assert facets.candidate_rows(JobFilters(posted_after='2024-05-01')).tolist() == [0, 1, 4]
+    assert facets.candidate_rows(JobFilters(posted_before='2024-05-01', role='developer')).tolist() == [0, 3]
+    assert facets.candidate_rows(JobFilters(role='cobol')).tolist() == []
+
+
+def test_invalid_filters_are_rejected():
+    with pytest.raises(ValueError):
+        JobFilters(posted_after='last week')
+    with pytest.raises(ValueError):
+        FacetIndex.build({'Company': ['Acme']}).check(JobFilters(location='Milano'))
+
+
+def test_filtered_search_matches_exact_search_on_the_subset():
+    matrix = normalize(sparse_random(500, 200, density=0.05, format='csr', random_state=0))
+    tombstones = np.zeros(500, dtype=bool)
+    tombstones[::7] = True
+    index = InMemoryIndex(matrix, tombstones)
+    rows = np.arange(0, 500, 3)
+    query = normalize(sparse_random(1, 200, density=0.1, format='csr', random_state=1))
+
+    result = filtered_search(index, query, 9, rows)
+
+    # Same ranking as exact search with every row outside the filter removed
+    excluded = np.ones(500, dtype=bool)
+    excluded[rows] = False
+    expected = exact_search(InMemoryIndex(matrix, tombstones | excluded), query, 9)
+    assert result.rows.tolist() == expected.rows.tolist()
+    assert np.allclose(result.scores, expected.scores)
+    assert result.candidates_scored == int((~tombstones[rows]).sum())
+
+def test_filtered_requests_report_the_mode_that_ran(tmp_path):
+    from unittest.mock import patch
+    from test_registry import build_index
+    from web import utils
+    from web.metrics import metrics
+    from web.registry import IndexRegistry
+    build_index(tmp_path)
+    registry = IndexRegistry(str(tmp_path))
+    registry.load()
+
+    with patch('web.utils.index_registry', registry):
+        _, _, stats = utils.rank_job_ads("python developer", 9, 'pruned')
+        assert stats["mode"] == 'pruned' and 'requested_mode' not in stats
+        _, result, stats = utils.rank_job_ads("python developer", 9, 'pruned', JobFilters(company=['Acme']))
+        # the filtered rows are scored directly, whatever the mode asked for
+        assert stats["mode"] == 'filtered' and stats["requested_mode"] == 'pruned'
+        assert stats["filtered_rows"] == 1 and result.rows.tolist() == [0]
+        # no dense vectors in this index: approximate runs as exact
+        _, _, stats = utils.rank_job_ads("python developer", 9, 'approximate')
+        assert stats["mode"] == 'exact' and stats["requested_mode"] == 'approximate'
+
+    latencies = metrics.snapshot()
+    assert any('cv_search_seconds' in key and 'filtered' in key for key in latencies)
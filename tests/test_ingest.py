@@ -0,0 +1,116 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from model.index import open_index, write_index
+from model.ingest import ingest_jobs
+from model.train_model import preprocess_corpus
+from web.registry import IndexRegistry
+from web.retrieval import exact_search
+
+def make_jobs(descriptions, start=0):
+    return pd.DataFrame({
+        'Company': [f'Company {start + i}' for i in range(len(descriptions))],
+        'Role': ['Developer'] * len(descriptions),
+        'Description': descriptions,
+        'Job Link': [f'https://jobs.example/{start + i}' for i in range(len(descriptions))],
+    })
+
+BASE_JOBS = make_jobs([
+    'python developer with django and postgres experience',
+    'java engineer building spring microservices',
+    'data scientist python pandas machine learning',
+    'frontend developer react typescript css',
+])
+
+def build_index(index_dir, precision='float64', dense_dims=0):
+    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+    matrix = vectorizer.fit_transform(preprocess_corpus(BASE_JOBS['Description'].tolist()))
+    write_index(str(index_dir), vectorizer, matrix, BASE_JOBS, precision=precision, dense_dims=dense_dims)
+
+def test_ingest_appends_rows_and_tombstones_expired_jobs(tmp_path):
+    build_index(tmp_path)
+    new_jobs = make_jobs(['senior python developer django rest', 'java spring developer'], start=10)
+    ingest_jobs(pd.concat([new_jobs, BASE_JOBS.iloc[:1]]), str(tmp_path),
+                expired_links=['https://jobs.example/0'], refresh_idf=False)
+
+    index = open_index(str(tmp_path))
+    assert index.n_rows == 6  # the already indexed job was skipped
+    assert index.n_live == 5
+    query = index.vectorizer.transform(['python django developer'])
+    links = [index.columns['Job Link'][row] for row in exact_search(index, query, 9).rows]
+    assert links[0] == 'https://jobs.example/10'
+    assert 'https://jobs.example/0' not in links
+    assert len(links) == 5
+
+def test_ingest_keeps_the_precision_of_a_compact_index(tmp_path):
+    build_index(tmp_path, precision='uint8')
+    ingest_jobs(make_jobs(['senior python developer django rest'], start=10), str(tmp_path), refresh_idf=False)
+
+    index = open_index(str(tmp_path))
+    assert index.precision == 'uint8' and index.matrix.dtype == np.uint8
+    query = index.vectorizer.transform(['python django developer'])
+    links = [index.columns['Job Link'][row] for row in exact_search(index, query, 2).rows]
+    assert links == ['https://jobs.example/10', 'https://jobs.example/0']
+
+def test_ingest_only_encodes_the_new_rows_of_a_quantized_index(tmp_path):
+    build_index(tmp_path, precision='uint8')
+    base = open_index(str(tmp_path))
+    description = 'python developer django postgres java spring react pandas machine learning'
+    ingest_jobs(make_jobs([description], start=10), str(tmp_path), refresh_idf=False)
+
+    # the indexed rows keep their codes and the version its scale
+    index = open_index(str(tmp_path))
+    assert index.weight_scale == base.weight_scale
+    assert np.array_equal(index.matrix[:4].toarray(), base.matrix.toarray())
+    new_row = index.vectorizer.transform(preprocess_corpus([description]))
+    assert np.allclose(index.float_matrix()[4].toarray(), new_row.toarray(), atol=index.weight_scale)
+
+    # a weight above the largest code: every row is encoded again with a wider scale
+    ingest_jobs(make_jobs(['python'], start=20), str(tmp_path), refresh_idf=False)
+    widened = open_index(str(tmp_path))
+    assert widened.weight_scale > base.weight_scale
+    assert widened.matrix[5].data.tolist() == [255]
+    assert np.allclose(widened.float_matrix()[:4].toarray(), base.float_matrix().toarray(), atol=widened.weight_scale)
+
+def test_ingest_projects_new_rows_with_the_existing_projection(tmp_path):
+    build_index(tmp_path, dense_dims=3)
+    base = open_index(str(tmp_path))
+    ingest_jobs(make_jobs(['senior python developer django rest'], start=10), str(tmp_path), refresh_idf=False)
+
+    index = open_index(str(tmp_path))
+    assert index.dense.shape == (5, 3) and index.meta['dense'] == {'method': 'svd', 'dims': 3}
+    assert np.array_equal(index.projection, base.projection)
+    assert np.allclose(index.dense[:4], base.dense)
+    assert np.allclose(index.dense[4], index.matrix[4] @ index.projection, atol=1e-6)
+
+def test_idf_refresh_matches_a_fresh_fit_on_the_live_jobs(tmp_path):
+    build_index(tmp_path)
+    new_jobs = make_jobs(['python developer kubernetes docker', 'react developer python'], start=10)
+    ingest_jobs(new_jobs, str(tmp_path), expired_links=['https://jobs.example/1'], refresh_idf=True)
+
+    index = open_index(str(tmp_path))
+    live_jobs = pd.concat([BASE_JOBS.drop(index=1), new_jobs])
+    assert index.tombstones is None
+    assert [index.columns['Job Link'][row] for row in range(index.n_rows)] == live_jobs['Job Link'].tolist()
+
+    fresh = TfidfVectorizer(stop_words='english', vocabulary=index.terms)
+    expected = fresh.fit_transform(preprocess_corpus(live_jobs['Description'].tolist()))
+    assert np.allclose(index.idf, fresh.idf_)
+    assert np.allclose(index.matrix.toarray(), expected.toarray())
+
+def test_registry_swaps_to_the_new_version(tmp_path):
+    build_index(tmp_path)
+    registry = IndexRegistry(str(tmp_path), check_interval=0)
+    old_index = registry.current()
+
+    ingest_jobs(make_jobs(['rust systems engineer'], start=10), str(tmp_path), refresh_idf=False)
+
+    new_index = registry.current()
+    assert new_index.version != old_index.version
+    assert new_index.n_rows == old_index.n_rows + 1
+    # A request that already holds the old index can still use it
+    assert old_index.record(0)['Job Link'] == 'https://jobs.example/0'
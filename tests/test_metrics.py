@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+from web.metrics import MetricsRegistry
+
+def make_registry(directory=None):
+    registry = MetricsRegistry(directory=directory, flush_interval=3600)
+    registry.counter('requests_total', 'Requests')
+    registry.histogram('stage_seconds', 'Stage latency', buckets=(0.1, 1))
+    registry.callback('in_flight', 'gauge', 'Jobs in flight', lambda: 3)
+    return registry
+
+def test_histogram_renders_cumulative_buckets():
+    registry = make_registry()
+    for value in (0.05, 0.5, 0.7, 5):
+        registry.observe('stage_seconds', value, stage='extract')
+    registry.inc('requests_total', route='/api/analyze')
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE stage_seconds histogram' in lines
+    assert 'stage_seconds_bucket{stage="extract",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="extract",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="extract",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="extract"} 4' in lines
+    assert 'requests_total{route="/api/analyze"} 1' in lines
+    assert 'in_flight 3' in lines
+
+def test_workers_are_merged_through_the_shared_directory(tmp_path):
+    registry = make_registry(str(tmp_path))
+    registry.inc('requests_total', 2, route='/api/analyze')
+    registry.observe('stage_seconds', 0.5, stage='extract')
+
+    # Snapshot left by another worker that has exited since
+    dead_worker = make_registry()
+    dead_worker.inc('requests_total', 5, route='/api/analyze')
+    dead_worker.observe('stage_seconds', 0.05, stage='extract')
+    with open(tmp_path / 'metrics-999999999.json', 'w') as f:
+        json.dump(dead_worker.snapshot(), f)
+
+    lines = registry.render().splitlines()
+
+    assert 'requests_total{route="/api/analyze"} 7' in lines
+    assert 'stage_seconds_bucket{stage="extract",le="0.1"} 1' in lines
+    assert 'stage_seconds_count{stage="extract"} 2' in lines
+    # Gauges are per worker, and only for live workers
+    assert f'in_flight{{pid="{os.getpid()}"}} 3' in lines
+    assert not any(line.startswith('in_flight{pid="999999999"') for line in lines)
+
+def test_gunicorn_config_sets_a_shared_directory_and_clears_old_snapshots(tmp_path, monkeypatch):
+    import runpy
+    config = os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py')
+    monkeypatch.delenv('CV_METRICS_DIR', raising=False)
+    runpy.run_path(config)
+    assert os.environ['CV_METRICS_DIR'].endswith(f'-{os.getpid()}')
+
+    monkeypatch.setenv('CV_METRICS_DIR', str(tmp_path))
+    settings = runpy.run_path(config)
+    assert os.environ['CV_METRICS_DIR'] == str(tmp_path)
+    registry = make_registry(str(tmp_path))
+    registry.inc('requests_total')
+    registry.flush()
+    (tmp_path / 'metrics-1.json.tmp').write_text('{}')
+    (tmp_path / 'other.txt').write_text('kept')
+
+    # a new master starts: the snapshots of the previous workers are gone
+    settings['on_starting'](None)
+    assert sorted(os.listdir(tmp_path)) == ['other.txt']
+
+def test_gunicorn_config_sets_the_directory_before_web_metrics_is_imported():
+    import subprocess
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    env = {key: value for key, value in os.environ.items() if key != 'CV_METRICS_DIR'}
+    # A fresh interpreter, like the gunicorn master: nothing from web.* is imported yet
+    code = ("import os, runpy; runpy.run_path('gunicorn.conf.py'); import web.metrics; "
+            "print(web.metrics.metrics.directory); print(os.environ['CV_METRICS_DIR'])")
+    directory, configured = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True,
+                                           text=True, check=True).stdout.split()
+    assert directory == configured
+    assert 'cv-job-matching-metrics-' in directory
@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from model.index import open_index, write_index
+from model.ingest import ingest_jobs
+from model.near_duplicates import collapse_near_duplicates
+from model.train_model import preprocess_corpus
+
+VOCABULARY = [f"word{i}" for i in range(300)]
+
+def random_description(rng, n_words=40):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(n_words))
+
+def make_jobs(descriptions, start=0):
+    return pd.DataFrame({
+        'Company': [f'Company {start + i}' for i in range(len(descriptions))],
+        'Role': ['Developer'] * len(descriptions),
+        'Description': descriptions,
+        'Job Link': [f'https://jobs.example/{start + i}' for i in range(len(descriptions))],
+    })
+
+def test_reposts_collapse_into_the_first_row_with_a_count():
+    rng = random.Random(0)
+    originals = [random_description(rng) for _ in range(50)]
+    descriptions = list(originals)
+    # exact repost, different case and punctuation, one word changed at the end
+    descriptions.append(originals[3])
+    descriptions.append(originals[3].upper().replace(" ", ", "))
+    descriptions.append(originals[7].rsplit(" ", 1)[0] + " different")
+    # short texts are never collapsed
+    descriptions += ["python developer", "python developer"]
+
+    collapsed, signatures, report = collapse_near_duplicates(make_jobs(descriptions), 'Description', n_jobs=1)
+
+    assert collapsed['Job Link'].tolist() == [f'https://jobs.example/{i}' for i in range(50)] + [
+        'https://jobs.example/53', 'https://jobs.example/54']
+    counts = dict(zip(collapsed['Job Link'], collapsed['Duplicate Count']))
+    assert counts['https://jobs.example/3'] == 3
+    assert counts['https://jobs.example/7'] == 2
+    assert sum(collapsed['Duplicate Count']) == len(descriptions)
+    assert signatures.shape == (52, 64)
+    assert report['rows_before'] == 55 and report['rows_after'] == 52 and report['clusters'] == 2
+
+def test_ingested_repost_replaces_the_indexed_copy(tmp_path):
+    rng = random.Random(1)
+    base = make_jobs([random_description(rng) for _ in range(5)])
+    base['Source'] = 'LinkedIn'
+    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+    matrix = vectorizer.fit_transform(preprocess_corpus(base['Description'].tolist()))
+    write_index(str(tmp_path), vectorizer, matrix, base)
+
+    new_jobs = make_jobs([base['Description'][2], random_description(rng), base['Description'][2]], start=10)
+    ingest_jobs(new_jobs, str(tmp_path), refresh_idf=False)
+
+    index = open_index(str(tmp_path))
+    live = [row for row in range(index.n_rows) if not index.tombstones[row]]
+    assert [index.columns['Job Link'][row] for row in live] == [
+        'https://jobs.example/0', 'https://jobs.example/1', 'https://jobs.example/3', 'https://jobs.example/4',
+        'https://jobs.example/10', 'https://jobs.example/11']
+    assert index.record(5)['Duplicate Count'] == 3
+    assert index.record(0)['Duplicate Count'] == 1
+    # the metadata columns are stored for the filters, not returned
+    assert list(index.record(0)) == ['Company', 'Role', 'Description', 'Job Link', 'Duplicate Count']
+    assert index.signatures.shape == (index.n_rows, 64)
+
+def test_index_built_from_pickles_after_a_collapse_keeps_rows_aligned(tmp_path):
+    import pytest
+    from model.index import build_index_from_pickles
+    from model.train_model import train_tfidf_model
+    rng = random.Random(2)
+    descriptions = [random_description(rng) for _ in range(4)]
+    descriptions.insert(1, descriptions[0])  # a repost, collapsed at training
+    jobs = make_jobs(descriptions)
+    csv_path = str(tmp_path / 'job_ads.csv')
+    jobs.to_csv(csv_path, index=False)
+    vectors_path = str(tmp_path / 'vectors.pkl')
+    train_tfidf_model(csv_path, 'Description', str(tmp_path / 'vectorizer.pkl'), vectors_path,
+                      index_dir=str(tmp_path / 'trained'), n_jobs=1)
+
+    build_index_from_pickles(str(tmp_path / 'vectorizer.pkl'), vectors_path, csv_path, str(tmp_path / 'converted'))
+    trained, converted = open_index(str(tmp_path / 'trained')), open_index(str(tmp_path / 'converted'))
+    assert converted.n_rows == 4
+    assert [converted.record(row)['Job Link'] for row in range(4)] == [trained.record(row)['Job Link'] for row in range(4)]
+    assert (converted.matrix != trained.matrix).nnz == 0
+
+    # a matrix that does not match the job ads is refused
+    import pickle
+    with open(vectors_path, 'rb') as f:
+        matrix = pickle.load(f)
+    with open(str(tmp_path / 'vectorizer.pkl'), 'rb') as f:
+        vectorizer = pickle.load(f)
+    with pytest.raises(ValueError, match="4 rows but there are 5 job ads"):
+        write_index(str(tmp_path / 'mismatch'), vectorizer, matrix, jobs)
@@ -0,0 +1,43 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import re
+from model.train_model import common_words, preprocess_text, preprocess_corpus
+
+def legacy_preprocess_text(text):
+    processed_text = str(text).lower()
+    processed_text = re.sub(r'\b(?:' + '|'.join(common_words) + r')\b', '', processed_text)
+    return re.sub(r'\s+', ' ', processed_text).strip()
+
+def random_text(rng):
+    fragments = common_words + [
+        "python", "java", "sql", "time", "now", "planning", "expertise", "in", "is",
+        "full", "part", "Apply", "WITH", "léader", "dé", "x_y", "42", "withstand", "leadership",
+    ]
+    separators = [" ", "  ", "-", "--", "\n", "\t", ",", ".", "/", "_", " ", ""]
+    return "".join(rng.choice(fragments) + rng.choice(separators) for _ in range(rng.randint(0, 40)))
+
+def test_preprocess_text_matches_legacy_regex():
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = random_text(rng)
+        assert preprocess_text(text) == legacy_preprocess_text(text), repr(text)
+
+def test_preprocess_text_edge_cases():
+    cases = [
+        "", "   ", "apply now", "apply today!", "with expertise in python", "full-time/part-time",
+        "strategic planning", "we are hiring", "leadership-driven", "detail-oriented-ness",
+        "Lead developer; leads teams", float("nan"), 123,
+    ]
+    for text in cases:
+        assert preprocess_text(text) == legacy_preprocess_text(text), repr(text)
+
+def test_preprocess_corpus_keeps_order_across_processes():
+    rng = random.Random(1)
+    texts = [random_text(rng) for _ in range(250)]
+
+    processed = preprocess_corpus(texts, n_jobs=2, chunk_size=40)
+
+    assert processed == [legacy_preprocess_text(text) for text in texts]
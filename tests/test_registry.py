@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from model.index import write_index
+from web.registry import IndexRegistry, ModelNotReady
+
+def build_index(index_dir):
+    jobs = pd.DataFrame({
+        'Company': ['Acme', 'Globex'],
+        'Role': ['Developer', 'Analyst'],
+        'Description': ['python developer django', 'data analyst sql excel'],
+        'Job Link': ['https://jobs.example/0', 'https://jobs.example/1'],
+    })
+    vectorizer = TfidfVectorizer()
+    write_index(str(index_dir), vectorizer, vectorizer.fit_transform(jobs['Description']), jobs)
+
+def test_registry_loads_in_the_background_and_reports_ready(tmp_path):
+    build_index(tmp_path)
+    registry = IndexRegistry(str(tmp_path))
+    assert registry.status()["state"] == 'idle'
+
+    registry.start()
+    index = registry.current()
+
+    status = registry.status()
+    assert registry.ready and status["state"] == 'ready'
+    assert status["index_version"] == index.version
+    assert status["job_ads"] == 2
+    assert set(status["load_seconds"]) == {'open', 'vectorizer', 'warmup'}
+
+def test_failed_load_raises_model_not_ready_and_is_retried(tmp_path):
+    registry = IndexRegistry(str(tmp_path), check_interval=0, wait_timeout=5)
+
+    with pytest.raises(ModelNotReady):
+        registry.current()
+    assert registry.status()["state"] == 'failed'
+    assert registry.status()["error"]
+
+    build_index(tmp_path)
+    assert registry.current().n_rows == 2
+    assert registry.ready
+
+def test_older_versions_stay_reachable_for_result_handles(tmp_path):
+    build_index(tmp_path)
+    registry = IndexRegistry(str(tmp_path), check_interval=0)
+    old_version = registry.current().version
+
+    build_index(tmp_path)
+
+    assert registry.current().version != old_version
+    assert registry.get_version(old_version).record(1)['Job Link'] == 'https://jobs.example/1'
+    with pytest.raises(FileNotFoundError):
+        registry.get_version('20000101T000000-000000')
+
+def test_prune_keeps_the_newest_versions_written_in_the_same_second(tmp_path):
+    from unittest.mock import patch
+    from model.index import current_version
+    # same second, random suffixes that sort against the write order
+    names = [f'20240501T120000-{suffix}' for suffix in ('ffffff', 'cccccc', 'aaaaaa', '999999', '000000')]
+    with patch('model.index._new_version', side_effect=names):
+        for _ in names:
+            build_index(tmp_path)
+
+    assert sorted(name for name in os.listdir(tmp_path) if name != 'CURRENT') == sorted(names[-3:])
+    assert current_version(str(tmp_path)) == names[-1]
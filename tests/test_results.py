@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import numpy as np
+from web.cache import LRUCache
+from web.results import ResultStore
+
+def test_result_handles_store_the_ranking_compactly():
+    store = ResultStore(LRUCache(max_entries=10, max_bytes=1024 * 1024, ttl=60))
+    handle = store.create(np.arange(200), np.linspace(1, 0, 200), "v1", "exact")
+
+    ranking = store.get(handle)
+    assert ranking["rows"].dtype == np.int32
+    assert ranking["rows"].tolist() == list(range(200))
+    assert ranking["index_version"] == "v1"
+    assert store.get("unknown") is None
+    assert store.create([1], [0.5], "v1", "exact") != handle
+
+def test_result_handles_expire_and_are_evicted():
+    store = ResultStore(LRUCache(max_entries=2, max_bytes=1024 * 1024, ttl=0.05))
+    first = store.create([1], [0.5], "v1", "exact")
+    second = store.create([2], [0.5], "v1", "exact")
+    third = store.create([3], [0.5], "v1", "exact")
+    assert store.get(first) is None
+    assert store.get(third)["rows"].tolist() == [3]
+
+    time.sleep(0.1)
+    assert store.get(second) is None and store.get(third) is None
+
+def test_default_result_store_is_in_the_private_state_directory(tmp_path, monkeypatch):
+    import web.cache
+    import web.results
+    monkeypatch.setattr(web.cache, 'STATE_DIR', str(tmp_path / "state"))
+    monkeypatch.setattr(web.results, 'RESULTS_PATH', '')
+    store = ResultStore(web.results.create_result_backend('sqlite'))
+    assert store.backend.path == str(tmp_path / "state" / "results.sqlite")
+    assert os.stat(tmp_path / "state").st_mode & 0o777 == 0o700
+    handle = store.create([4], [0.5], "v1", "exact")
+    assert store.get(handle)["rows"].tolist() == [4]
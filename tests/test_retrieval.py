@@ -0,0 +1,174 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from sklearn.preprocessing import normalize
+from model.index import build_postings
+from web.retrieval import approximate_search, exact_search, pruned_search, row_shards, score_rows, sharded_search
+
+class InMemoryIndex:
+    def __init__(self, matrix, tombstones=None):
+        self.matrix = matrix
+        self.n_rows = matrix.shape[0]
+        self.postings = build_postings(matrix)
+        self.tombstones = tombstones
+        self.n_live = self.n_rows - (int(tombstones.sum()) if tombstones is not None else 0)
+
+def make_index(n_rows=2000, n_terms=300, density=0.02, seed=0):
+    matrix = sparse_random(n_rows, n_terms, density=density, format='csr', random_state=seed)
+    return InMemoryIndex(normalize(matrix))
+
+def test_pruned_search_matches_exact_search():
+    index = make_index()
+    queries = normalize(sparse_random(20, 300, density=0.05, format='csr', random_state=1))
+
+    for q in range(queries.shape[0]):
+        query = queries[q]
+        for k in (1, 9, 50):
+            exact = exact_search(index, query, k)
+            pruned = pruned_search(index, query, k)
+            assert pruned.rows.tolist() == exact.rows.tolist()
+            assert np.array_equal(pruned.scores, exact.scores)
+            assert pruned.candidates_scored <= index.n_rows
+
+
+def test_pruned_search_fills_with_zero_scores_like_exact_search():
+    index = make_index(n_rows=50, density=0.01)
+    query = normalize(sparse_random(1, 300, density=0.01, format='csr', random_state=3))
+
+    exact = exact_search(index, query, 20)
+    pruned = pruned_search(index, query, 20)
+
+    assert pruned.rows.tolist() == exact.rows.tolist()
+
+
+def test_tombstoned_rows_are_never_returned():
+    matrix = make_index().matrix
+    tombstones = np.zeros(matrix.shape[0], dtype=bool)
+    tombstones[::3] = True
+    index = InMemoryIndex(matrix, tombstones)
+    queries = normalize(sparse_random(10, 300, density=0.05, format='csr', random_state=4))
+
+    for q in range(queries.shape[0]):
+        exact = exact_search(index, queries[q], 9)
+        pruned = pruned_search(index, queries[q], 9)
+        assert not tombstones[exact.rows].any()
+        assert pruned.rows.tolist() == exact.rows.tolist()
+
+
+def write_compact_index(index_dir, matrix, precision, min_weight=0.0, dense_dims=0):
+    from model.index import encode_string_column, open_index, write_index_version
+    columns = {'Company': encode_string_column([f'Company {i}' for i in range(matrix.shape[0])])}
+    write_index_version(index_dir, matrix, np.ones(matrix.shape[1]), [f't{i}' for i in range(matrix.shape[1])],
+                        columns, {'norm': 'l2'}, precision=precision, min_weight=min_weight, dense_dims=dense_dims)
+    return open_index(index_dir)
+
+
+def test_pruned_search_memory_follows_the_posting_lists_not_the_row_count():
+    import tracemalloc
+    index = make_index(n_rows=200000, density=0.0005, seed=5)
+    query = normalize(sparse_random(1, 300, density=0.01, format='csr', random_state=6))
+    pruned_search(index, query, 9)
+
+    tracemalloc.start()
+    result = pruned_search(index, query, 9)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert result.rows.tolist() == exact_search(index, query, 9).rows.tolist()
+    # no per-query array of n_rows scores (1.6MB here)
+    assert peak < index.n_rows * 8 // 4
+
+
+def test_compact_indexes_score_with_a_dot_product_and_keep_the_ranking(tmp_path):
+    matrix = make_index().matrix
+    queries = normalize(sparse_random(20, 300, density=0.05, format='csr', random_state=5))
+    reference = InMemoryIndex(matrix)
+
+    for precision, min_overlap in (('float64', 9), ('float32', 9), ('uint16', 9), ('uint8', 8)):
+        index = write_compact_index(str(tmp_path / precision), matrix, precision)
+        assert index.matrix.indices.dtype == np.int32
+        for q in range(queries.shape[0]):
+            exact = exact_search(index, queries[q], 9)
+            # same top-k with or without pruning, in every precision
+            assert pruned_search(index, queries[q], 9).rows.tolist() == exact.rows.tolist()
+            assert np.array_equal(sharded_search(index, queries[q], 9, 3).scores, exact.scores)
+            expected = exact_search(reference, queries[q], 9)
+            assert len(set(exact.rows.tolist()) & set(expected.rows.tolist())) >= min_overlap
+            assert np.allclose(exact.scores, expected.scores, atol=1e-2 if precision == 'uint8' else 1e-5)
+
+
+def test_min_weight_drops_small_weights_and_renormalizes(tmp_path):
+    matrix = make_index().matrix
+    index = write_compact_index(str(tmp_path), matrix, 'float32', min_weight=0.1)
+
+    stored = index.float_matrix()
+    assert stored.nnz < matrix.nnz and stored.data.min() >= 0.1
+    norms = np.sqrt(np.asarray(stored.multiply(stored).sum(axis=1)).ravel())
+    assert np.allclose(norms[np.diff(stored.indptr) > 0], 1, atol=1e-6)
+
+
+def test_writing_a_compact_index_leaves_the_input_matrix_untouched(tmp_path):
+    matrix = make_index(n_rows=200).matrix
+    # same matrix with the column indices of every row in reverse order
+    unsorted = matrix.copy()
+    for row in range(unsorted.shape[0]):
+        start, end = unsorted.indptr[row], unsorted.indptr[row + 1]
+        unsorted.indices[start:end] = unsorted.indices[start:end][::-1].copy()
+        unsorted.data[start:end] = unsorted.data[start:end][::-1].copy()
+    unsorted.has_sorted_indices = False
+    before = (unsorted.indices.copy(), unsorted.data.copy())
+
+    index = write_compact_index(str(tmp_path), unsorted, 'float32')
+
+    assert np.array_equal(unsorted.indices, before[0]) and np.array_equal(unsorted.data, before[1])
+    assert abs(index.float_matrix() - matrix).max() < 1e-7
+
+
+def test_approximate_search_reranks_a_dense_shortlist_exactly(tmp_path):
+    matrix = make_index().matrix
+    queries = normalize(sparse_random(10, 300, density=0.05, format='csr', random_state=6))
+    index = write_compact_index(str(tmp_path / 'dense'), matrix, 'float32', dense_dims=100)
+    assert index.dense.shape == (2000, 100) and index.dense.dtype == np.float32
+
+    for q in range(queries.shape[0]):
+        exact = exact_search(index, queries[q], 9)
+        # a shortlist of every row is an exact search
+        full = approximate_search(index, queries[q], 9, shortlist=index.n_rows)
+        assert full.rows.tolist() == exact.rows.tolist() and np.array_equal(full.scores, exact.scores)
+        # re-ranked scores are the exact ones, dense scores only approximate them
+        reranked = approximate_search(index, queries[q], 9, shortlist=100)
+        assert reranked.candidates_scored == 100
+        assert np.array_equal(reranked.scores, score_rows(index, queries[q], index.matrix[reranked.rows]).ravel())
+        dense_only = approximate_search(index, queries[q], 9, shortlist=0)
+        assert dense_only.candidates_scored == 0 and dense_only.rows.shape == (9,)
+
+    # without dense vectors the approximate mode searches exactly
+    plain = write_compact_index(str(tmp_path / 'plain'), matrix, 'float32')
+    assert plain.dense is None
+    assert approximate_search(plain, queries[0], 9).rows.tolist() == exact_search(plain, queries[0], 9).rows.tolist()
+
+
+def test_sharded_search_matches_exact_search():
+    index = make_index(n_rows=3000)
+    # coarse scores, so the top-k has ties across shards
+    index.matrix.data[:] = np.round(index.matrix.data, 1)
+    queries = normalize(sparse_random(10, 300, density=0.05, format='csr', random_state=7))
+
+    shards = row_shards(index.matrix, 4)
+    assert [start for start, _ in shards] == sorted(start for start, _ in shards) and shards[0][0] == 0
+    assert sum(shard.shape[0] for _, shard in shards) == index.n_rows
+    assert np.shares_memory(shards[1][1].data, index.matrix.data)
+
+    tombstones = np.zeros(index.n_rows, dtype=bool)
+    tombstones[::5] = True
+    for reference in (index, InMemoryIndex(index.matrix, tombstones)):
+        for q in range(queries.shape[0]):
+            for k in (1, 9, 50):
+                exact = exact_search(reference, queries[q], k)
+                for n_shards, threads in ((2, 1), (4, 2), (7, 4)):
+                    sharded = sharded_search(reference, queries[q], k, n_shards, threads)
+                    assert sharded.rows.tolist() == exact.rows.tolist()
+                    assert np.array_equal(sharded.scores, exact.scores)
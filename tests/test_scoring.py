@@ -0,0 +1,24 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from web.scoring import top_k_indices
+
+def test_top_k_indices_matches_full_sort():
+    rng = np.random.default_rng(0)
+    scores = rng.random(1000)
+    k = 9
+
+    top_rows = top_k_indices(scores, k)
+
+    expected = np.lexsort((np.arange(len(scores)), -scores))[:k]
+    assert top_rows.tolist() == expected.tolist()
+
+
+def test_top_k_indices_breaks_ties_by_row_index():
+    scores = np.array([0.1, 0.5, 0.3, 0.5, 0.5, 0.0, 0.5])
+
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 4]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 4, 6, 2, 0, 5]
+    assert top_k_indices(scores, 0).tolist() == []
@@ -0,0 +1,157 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+from scraper import JobScraper, JobScraperManager, ScrapeJob, TokenBucket
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves 3 result pages per keyword; page 'flaky' fails once with a 500"""
+    failures = {}
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        keyword, page = query["q"][0], int(query["page"][0])
+        if keyword == "flaky" and not self.failures.get(page):
+            self.failures[page] = True
+            self.send_response(500)
+            self.end_headers()
+            return
+        jobs = "" if page >= 3 else "".join(
+            f'<div class="job"><h2>{keyword} {page}-{i}</h2><a href="/job/{keyword}/{page}/{i}">x</a></div>'
+            for i in range(2)
+        )
+        body = f"<html><body>{jobs}</body></html>".encode("utf-8")
+        time.sleep(0.05)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FixtureScraper(JobScraper):
+    def build_search_url(self, keyword, location="", page=0):
+        return f"{self.base_url}/jobs?q={keyword}&l={location}&page={page}"
+
+    def parse_job_listings(self, soup):
+        return soup.find_all("div", class_="job")
+
+    def parse_job_details(self, job_element):
+        return {
+            "title": job_element.find("h2").get_text(strip=True),
+            "link": self.base_url + job_element.find("a")["href"],
+            "description": "N/A",
+            "company": "Fixture",
+            "source": "Fixture",
+        }
+
+@pytest.fixture
+def fixture_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def make_manager(base_url):
+    manager = JobScraperManager()
+    manager.scrapers = {"fixture": FixtureScraper(base_url)}
+    return manager
+
+def test_async_scraping_keeps_sequential_order_and_stops_at_empty_page(fixture_server):
+    manager = make_manager(fixture_server)
+    jobs = [ScrapeJob("fixture", "python", max_pages=5), ScrapeJob("fixture", "java", max_pages=2)]
+
+    results = manager.scrape_many(jobs, concurrency=8, rate_per_host=1000, burst=100)
+
+    titles = [job["title"] for job in results]
+    assert titles == [f"python {p}-{i}" for p in range(3) for i in range(2)] + [f"java {p}-{i}" for p in range(2) for i in range(2)]
+
+
+def test_async_scraping_retries_with_backoff(fixture_server):
+    manager = make_manager(fixture_server)
+
+    results = manager.scrape_many([ScrapeJob("fixture", "flaky", max_pages=2)], rate_per_host=1000, burst=100, backoff_base=0.01)
+
+    assert len(results) == 4
+
+
+def test_async_scraping_matches_sequential_scraper(fixture_server, monkeypatch):
+    # no pauses between pages in the sequential scraper
+    monkeypatch.setattr("scraper.random.uniform", lambda a, b: 0)
+    manager = make_manager(fixture_server)
+
+    concurrent = manager.scrape_all_sites_async(["python", "java"], max_pages=4, rate_per_host=1000, burst=100)
+
+    scraper = manager.scrapers["fixture"]
+    sequential = scraper.scrape_jobs("python", max_pages=4) + scraper.scrape_jobs("java", max_pages=4)
+    assert concurrent == sequential
+
+
+def test_token_bucket_limits_request_rate():
+    import asyncio
+
+    async def take(n):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(take(6)) >= 5 / 50 * 0.9
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """One result page with an ETag; counts full responses and 304s"""
+    counts = {"full": 0, "not_modified": 0}
+    body = ('<html><body><div class="job"><h2>python 0-0</h2><a href="/job/1?utm_source=x">x</a></div>'
+            '<div class="job"><h2>python 0-1</h2><a href="/job/1/">x</a></div></body></html>').encode("utf-8")
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.counts["not_modified"] += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.counts["full"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_http_cache_revalidates_and_deduplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr("scraper.random.uniform", lambda a, b: 0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        manager = JobScraperManager()
+        manager.scrapers = {"fixture": FixtureScraper(base_url, cache_path=str(tmp_path / "cache.sqlite"))}
+        first = manager.scrape_all_sites("python", max_pages=1)
+        parsed = []
+        monkeypatch.setattr(FixtureScraper, "_parse_page", lambda self, response: parsed.append(response))
+        second = manager.scrape_all_sites("python", max_pages=1)
+        stats = manager.cache_stats()["total"]
+    finally:
+        server.shutdown()
+
+    # both cards are the same posting once tracking parameters and the trailing slash are ignored
+    assert [job["title"] for job in first] == ["python 0-0"]
+    assert second == first
+    assert ETagHandler.counts == {"full": 1, "not_modified": 1}
+    # the unchanged page was neither transferred nor parsed again
+    assert parsed == []
+    assert stats["revalidated"] == 1 and stats["bytes_saved"] == len(ETagHandler.body)
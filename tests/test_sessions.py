@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from web.cache import SqliteCache
+from web.sessions import ServerSessionMiddleware, SessionStore
+
+def make_worker(path, ttl=60):
+    """One app per simulated gunicorn worker, each with its own connection to the shared store"""
+    app = FastAPI()
+
+    @app.post("/set/{handle}")
+    def set_handle(request: Request, handle: str):
+        request.session["results_handle"] = handle
+        return {}
+
+    @app.get("/get")
+    def get_handle(request: Request):
+        return {"handle": request.session.get("results_handle")}
+
+    @app.post("/clear")
+    def clear(request: Request):
+        request.session.clear()
+        return {}
+
+    store = SessionStore(SqliteCache(path=path, ttl=ttl))
+    app.add_middleware(ServerSessionMiddleware, store=store, max_age=ttl)
+    return TestClient(app)
+
+def test_session_is_stored_server_side_and_shared_by_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    worker_a, worker_b = make_worker(path), make_worker(path)
+
+    response = worker_a.post("/set/" + "h" * 200)
+    session_id = response.cookies["cv_session"]
+    # only the id travels in the cookie, whatever the session holds
+    assert len(session_id) == 22
+
+    worker_b.cookies.set("cv_session", session_id)
+    assert worker_b.get("/get").json() == {"handle": "h" * 200}
+    # reading the session does not rewrite the cookie
+    assert "set-cookie" not in worker_b.get("/get").headers
+
+    worker_b.post("/clear")
+    worker_a.cookies.set("cv_session", session_id)
+    assert worker_a.get("/get").json() == {"handle": None}
+
+def test_unknown_ids_get_a_fresh_session_and_sessions_expire(tmp_path):
+    worker = make_worker(str(tmp_path / "sessions.sqlite"), ttl=0.2)
+    worker.cookies.set("cv_session", "A" * 22)
+    assert worker.get("/get").json() == {"handle": None}
+
+    response = worker.post("/set/abc")
+    # an id the server never issued is not reused
+    assert response.cookies["cv_session"] != "A" * 22
+    worker.cookies.set("cv_session", response.cookies["cv_session"])
+    assert worker.get("/get").json() == {"handle": "abc"}
+
+    time.sleep(0.3)
+    assert worker.get("/get").json() == {"handle": None}
+
+def test_default_session_store_is_in_the_private_state_directory(tmp_path, monkeypatch):
+    import web.cache
+    import web.sessions
+    monkeypatch.setattr(web.cache, 'STATE_DIR', str(tmp_path / "state"))
+    monkeypatch.setattr(web.sessions, 'SESSION_PATH', '')
+    backend = web.sessions.create_session_backend('sqlite')
+    assert backend.path == str(tmp_path / "state" / "sessions.sqlite")
+    assert os.stat(tmp_path / "state").st_mode & 0o777 == 0o700
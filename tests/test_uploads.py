@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import hashlib
+from io import BytesIO
+import httpx
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from benchmarks.synthetic import make_cv_pdf
+from web.uploads import FORM_OVERHEAD, UploadLimitMiddleware, UploadTooLarge, spool_upload
+from web.extraction import extract_document_with_stats
+
+class ChunkedUpload:
+    """Minimal UploadFile stand-in: read(size) returns the data piece by piece"""
+    def __init__(self, data: bytes):
+        self.file = BytesIO(data)
+
+    async def read(self, size: int = -1):
+        return self.file.read(size)
+
+def test_spool_upload_moves_to_disk_and_stops_at_the_limit():
+    data = os.urandom(300 * 1024)
+
+    with asyncio.run(spool_upload(ChunkedUpload(data), max_bytes=len(data), spool_bytes=100 * 1024)) as spool:
+        assert spool.on_disk and spool.size == len(data)
+        assert spool.sha256 == hashlib.sha256(data).hexdigest()
+        with open(spool.source(), "rb") as f:
+            assert f.read() == data
+        path = spool.source()
+        # PDFs, DOCX files and zip archives alike: the format comes from the content, not the name
+        assert path.endswith('.upload')
+    assert not os.path.exists(path)
+
+    with asyncio.run(spool_upload(ChunkedUpload(b"small"))) as spool:
+        assert not spool.on_disk and spool.source() == b"small"
+
+    upload = ChunkedUpload(data)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(spool_upload(upload, max_bytes=100 * 1024))
+    # gave up after the chunk that crossed the limit
+    assert upload.file.tell() < 200 * 1024
+
+def limited_app(limit):
+    app = FastAPI()
+    reads = []
+
+    @app.post("/upload")
+    async def upload(cvFile: UploadFile = File(...)):
+        reads.append(cvFile.filename)
+        return {"ok": True}
+
+    return UploadLimitMiddleware(app, limits={"/upload": limit}), reads
+
+def test_oversized_uploads_are_rejected_before_the_endpoint_runs():
+    app, reads = limited_app(256 * 1024)
+
+    async def post(data, stream=False):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            if not stream:
+                return await client.post("/upload", files={"cvFile": ("cv.pdf", data, "application/pdf")})
+
+            form = (b'--x\r\nContent-Disposition: form-data; name="cvFile"; filename="cv.pdf"\r\n'
+                    b'Content-Type: application/pdf\r\n\r\n' + data + b'\r\n--x--\r\n')
+
+            async def body():
+                # no Content-Length: the middleware has to count
+                for i in range(0, len(form), 16 * 1024):
+                    yield form[i:i + 16 * 1024]
+            return await client.post("/upload", content=body(),
+                                     headers={"content-type": "multipart/form-data; boundary=x"})
+
+    assert asyncio.run(post(b"%PDF small")).status_code == 200
+    response = asyncio.run(post(os.urandom(400 * 1024)))
+    assert response.status_code == 413 and "0.25MB" in response.json()["detail"]
+    assert asyncio.run(post(b"a" * 1024, stream=True)).status_code == 200
+    assert asyncio.run(post(b"a" * (256 * 1024 + FORM_OVERHEAD), stream=True)).status_code == 413
+    assert reads == ["cv.pdf", "cv.pdf"]
+
+def test_pdf_extraction_stops_at_the_page_and_character_caps():
+    pdf = make_cv_pdf(6, seed=2, lines_per_page=5)
+
+    for pdf_mode in ('full', 'fast'):
+        _, stats = extract_document_with_stats(pdf, max_pages=2, max_chars=0, pdf_mode=pdf_mode)
+        assert stats["pages"] == 6 and stats["pages_read"] == 2 and stats["truncated"]
+
+        _, stats = extract_document_with_stats(pdf, max_pages=0, max_chars=50, pdf_mode=pdf_mode)
+        assert stats["pages_read"] == 1 and stats["chars"] == 50 and stats["truncated"]
+
+        _, stats = extract_document_with_stats(pdf, max_pages=6, max_chars=0, pdf_mode=pdf_mode)
+        assert stats["pages_read"] == 6 and not stats["truncated"] and stats["cpu_seconds"] > 0
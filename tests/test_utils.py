@@ -3,7 +3,8 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from unittest.mock import patch
-from web.utils import find_top_matches, extract_pdf_text
+from web.utils import find_top_matches
+from web.extraction import extract_document_with_stats
 
 def test_find_top_matches_returns_correct_number_and_uniqueness():
     test_cv_text = "la mia esperienza include python, java, e project management. sono un software engineer."
@@ -17,15 +18,15 @@ def test_find_top_matches_returns_correct_number_and_uniqueness():
     assert len(job_links) == len(set(job_links)), "Found duplicate job links in results"
 
 
-@patch('web.utils.extract_text')
+@patch('web.extraction.extract_pdf_text_capped')
 def test_extract_pdf_text_with_mock(mock_extract_text):
-    pdf_path = "dummy/path/to/cv.pdf"
+    pdf = b"%PDF-1.4 dummy"
     raw_text = "Test CV content with python and java SKILLS"
-    mock_extract_text.return_value = raw_text
+    mock_extract_text.return_value = (raw_text, 1, False)
 
-    processed_text = extract_pdf_text(pdf_path)
+    processed_text, _ = extract_document_with_stats(pdf, pdf_mode='full')
 
-    mock_extract_text.assert_called_once_with(pdf_path)
+    mock_extract_text.assert_called_once()
 
     expected_text = "test cv content python java"
-    assert processed_text == expected_text
\ No newline at end of file
+    assert processed_text == expected_text
@@ -1,20 +1,196 @@
-from fastapi import APIRouter, File, UploadFile, Request, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from web.utils import *
-from io import BytesIO
+from fastapi import APIRouter, Depends, File, UploadFile, Request, HTTPException, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from web.utils import (DEFAULT_SEARCH_MODE, SEARCH_MODES, ModelNotReady, index_registry,
+                       rank_job_ads, result_page)
+from web.extraction import DOCX_CONTENT_TYPE, extract_document_with_stats
+from web.extraction_pool import extraction_pool, ExtractionQueueFull, ExtractionTimeout
+from web.cache import analysis_cache
+from web.results import RESULTS_DEPTH, RESULTS_PAGE_LIMIT, result_store
+from web.batch import (BATCH_MAX_DECOMPRESSED_BYTES, BATCH_MAX_FILES, MAX_FILE_SIZE, BatchError, close_documents,
+                       is_zip_upload, read_zip_documents, stream_batch_results)
+from web.uploads import BATCH_MAX_BYTES, UPLOAD_MAX_BYTES, UploadTooLarge, spool_upload, too_large_message
+from web.metrics import metrics
+from model.facets import JobFilters
+from web.profiler import create_profiler
+from typing import List
 import json
 import logging
+import time
+import numpy as np
 router = APIRouter()
 
+# Opt-in sampling profiler for slow requests (CV_PROFILE_THRESHOLD_MS)
+profiler = create_profiler()
+
+metrics.callback('cv_model_ready', 'gauge', '1 once the job index is loaded and warmed up',
+                 lambda: index_registry.ready)
+metrics.callback('cv_extraction_in_flight', 'gauge', 'Extraction jobs running or waiting for a process',
+                 lambda: extraction_pool.in_flight)
+metrics.callback('cv_cache_entries', 'gauge', 'Entries in the CV analysis cache',
+                 lambda: analysis_cache.stats().get("entries", 0))
+metrics.callback('cv_cache_hits_total', 'counter', 'CV analysis cache hits',
+                 lambda: analysis_cache.stats().get("hits", 0))
+metrics.callback('cv_cache_misses_total', 'counter', 'CV analysis cache misses',
+                 lambda: analysis_cache.stats().get("misses", 0))
+
+async def metrics_middleware(request: Request, call_next):
+    """Request counter and latency per route; dumps a profile for slow requests when enabled"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        end = time.perf_counter()
+        # Route template, not the raw path, to keep the label set small
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.inc("cv_http_requests_total", route=route_path, method=request.method, status=str(status))
+        metrics.observe("cv_http_request_seconds", end - start, route=route_path)
+        if profiler is not None and profiler.dump_if_slow(start, end, f"{request.method} {route_path}"):
+            metrics.inc("cv_slow_request_profiles_total", route=route_path)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the job index in the background: the port is bound right away and
+    # /api/ready reports when the worker can serve matches
+    index_registry.start()
+    yield
+    extraction_pool.shutdown()
+
+def server_busy_error():
+    return HTTPException(
+        status_code=503,
+        detail="The server is busy analyzing other CVs. Please try again in a moment.",
+        headers={"Retry-After": "5"}
+    )
+
+def model_loading_error():
+    return HTTPException(
+        status_code=503,
+        detail="The job matching model is still loading. Please try again in a moment.",
+        headers={"Retry-After": "5"}
+    )
+
+def extraction_timeout_error():
+    return HTTPException(
+        status_code=504,
+        detail="Reading your CV took too long. Please try a smaller file."
+    )
+
+def upload_too_large_error(limit: int = UPLOAD_MAX_BYTES):
+    return HTTPException(status_code=413, detail=too_large_message(limit))
+
+async def extract_text_cached(spool):
+    """Extracted text of a spooled upload, reused when the same file was uploaded before.
+
+    Returns (text, resources): what the request cost, for the response and the metrics.
+    """
+    resources = {"upload_bytes": spool.size, "spooled_to_disk": spool.on_disk}
+    # The cache may be a shared sqlite file: never wait on it on the event loop
+    text = await run_in_threadpool(analysis_cache.get_text, spool.sha256)
+    resources["cached_text"] = text is not None
+    if text is None:
+        start = time.perf_counter()
+        # Small uploads are sent as bytes, spooled ones by path
+        text, stats = await extraction_pool.run(extract_document_with_stats, spool.source())
+        elapsed = time.perf_counter() - start
+        # Time spent waiting for a process and moving data, on top of the work itself
+        metrics.observe("cv_stage_seconds", elapsed - stats.get("extract", 0) - stats.get("preprocess", 0),
+                        stage="extraction_wait")
+        for stage in ("extract", "preprocess"):
+            if stage in stats:
+                metrics.observe("cv_stage_seconds", stats[stage], stage=stage)
+        if "extract" in stats:
+            metrics.observe("cv_extraction_seconds", stats["extract"], format=stats["format"])
+        if stats.get("pages") is not None:
+            metrics.observe("cv_pdf_pages", stats["pages"])
+        if "cpu_seconds" in stats:
+            metrics.observe("cv_extraction_cpu_seconds", stats["cpu_seconds"])
+        if stats.get("truncated"):
+            metrics.inc("cv_extraction_truncated_total", format=stats["format"])
+        resources.update({key: stats[key] for key in ("format", "extract", "pages", "pages_read", "chars", "truncated",
+                                                       "cpu_seconds", "max_rss_bytes") if key in stats})
+        await run_in_threadpool(analysis_cache.set_text, spool.sha256, text)
+    return text, resources
+
+async def read_upload(upload: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES):
+    """Spool an uploaded file in chunks, recording its size and the time it took.
+
+    Raises UploadTooLarge as soon as more than max_bytes have been read.
+    """
+    with metrics.time("cv_stage_seconds", stage="read_upload"):
+        spool = await spool_upload(upload, max_bytes)
+    metrics.observe("cv_upload_bytes", spool.size)
+    return spool
+
+def job_filters(company: List[str] = Query(None), role: str = None, source: List[str] = Query(None),
+                location: str = None, posted_after: str = None, posted_before: str = None) -> JobFilters:
+    """Structured filters from the query string: company and source may be repeated (any of them),
+    role and location are keywords (all of them), dates are YYYY-MM-DD"""
+    try:
+        return JobFilters(company=tuple(company or ()), role=role or '', source=tuple(source or ()),
+                          location=location or '', posted_after=posted_after or '', posted_before=posted_before or '')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def check_filters(filters: JobFilters):
+    """Reject filters on columns the current index does not have, before any extraction work"""
+    if not filters:
+        return
+    index = await run_in_threadpool(index_registry.current)
+    try:
+        index.facets.check(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def rank_cached(text: str, mode: str = None, depth: int = RESULTS_DEPTH, filters: JobFilters = None):
+    """Ranked rows, scores and search stats of the top `depth` job ads, reused while the index version is unchanged"""
+    mode = mode or DEFAULT_SEARCH_MODE
+    filters_key = filters.cache_key() if filters else ''
+    # Rankings are cached per index version: a hot-swapped index invalidates them.
+    # current() may wait for the index to load, so not on the event loop.
+    index_version = (await run_in_threadpool(index_registry.current)).version
+    cached = await run_in_threadpool(analysis_cache.get_matches, text, depth, mode, index_version, filters_key)
+    if cached is None:
+        _, result, stats = await run_in_threadpool(rank_job_ads, text, depth, mode, filters)
+        cached = (result.rows.astype(np.int32), result.scores, stats)
+        await run_in_threadpool(analysis_cache.set_matches, text, depth, mode, stats["index_version"], cached, filters_key)
+    return cached
+
+async def analyze_text(text: str, limit: int = 9, mode: str = None, filters: JobFilters = None,
+                       explain: bool = False):
+    """First page of matches, search stats and a result handle to page through the deeper matches.
+
+    With explain, each match lists the terms that contributed most to its similarity.
+    """
+    rows, scores, stats = await rank_cached(text, mode, max(RESULTS_DEPTH, limit), filters)
+    handle = await run_in_threadpool(result_store.create, rows, scores, stats["index_version"], stats["mode"])
+    results = await run_in_threadpool(result_page, stats["index_version"], rows, scores, 0, limit,
+                                      text if explain else None)
+    page = {
+        "handle": handle,
+        "next_cursor": str(limit) if len(rows) > limit else None,
+        "total_ranked": len(rows),
+    }
+    return results, stats, page
+
 @router.get("/", response_class=HTMLResponse)
 def home():
     with open("web/index.html", "r", encoding="utf-8") as f:
         return f.read()
 
 @router.get("/success", response_class=HTMLResponse)
-def success(request: Request):
-    results = request.session.get("results")
-    if not results:
+async def success(request: Request):
+    ranking = await run_in_threadpool(result_store.get, request.session.get("results_handle", ""))
+    if not ranking:
+        return "<h2>No results found.</h2><a href='/'>Back to home</a>"
+    try:
+        results = await run_in_threadpool(result_page, ranking["index_version"], ranking["rows"], ranking["scores"], 0, 9)
+    except (FileNotFoundError, ModelNotReady):
         return "<h2>No results found.</h2><a href='/'>Back to home</a>"
     html = "<h2>Upload successful!</h2><ul>"
     for job in results:
@@ -26,16 +202,24 @@ def success(request: Request):
 async def upload_cv(request: Request, cvFile: UploadFile = File(...)):
     """Legacy upload endpoint for backward compatibility"""
     try:
-        content = await cvFile.read()
-        pdf_stream = BytesIO(content)
-        text = extract_pdf_text(pdf_stream)
+        with await read_upload(cvFile) as spool:
+            text, _ = await extract_text_cached(spool)
         
         if text == "":
             return RedirectResponse(url="/", status_code=303)
             
-        results = find_top_matches(text)
-        request.session["results"] = results
+        _, _, page = await analyze_text(text)
+        # Only the handle goes in the session cookie, the ranking stays on the server
+        request.session["results_handle"] = page["handle"]
         return RedirectResponse(url="/success", status_code=303)
+    except UploadTooLarge as e:
+        raise upload_too_large_error(e.limit)
+    except ExtractionQueueFull:
+        raise server_busy_error()
+    except ExtractionTimeout:
+        raise extraction_timeout_error()
+    except ModelNotReady:
+        raise model_loading_error()
     except Exception as e:
         print(f"Error processing upload: {e}")
         return RedirectResponse(url="/", status_code=303)
@@ -45,29 +229,34 @@ async def test_endpoint():
     return {"message": "Endpoint di test funzionante!"}
 
 @router.post("/api/analyze")
-async def analyze_cv_api(cvFile: UploadFile = File(...)):
-    """Modern API endpoint for CV analysis"""
+async def analyze_cv_api(cvFile: UploadFile = File(...), mode: str = None,
+                         limit: int = Query(9, ge=1, le=RESULTS_PAGE_LIMIT), explain: bool = False,
+                         filters: JobFilters = Depends(job_filters)):
+    """Modern API endpoint for CV analysis (explain=true: the matched terms behind each result)"""
 
     try:
+        # Validate search mode ('exact' brute force, 'pruned' inverted index or 'approximate' dense vectors)
+        if mode is not None and mode not in SEARCH_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid search mode. Use one of: {', '.join(SEARCH_MODES)}."
+            )
+
+        # Validate the filters against the job index columns
+        await check_filters(filters)
+
         # Validate file type
-        allowed_types = ["application/pdf", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
+        allowed_types = ["application/pdf", DOCX_CONTENT_TYPE]
         if cvFile.content_type not in allowed_types:
             raise HTTPException(
                 status_code=400, 
                 detail="Invalid file type. Please upload a PDF or DOCX file."
             )
         
-        # Validate file size (10MB limit)
-        content = await cvFile.read()
-        if len(content) > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(
-                status_code=400, 
-                detail="File size too large. Maximum size is 10MB."
-            )
-        
-        # Extract text from PDF
-        pdf_stream = BytesIO(content)
-        text = extract_pdf_text(pdf_stream)
+        # Read the file in chunks, rejected as soon as it goes over the size limit;
+        # extract text from the PDF or DOCX in the process pool, the event loop stays free
+        with await read_upload(cvFile) as spool:
+            text, resources = await extract_text_cached(spool)
         
         if not text or text.strip() == "":
             raise HTTPException(
@@ -75,17 +264,28 @@ async def analyze_cv_api(cvFile: UploadFile = File(...)):
                 detail="Could not extract text from the uploaded file. Please ensure it's a valid PDF or DOCX file."
             )
         
-        # Find job matches
-        results = find_top_matches(text, k=9)
+        # Find job matches in a worker thread
+        results, search_stats, page = await analyze_text(text, limit, mode, filters, explain)
         return JSONResponse(content={
             "success": True,
             "message": "CV analyzed successfully",
             "results": results,
-            "total_matches": len(results)
+            "total_matches": len(results),
+            "search": search_stats,
+            "resources": resources,
+            **page
         })
         
     except HTTPException:
         raise
+    except UploadTooLarge as e:
+        raise upload_too_large_error(e.limit)
+    except ExtractionQueueFull:
+        raise server_busy_error()
+    except ExtractionTimeout:
+        raise extraction_timeout_error()
+    except ModelNotReady:
+        raise model_loading_error()
     except Exception as e:
         print(f"Error in CV analysis: {e}")
         raise HTTPException(
@@ -93,10 +293,106 @@ async def analyze_cv_api(cvFile: UploadFile = File(...)):
             detail="An error occurred while processing your CV. Please try again."
         )
 
+@router.post("/api/analyze/batch")
+async def analyze_batch_api(cvFiles: List[UploadFile] = File(...), k: int = Query(9, ge=1, le=RESULTS_PAGE_LIMIT),
+                            filters: JobFilters = Depends(job_filters)):
+    """Batch CV analysis: many PDF/DOCX files or zip archives, results streamed back as NDJSON"""
+    # (name, UploadSpool) per CV, every one in its own temporary file until it has been extracted
+    documents = []
+    try:
+        for upload in cvFiles:
+            if is_zip_upload(upload.filename, upload.content_type):
+                try:
+                    with await spool_upload(upload, BATCH_MAX_BYTES) as archive:
+                        documents.extend(await run_in_threadpool(
+                            read_zip_documents, archive.source(), BATCH_MAX_FILES - len(documents),
+                            BATCH_MAX_DECOMPRESSED_BYTES - sum(spool.size for _, spool in documents if spool)))
+                except UploadTooLarge:
+                    raise HTTPException(status_code=413, detail=too_large_message(BATCH_MAX_BYTES))
+            elif upload.content_type in ("application/pdf", DOCX_CONTENT_TYPE):
+                # An oversized CV is reported on its own line, only its first MAX_FILE_SIZE bytes are read
+                try:
+                    documents.append((upload.filename, await spool_upload(upload, MAX_FILE_SIZE, spool_bytes=0)))
+                except UploadTooLarge:
+                    documents.append((upload.filename, None))
+            else:
+                raise BatchError(f"Invalid file type for '{upload.filename}'. Please upload PDF or DOCX files or a zip archive.")
+            if len(documents) > BATCH_MAX_FILES:
+                raise BatchError(f"Too many files. Maximum is {BATCH_MAX_FILES} CVs per batch.")
+
+        if not documents:
+            raise HTTPException(status_code=400, detail="No CV files found in the upload.")
+        try:
+            await run_in_threadpool(index_registry.current)
+            await check_filters(filters)
+        except ModelNotReady:
+            raise model_loading_error()
+    except BatchError as e:
+        close_documents(documents)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        close_documents(documents)
+        raise
+
+    # The uploads are spooled here, the response streams one line per CV and deletes the files
+    return StreamingResponse(stream_batch_results(documents, k, filters), media_type="application/x-ndjson")
+
+@router.get("/api/results/{handle}")
+async def result_page_api(handle: str, cursor: str = "0", limit: int = Query(9, ge=1, le=RESULTS_PAGE_LIMIT)):
+    """Deeper matches of a previous analysis, without re-extracting or rescoring the CV"""
+    ranking = await run_in_threadpool(result_store.get, handle)
+    if ranking is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle. Please analyze the CV again.")
+    try:
+        start = int(cursor)
+        if start < 0:
+            raise ValueError(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    rows, scores = ranking["rows"], ranking["scores"]
+    try:
+        results = await run_in_threadpool(result_page, ranking["index_version"], rows, scores, start, limit)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="The job index these results refer to has been replaced. Please analyze the CV again.")
+    except ModelNotReady:
+        raise model_loading_error()
+    return JSONResponse(content={
+        "success": True,
+        "handle": handle,
+        "results": results,
+        "cursor": str(start),
+        "next_cursor": str(start + limit) if start + limit < len(rows) else None,
+        "total_ranked": len(rows),
+        "index_version": ranking["index_version"],
+        "mode": ranking["mode"]
+    })
+
+@router.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and size of the CV analysis cache"""
+    return JSONResponse(content=await run_in_threadpool(analysis_cache.stats))
+
+@router.get("/api/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: request counters, per-stage latency histograms, upload sizes, cache and queue gauges"""
+    # The cache gauges read the sqlite backend
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type="text/plain; version=0.0.4")
+
 @router.get("/api/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness): the process is up, with the model loading state"""
     return JSONResponse(content={
         "status": "healthy",
-        "message": "CV Job Matcher API is running"
+        "message": "CV Job Matcher API is running",
+        "model": index_registry.status()
     })
+
+@router.get("/api/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the job index is loaded and warmed up, 503 before (or if loading failed)"""
+    status = index_registry.status()
+    if not index_registry.ready:
+        # A failed load is retried by the next probe
+        index_registry.start()
+    return JSONResponse(status_code=200 if index_registry.ready else 503, content=status)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import zipfile
+from io import BytesIO
+
+from starlette.concurrency import run_in_threadpool
+
+from web.extraction_pool import extraction_pool, ExtractionQueueFull, ExtractionTimeout
+from web.uploads import UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES, UploadSpool, too_large_message
+from web.extraction import extract_document
+from web.utils import find_top_matches_batch
+
+# Limits for one batch request
+BATCH_MAX_FILES = 500
+MAX_FILE_SIZE = UPLOAD_MAX_BYTES  # same limit as /api/analyze
+# Decompressed size of all the CVs of the zip archives of one batch together
+BATCH_MAX_DECOMPRESSED_BYTES = int(os.environ.get('CV_BATCH_MAX_DECOMPRESSED_BYTES', str(200 * 1024 * 1024)))
+# Pause before a file tries again when other requests hold every extraction slot
+BATCH_QUEUE_RETRY_DELAY = 0.5
+
+
+class BatchError(ValueError):
+    """Invalid batch upload (too many files, bad archive, ...)"""
+
+
+def is_zip_upload(filename: str, content_type: str) -> bool:
+    return content_type in ("application/zip", "application/x-zip-compressed") or (filename or "").lower().endswith(".zip")
+
+
+def read_zip_documents(source, max_files: int = BATCH_MAX_FILES,
+                       max_bytes: int = BATCH_MAX_DECOMPRESSED_BYTES):
+    """Return (name, UploadSpool) for every PDF or DOCX file inside a zip archive (bytes or path).
+
+    The file count and the declared decompressed sizes are checked before
+    anything is decompressed. Every member is then copied to its own
+    temporary file chunk by chunk, so only one chunk is in memory at a time.
+    Members larger than MAX_FILE_SIZE get None instead of a spool.
+    """
+    try:
+        archive = zipfile.ZipFile(source if isinstance(source, str) else BytesIO(source))
+    except zipfile.BadZipFile:
+        raise BatchError("Invalid zip archive.")
+    documents = []
+    with archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and info.filename.lower().endswith((".pdf", ".docx"))]
+        if len(members) > max_files:
+            raise BatchError(f"Too many files. Maximum is {BATCH_MAX_FILES} CVs per batch.")
+        # zipfile never decompresses more than the declared size of a member
+        if sum(info.file_size for info in members if info.file_size <= MAX_FILE_SIZE) > max_bytes:
+            raise BatchError(f"The archives are too large once decompressed. Maximum is "
+                             f"{max_bytes / (1024 * 1024):g}MB of CVs per batch.")
+        try:
+            for info in members:
+                if info.file_size > MAX_FILE_SIZE:
+                    documents.append((info.filename, None))
+                    continue
+                spool = UploadSpool(spool_bytes=0)
+                documents.append((info.filename, spool))
+                with archive.open(info) as member:
+                    for chunk in iter(lambda: member.read(UPLOAD_CHUNK_SIZE), b''):
+                        spool.write(chunk)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            close_documents(documents)
+            raise BatchError(f"Invalid zip archive: {e}")
+        except BaseException:
+            close_documents(documents)
+            raise
+    return documents
+
+
+def close_documents(documents):
+    """Delete the temporary files of a batch"""
+    for _, spool in documents:
+        if spool is not None:
+            spool.close()
+
+
+async def _extract(source, slots: asyncio.Semaphore):
+    """Extract one CV (bytes or path), waiting for a free slot instead of giving up on the file.
+
+    slots bounds the files of one batch submitted to the pool at once; a file
+    that still finds the pool full (other requests hold the slots) waits and
+    tries again for as long as the stream is open.
+    """
+    async with slots:
+        while True:
+            try:
+                return await extraction_pool.run(extract_document, source)
+            except ExtractionQueueFull:
+                await asyncio.sleep(BATCH_QUEUE_RETRY_DELAY)
+
+
+def _error_line(name: str, error: str) -> bytes:
+    return (json.dumps({"file": name, "success": False, "error": error}) + "\n").encode("utf-8")
+
+
+async def stream_batch_results(documents, k: int = 9, filters=None):
+    """Yield one NDJSON line per CV as soon as it has been scored.
+
+    documents are (name, UploadSpool or None for an oversized file) pairs;
+    their temporary files are deleted once extracted, and all of them when
+    the stream ends.
+
+    Extraction runs in parallel in the process pool, with at most as many
+    files submitted at once as the pool has slots. Every time some
+    extractions finish, all the CVs that are ready are vectorized with one
+    transform and scored with one sparse CVs x jobs product, so early CVs are
+    streamed back without waiting for the whole batch.
+    """
+    pending = {}
+    slots = asyncio.Semaphore(extraction_pool.max_workers + extraction_pool.queue_size)
+    try:
+        for name, spool in documents:
+            if spool is None:
+                yield _error_line(name, too_large_message(MAX_FILE_SIZE))
+                continue
+            pending[asyncio.ensure_future(_extract(spool.source(), slots))] = (name, spool)
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            ready = []
+            for task in done:
+                name, spool = pending.pop(task)
+                # Extracted: its temporary file is no longer needed
+                spool.close()
+                try:
+                    text = task.result()
+                except ExtractionTimeout:
+                    yield _error_line(name, "Reading this CV took too long.")
+                    continue
+                except Exception as e:
+                    # A broken file or a dead extraction process fails this CV, not the whole stream
+                    print(f"Error extracting '{name}' in batch: {e}")
+                    yield _error_line(name, "Could not read this file.")
+                    continue
+                if not text or text.strip() == "":
+                    yield _error_line(name, "Could not extract text from this file.")
+                    continue
+                ready.append((name, text))
+
+            if not ready:
+                continue
+            all_results = await run_in_threadpool(find_top_matches_batch, [text for _, text in ready], k, filters=filters)
+            for (name, _), results in zip(ready, all_results):
+                line = {"file": name, "success": True, "results": results, "total_matches": len(results)}
+                yield (json.dumps(line) + "\n").encode("utf-8")
+    finally:
+        # Client went away: do not leave extraction jobs behind
+        for task in pending:
+            task.cancel()
+        close_documents(documents)
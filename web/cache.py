@@ -0,0 +1,310 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 'memory' (per worker), 'sqlite' (shared by all workers on the machine) or 'none'
+CACHE_BACKEND = os.environ.get('CV_CACHE_BACKEND', 'memory')
+# Directory of the sqlite stores (cache, result handles, sessions) unless their path is set.
+# Created private to the user running the workers: the stores hold pickles.
+STATE_DIR = os.environ.get('CV_STATE_DIR', os.path.join(
+    tempfile.gettempdir(), f"cv-job-matching-{os.getuid()}" if hasattr(os, 'getuid') else 'cv-job-matching'))
+CACHE_PATH = os.environ.get('CV_CACHE_PATH', '')
+CACHE_MAX_ENTRIES = int(os.environ.get('CV_CACHE_MAX_ENTRIES', '2048'))
+CACHE_MAX_BYTES = int(os.environ.get('CV_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.environ.get('CV_CACHE_TTL', '3600'))
+
+
+def private_state_path(name: str, state_dir: str = None) -> str:
+    """Path of `name` in the private state directory, created with mode 0700 if missing.
+
+    Refuses a directory that is a symlink or belongs to another user, and
+    takes group/other permissions away from our own, so no other local user
+    can plant or read the pickled entries.
+    """
+    state_dir = state_dir or STATE_DIR
+    os.makedirs(state_dir, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        info = os.lstat(state_dir)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise RuntimeError(f"State directory '{state_dir}' is not a directory owned by the current user.")
+        if info.st_mode & 0o077:
+            os.chmod(state_dir, 0o700)
+    return os.path.join(state_dir, name)
+
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of bytes or text"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """In-process LRU cache bounded by entry count and total bytes, with a TTL.
+
+    Each entry can carry a tag; drop_tags_except() removes every entry whose
+    tag differs, which is how results of an old index version are dropped.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, tag, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def set(self, key, value, tag: str = ''):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, tag, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def drop_tags_except(self, tag: str):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[2] and entry[2] != tag]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SqliteCache:
+    """LRU cache in one SQLite file, shared by every worker process on the machine.
+
+    Same interface and bounds as LRUCache. Values are pickled, so the file
+    lives in the private state directory by default; hit/miss counters are
+    per process. Triggers keep the entry count and total size in a one-row
+    table, so a write checks the bounds without scanning the entries. Calls
+    block on SQLite: async code runs them in a worker thread.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL):
+        self.path = path or CACHE_PATH or private_state_path('cache.sqlite')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value BLOB, size INTEGER, tag TEXT, expires_at REAL, last_access REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            db.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER, bytes INTEGER)")
+            db.execute("INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN"
+                       " UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN"
+                       " UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0; END")
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front: concurrent writers queue instead of interleaving
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get(self, key):
+        db = self._connection()
+        now = time.time()
+        row = db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+        db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, tag: str = ''):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self._transaction() as db:
+            # DELETE + INSERT rather than INSERT OR REPLACE, which would skip the delete trigger
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            db.execute(
+                "INSERT INTO entries (key, value, size, tag, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, len(data), tag, now + self.ttl, now),
+            )
+            count, total = db.execute("SELECT entries, bytes FROM totals").fetchone()
+            if count <= self.max_entries and total <= self.max_bytes:
+                return
+            # Over a bound: expired entries go first, then the least recently used ones
+            db.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+            count, total = db.execute("SELECT entries, bytes FROM totals").fetchone()
+            evicted = db.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM (SELECT key, size, ROW_NUMBER() OVER w AS n, SUM(size) OVER w AS running"
+                "  FROM entries WINDOW w AS (ORDER BY last_access, key))"
+                " WHERE n <= ? OR running - size < ?)",
+                (max(0, count - self.max_entries), max(0, total - self.max_bytes)),
+            ).rowcount
+            self.evictions += max(0, evicted)
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def drop_tags_except(self, tag: str):
+        self._connection().execute("DELETE FROM entries WHERE tag != '' AND tag != ?", (tag,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        count, total = self._connection().execute("SELECT entries, bytes FROM totals").fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class AnalysisCache:
+    """Two-level, content-addressed cache for CV analysis.
+
+    Level 1: hash of the uploaded bytes -> extracted and preprocessed text.
+    Level 2: (hash of the text, k, search mode, index version) -> top-k results.
+    Results are tagged with the index version: as soon as a request sees a new
+    version, the results computed against older versions are dropped.
+    With the sqlite backend every call may wait on the database: call them
+    from async code through run_in_threadpool.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._index_version = None
+
+    def get_text(self, file_hash: str):
+        return self.backend.get(f"text:{file_hash}")
+
+    def set_text(self, file_hash: str, text: str):
+        self.backend.set(f"text:{file_hash}", text)
+
+    def _check_version(self, index_version: str):
+        if index_version != self._index_version:
+            self.backend.drop_tags_except(index_version)
+            self._index_version = index_version
+
+    def get_matches(self, text: str, k: int, mode: str, index_version: str, filters: str = ''):
+        self._check_version(index_version)
+        return self.backend.get(self._matches_key(text, k, mode, index_version, filters))
+
+    def set_matches(self, text: str, k: int, mode: str, index_version: str, matches, filters: str = ''):
+        self._check_version(index_version)
+        self.backend.set(self._matches_key(text, k, mode, index_version, filters), matches, tag=index_version)
+
+    @staticmethod
+    def _matches_key(text: str, k: int, mode: str, index_version: str, filters: str) -> str:
+        # filters is JobFilters.cache_key(), '' when unfiltered
+        key = f"matches:{content_hash(text)}:{k}:{mode}:{index_version}"
+        return f"{key}:{content_hash(filters)}" if filters else key
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+class NullCache:
+    """Backend used when caching is disabled"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, tag: str = ''):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def drop_tags_except(self, tag: str):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "none"}
+
+
+def create_cache_backend(backend: str = CACHE_BACKEND):
+    if backend == 'sqlite':
+        return SqliteCache()
+    if backend == 'none':
+        return NullCache()
+    return LRUCache()
+
+
+analysis_cache = AnalysisCache(create_cache_backend())
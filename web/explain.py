@@ -0,0 +1,102 @@
+"""Why a job ad matched: the terms that contributed most to its similarity.
+
+The similarity of a CV with a job ad is a sum over the terms they share of
+(CV weight x job weight), so the explanation only needs the intersection of
+the CV vector's non-zeros with the job row's non-zeros: each stored row is
+looked up in the sorted CV terms with one searchsorted, with no dense row,
+no DataFrame and no vocabulary rebuilt per request (the index keeps an
+index -> term array).
+
+Offline, from the repository root (same code path as /api/analyze?explain=true):
+    python -m web.explain cv.pdf --k 9 --terms 10
+    python -m web.explain --text "python developer with django and aws" --mode pruned
+"""
+import argparse
+import os
+
+import numpy as np
+
+from web.scoring import top_k_indices
+
+# Terms listed per match
+EXPLAIN_TERMS = int(os.environ.get('CV_EXPLAIN_TERMS', '10'))
+
+
+def query_terms(index, query):
+    """Sorted feature indices and weights of a one-row query, scaled like score_rows scales it"""
+    query = query.tocsr()
+    if not query.has_sorted_indices:
+        query = query.sorted_indices()
+    weights = np.asarray(query.data, dtype=np.float64)
+    norm = np.linalg.norm(weights)
+    if norm:
+        weights = weights / norm
+    # The stored weights of a quantized index are codes
+    return np.asarray(query.indices), weights * index.weight_scale
+
+
+def row_contributions(index, terms, weights, row: int):
+    """(feature indices, contributions) of the terms a job row shares with the query terms"""
+    matrix = index.matrix
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    row_terms = matrix.indices[start:end]
+    if not terms.shape[0] or start == end:
+        return np.empty(0, dtype=row_terms.dtype), np.empty(0)
+    positions = np.searchsorted(terms, row_terms)
+    np.minimum(positions, terms.shape[0] - 1, out=positions)
+    shared = terms[positions] == row_terms
+    contributions = weights[positions[shared]] * matrix.data[start:end][shared]
+    if not index.normalized:
+        contributions /= np.linalg.norm(matrix.data[start:end]) * index.weight_scale
+    return row_terms[shared], contributions
+
+
+def explain_matches(index, query, rows, n_terms: int = EXPLAIN_TERMS):
+    """For each row, its n_terms largest contributions to the similarity with the query, largest first.
+
+    Returns a list (one per row) of {"term", "contribution"} lists; the
+    contributions of all the shared terms add up to the similarity.
+    """
+    terms, weights = query_terms(index, query)
+    explanations = []
+    for row in rows:
+        features, contributions = row_contributions(index, terms, weights, int(row))
+        # Ties go to the lowest feature index, so the explanation is stable
+        top = top_k_indices(contributions, n_terms)
+        explanations.append([
+            {"term": term, "contribution": float(contribution)}
+            for term, contribution in zip(index.term_array[features[top]].tolist(), contributions[top])
+        ])
+    return explanations
+
+
+def print_explanations(records):
+    for rank, record in enumerate(records, 1):
+        print(f"{rank}. {record.get('Company', '')} - {record.get('Role', '')} (similarity {record['similarity']:.4f})")
+        for match in record['matched_terms']:
+            print(f"     {match['term']:<30} {match['contribution']:.4f}")
+
+
+if __name__ == "__main__":
+    from web.retrieval import SEARCH_MODES
+    parser = argparse.ArgumentParser(description="Top job matches for a CV and the terms behind each one.")
+    parser.add_argument('cv', nargs='?', help="CV file (PDF or DOCX)")
+    parser.add_argument('--text', help="CV text instead of a file")
+    parser.add_argument('--k', type=int, default=9)
+    parser.add_argument('--terms', type=int, default=EXPLAIN_TERMS, help="terms listed per match")
+    parser.add_argument('--mode', choices=SEARCH_MODES, default=None)
+    args = parser.parse_args()
+    if (args.cv is None) == (args.text is None):
+        parser.error("give either a CV file or --text")
+
+    from model.preprocessing import preprocess_text
+    from web.extraction import extract_document
+    from web.utils import index_registry, rank_job_ads, result_page
+    # The text the API ranks on: extracted and preprocessed
+    text = extract_document(args.cv) if args.cv else preprocess_text(args.text.lower())
+    if not text:
+        parser.exit(1, "Could not extract text from the CV.\n")
+    index_registry.load()
+    _, result, stats = rank_job_ads(text, args.k, args.mode)
+    print_explanations(result_page(stats["index_version"], result.rows, result.scores, 0, args.k,
+                                   explain_text=text, explain_terms=args.terms))
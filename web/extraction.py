@@ -0,0 +1,287 @@
+"""Text extraction of uploaded CVs, dispatched on the file format.
+
+The format comes from the first bytes of the file, not from the declared
+content type. PDFs go through pdfminer: 'full' mode runs its layout analysis
+(extract_pdf_text_capped, the default), 'fast' mode (opt-in) only collects the characters in
+content-stream order, with a space where there is a horizontal gap and a
+newline where the baseline moves, which is all a bag of words needs. DOCX
+files are read by streaming word/document.xml out of the zip through expat,
+keeping the text runs without building a document tree.
+
+Everything here runs in the extraction pool processes. The web workers
+import this module only to send its functions to the pool, so pdfminer is
+imported on first use, in the pool processes.
+"""
+import functools
+import os
+import resource
+import sys
+import time
+import zipfile
+from io import BytesIO, StringIO
+from xml.parsers import expat
+
+from model.preprocessing import preprocess_text
+
+# Extraction of uploaded CVs stops after this many pages / characters (0: no limit),
+# so a hostile 500-page PDF cannot keep an extraction process busy
+PDF_MAX_PAGES = int(os.environ.get('CV_PDF_MAX_PAGES', '20'))
+PDF_MAX_CHARS = int(os.environ.get('CV_PDF_MAX_CHARS', '100000'))
+FORMATS = ('pdf', 'docx')
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_MODES = ('full', 'fast')
+# 'full' (pdfminer's layout analysis) until 'fast' has been checked for parity on real CVs
+PDF_MODE = os.environ.get('CV_PDF_MODE', 'full')
+# Decompressed size of word/document.xml read at most (zip bombs stop here)
+DOCX_MAX_XML_BYTES = int(os.environ.get('CV_DOCX_MAX_XML_BYTES', str(50 * 1024 * 1024)))
+DOCX_CHUNK_SIZE = 64 * 1024
+
+_W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main '
+_DOCX_TEXT, _DOCX_TAB, _DOCX_PARAGRAPH = _W + 't', _W + 'tab', _W + 'p'
+_DOCX_BREAKS = (_W + 'br', _W + 'cr')
+
+
+def _open_source(content):
+    # raw bytes, or the path of an upload spooled to disk
+    return BytesIO(content) if isinstance(content, bytes) else open(content, 'rb')
+
+
+def _pdf_source(content):
+    # raw bytes, or the path of an upload spooled to disk
+    return BytesIO(content) if isinstance(content, bytes) else content
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _max_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def detect_format(content):
+    """'pdf' or 'docx' from the first bytes of the file (bytes or path), None for anything else"""
+    with _open_source(content) as f:
+        head = f.read(1024)
+    # The PDF header may follow some junk bytes, a zip always starts with a local file header
+    if b'%PDF-' in head:
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        return 'docx'
+    return None
+
+
+def count_pdf_pages(pdf_source):
+    """Page count from the PDF page tree (no layout analysis), None if it cannot be read"""
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+    from pdfminer.utils import open_filename
+    try:
+        with open_filename(pdf_source, "rb") as fp:
+            document = PDFDocument(PDFParser(fp))
+            return int(resolve1(resolve1(document.catalog['Pages'])['Count']))
+    except Exception:
+        return None
+
+
+def extract_pdf_text_capped(pdf_source, max_pages: int = 0, max_chars: int = 0):
+    """pdfminer text of at most max_pages pages, stopping after the page that reaches max_chars (0: no limit).
+
+    Runs the layout analysis ('full' mode). Returns (text, pages read, whether the document was cut short).
+    """
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.utils import open_filename
+    output = StringIO()
+    manager = PDFResourceManager(caching=True)
+    converter = TextConverter(manager, output, laparams=LAParams())
+    interpreter = PDFPageInterpreter(manager, converter)
+    pages_read, truncated = 0, False
+    with open_filename(pdf_source, "rb") as fp:
+        # one page more than the cap, only to know whether anything was left out
+        for page in PDFPage.get_pages(fp, maxpages=max_pages + 1 if max_pages else 0):
+            if (max_pages and pages_read == max_pages) or (max_chars and output.tell() >= max_chars):
+                truncated = True
+                break
+            interpreter.process_page(page)
+            pages_read += 1
+    converter.close()
+    text = output.getvalue()
+    if max_chars and len(text) > max_chars:
+        text, truncated = text[:max_chars], True
+    return text, pages_read, truncated
+
+
+class _EnoughText(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _fast_text_device_class():
+    """FastTextDevice, defined on first use: it subclasses a pdfminer device"""
+    from pdfminer.pdfdevice import PDFTextDevice
+    from pdfminer.pdffont import PDFUnicodeNotDefined
+
+    class FastTextDevice(PDFTextDevice):
+        """pdfminer device that keeps the characters only: no layout objects, no layout analysis"""
+
+        def __init__(self, manager, max_chars: int = 0):
+            super().__init__(manager)
+            self.parts = []
+            self.chars = 0
+            self.max_chars = max_chars
+            self._last = None  # (end x, baseline y) of the previous character
+
+        def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate):
+            advance = font.char_width(cid) * fontsize * scaling
+            try:
+                text = font.to_unichr(cid)
+            except PDFUnicodeNotDefined:
+                text = ''
+            a, _, _, d, x, y = matrix
+            height = abs(d) * fontsize or fontsize
+            if self._last is not None:
+                end, baseline = self._last
+                if abs(y - baseline) > 0.5 * height:
+                    self.parts.append('\n')
+                elif x - end > 0.15 * height:
+                    self.parts.append(' ')
+            self._last = (x + advance * a, y)
+            self.parts.append(text)
+            self.chars += len(text)
+            if self.max_chars and self.chars >= self.max_chars:
+                raise _EnoughText()
+            return advance
+
+        def text(self) -> str:
+            return ''.join(self.parts)
+
+    return FastTextDevice
+
+
+def extract_pdf_text_fast(pdf_source, max_pages: int = 0, max_chars: int = 0):
+    """Text of at most max_pages pages without layout analysis, stopping as soon as max_chars are collected.
+
+    Returns (text, pages read, whether the document was cut short), like extract_pdf_text_capped.
+    """
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.utils import open_filename
+    manager = PDFResourceManager(caching=True)
+    device = _fast_text_device_class()(manager, max_chars)
+    interpreter = PDFPageInterpreter(manager, device)
+    pages_read, truncated = 0, False
+    with open_filename(pdf_source, "rb") as fp:
+        for page in PDFPage.get_pages(fp, maxpages=max_pages + 1 if max_pages else 0):
+            if max_pages and pages_read == max_pages:
+                truncated = True
+                break
+            pages_read += 1
+            try:
+                interpreter.process_page(page)
+            except _EnoughText:
+                truncated = True
+                break
+            device.parts.append('\n')
+    text = device.text()
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars]
+    return text, pages_read, truncated
+
+
+def extract_docx_text(source, max_chars: int = 0):
+    """Text of the body of a DOCX file (bytes or path), streamed from word/document.xml.
+
+    Paragraphs, breaks and tabs become newlines and tabs. Stops once max_chars
+    are collected or DOCX_MAX_XML_BYTES of XML were read. Returns (text, whether it was cut short).
+    """
+    parts = []
+    state = {'in_text': False, 'chars': 0}
+
+    def start(name, attributes):
+        if name == _DOCX_TEXT:
+            state['in_text'] = True
+        elif name == _DOCX_TAB:
+            parts.append('\t')
+        elif name in _DOCX_BREAKS:
+            parts.append('\n')
+
+    def end(name):
+        if name == _DOCX_TEXT:
+            state['in_text'] = False
+        elif name == _DOCX_PARAGRAPH:
+            parts.append('\n')
+
+    def data(text):
+        if state['in_text']:
+            parts.append(text)
+            state['chars'] += len(text)
+
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.buffer_text = True
+    parser.StartElementHandler, parser.EndElementHandler, parser.CharacterDataHandler = start, end, data
+    truncated, read = False, 0
+    with _open_source(source) as f, zipfile.ZipFile(f) as archive, archive.open('word/document.xml') as xml:
+        while True:
+            chunk = xml.read(DOCX_CHUNK_SIZE)
+            read += len(chunk)
+            if read > DOCX_MAX_XML_BYTES or (max_chars and state['chars'] >= max_chars):
+                truncated = True
+                break
+            parser.Parse(chunk, not chunk)
+            if not chunk:
+                break
+    text = ''.join(parts)
+    if max_chars and len(text) > max_chars:
+        text, truncated = text[:max_chars], True
+    return text, truncated
+
+
+def extract_document_with_stats(content, max_pages: int = PDF_MAX_PAGES, max_chars: int = PDF_MAX_CHARS,
+                                pdf_mode: str = PDF_MODE):
+    """Extract and preprocess the text of an uploaded CV (bytes or path; runs in the extraction pool).
+
+    stats has the detected format, the seconds spent extracting and
+    preprocessing, how much was read, and the CPU time and peak memory of
+    the extraction process. Unknown formats and unreadable files give "".
+    """
+    cpu_start = _cpu_seconds()
+    stats = {"format": None}
+    try:
+        stats["format"] = detect_format(content)
+        start = time.perf_counter()
+        if stats["format"] == 'pdf':
+            extract = extract_pdf_text_fast if pdf_mode == 'fast' else extract_pdf_text_capped
+            text, stats["pages_read"], stats["truncated"] = extract(_pdf_source(content), max_pages, max_chars)
+            stats["extract"] = time.perf_counter() - start
+            # Only a document cut short has pages left unread: parse it again for the total
+            stats["pages"] = count_pdf_pages(_pdf_source(content)) if stats["truncated"] else stats["pages_read"]
+        elif stats["format"] == 'docx':
+            text, stats["truncated"] = extract_docx_text(content, max_chars)
+            stats["extract"] = time.perf_counter() - start
+        else:
+            return "", stats
+        stats["chars"] = len(text)
+        start = time.perf_counter()
+        text = preprocess_text(text.lower())
+        stats["preprocess"] = time.perf_counter() - start
+        return text, stats
+    except Exception as e:
+        print(f"Error in text extraction: {e}")
+        return "", stats
+    finally:
+        stats["cpu_seconds"] = _cpu_seconds() - cpu_start
+        # High-water mark of the extraction process, not of this document alone
+        stats["max_rss_bytes"] = _max_rss_bytes()
+
+
+def extract_document(content):
+    """Extract and preprocess the text of a PDF or DOCX file (bytes or path)"""
+    text, _ = extract_document_with_stats(content)
+    return text
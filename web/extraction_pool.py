@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Number of extraction processes per web worker
+EXTRACT_WORKERS = int(os.environ.get('CV_EXTRACT_WORKERS', '2'))
+# Jobs allowed to wait for a free process before new uploads are rejected
+EXTRACT_QUEUE_SIZE = int(os.environ.get('CV_EXTRACT_QUEUE_SIZE', '8'))
+# Seconds a single extraction may take before the request gives up
+EXTRACT_TIMEOUT = float(os.environ.get('CV_EXTRACT_TIMEOUT', '30'))
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when every process is busy and the waiting queue is full"""
+
+
+class ExtractionTimeout(Exception):
+    """Raised when a job did not finish within the configured timeout"""
+
+
+class ExtractionPool:
+    """Bounded process pool that runs CPU-heavy extraction off the event loop.
+
+    At most `max_workers` jobs run at once and at most `queue_size` more wait
+    for a process; anything beyond that is rejected immediately instead of
+    piling up. A slot is only released when the job really finishes, so jobs
+    that timed out still count against the bound while they keep running.
+    """
+
+    def __init__(self, max_workers: int = EXTRACT_WORKERS, queue_size: int = EXTRACT_QUEUE_SIZE,
+                 timeout: float = EXTRACT_TIMEOUT):
+        self.max_workers = max(1, max_workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs currently running or waiting for a process"""
+        return self._in_flight
+
+    def _get_executor(self):
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.queue_size:
+                raise ExtractionQueueFull()
+            self._in_flight += 1
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker process died (e.g. killed by the OOM killer): start a fresh pool
+                self._executor = None
+                future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in a worker process and wait for the result without blocking the loop"""
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise ExtractionTimeout()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+extraction_pool = ExtractionPool()
@@ -0,0 +1,218 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Directory shared by all gunicorn workers of one deployment. Every worker
+# writes its own snapshot there and /api/metrics merges them, so any worker
+# can answer a scrape. Unset: metrics of this process only. gunicorn.conf.py
+# sets it for every gunicorn deployment and empties it when the master starts,
+# like prometheus_client's multiprocess directory.
+METRICS_DIR = os.environ.get('CV_METRICS_DIR')
+# Seconds between two snapshot writes of a worker
+METRICS_FLUSH_INTERVAL = float(os.environ.get('CV_METRICS_FLUSH_INTERVAL', '1'))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (10 * 1024, 50 * 1024, 100 * 1024, 250 * 1024, 500 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2,
+                10 * 1024 ** 2)
+PAGE_BUCKETS = (1, 2, 3, 4, 5, 10, 20, 50, 100)
+
+
+def _key(name: str, labels: dict) -> str:
+    return json.dumps([name, sorted(labels.items())])
+
+
+def clear_snapshots(directory: str):
+    """Delete the worker snapshots left by a previous deployment, so they are not counted again"""
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json*')):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Values are kept per process. With a shared directory each process also
+    writes a snapshot file (at most every flush_interval seconds, from a
+    background thread) and collect() merges the files of all workers:
+    counters and histograms are summed, gauges get a `pid` label and are only
+    reported for workers that are still alive.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._definitions = {}  # name -> (type, help, buckets)
+        self._callbacks = {}  # name -> function returning the current value
+        self._values = {}  # key -> float (counters) or [bucket counts..., sum, count] (histograms)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+
+    def counter(self, name: str, help: str):
+        self._definitions[name] = ('counter', help, None)
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self._definitions[name] = ('histogram', help, tuple(buckets))
+
+    def callback(self, name: str, kind: str, help: str, fn):
+        """Counter or gauge whose value is read from fn() at collection time"""
+        self._definitions[name] = (kind, help, None)
+        self._callbacks[name] = fn
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+        self._changed()
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._definitions[name][2]
+        key = _key(name, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+        self._changed()
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """Values of this process, callbacks included"""
+        with self._lock:
+            values = {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+        for name, fn in self._callbacks.items():
+            try:
+                values[_key(name, {})] = float(fn())
+            except Exception:
+                continue
+        return values
+
+    def _changed(self):
+        self._dirty = True
+        if self.directory and self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def flush(self):
+        """Write this process' snapshot to the shared directory"""
+        if not self.directory:
+            return
+        self._dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self) -> dict:
+        """Merged values of every worker (or of this process without a shared directory)"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = pid == os.getpid() or _pid_alive(pid)
+            for key, value in values.items():
+                name, labels = json.loads(key)
+                if self._definitions.get(name, ('counter',))[0] == 'gauge':
+                    if not alive:
+                        continue
+                    key = json.dumps([name, sorted(labels + [['pid', str(pid)]])])
+                if isinstance(value, list):
+                    entry = merged.setdefault(key, [0] * len(value))
+                    for i, count in enumerate(value):
+                        entry[i] += count
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        by_name = {}
+        for key, value in self.collect().items():
+            name, labels = json.loads(key)
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help, buckets) in self._definitions.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_name.get(name, [])):
+                if kind != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [['le', _number(bound)]])} {_number(cumulative)}")
+                lines.append(f"{name}_bucket{_labels(labels + [['le', '+Inf']])} {_number(value[-1])}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _number(value) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = MetricsRegistry()
+metrics.counter('cv_http_requests_total', 'HTTP requests by route, method and status code')
+metrics.histogram('cv_http_request_seconds', 'HTTP request latency by route')
+metrics.histogram('cv_stage_seconds', 'Time spent in each stage of the CV analysis pipeline')
+metrics.histogram('cv_search_seconds', 'Similarity search latency by the search mode that ran (filtered for filtered requests)')
+metrics.histogram('cv_upload_bytes', 'Size of uploaded CV files', SIZE_BUCKETS)
+metrics.histogram('cv_pdf_pages', 'Page count of uploaded CV PDFs', PAGE_BUCKETS)
+metrics.histogram('cv_extraction_cpu_seconds', 'CPU time of the extraction process per uploaded CV')
+metrics.histogram('cv_extraction_seconds', 'Text extraction time per uploaded CV, by file format')
+metrics.counter('cv_extraction_truncated_total', 'CVs cut short by the page or character limit, by file format')
+metrics.counter('cv_upload_rejected_total', 'Uploads refused with a 413 before their body was read')
+metrics.counter('cv_slow_request_profiles_total', 'Profiles dumped for requests above the latency threshold')
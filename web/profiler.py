@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Opt-in: requests slower than this many milliseconds dump a profile. Unset: profiler off.
+PROFILE_THRESHOLD_MS = os.environ.get('CV_PROFILE_THRESHOLD_MS')
+PROFILE_DIR = os.environ.get('CV_PROFILE_DIR', 'profiles')
+# Seconds between two samples
+PROFILE_INTERVAL = float(os.environ.get('CV_PROFILE_INTERVAL', '0.005'))
+# Samples kept in memory (about one minute at the default interval)
+PROFILE_BUFFER_SIZE = 12000
+
+
+class SamplingProfiler:
+    """Background thread that samples the Python stacks of every thread of the worker.
+
+    Samples go to a ring buffer. When a request finishes above the threshold,
+    the samples taken during that request are written as collapsed stacks
+    ("frame;frame;frame count" per line), the input format of flamegraph.pl
+    and speedscope. Work that ran in the extraction processes is not sampled,
+    only the wait for it; concurrent requests of the same worker show up too.
+    """
+
+    def __init__(self, threshold_ms: float, output_dir: str = PROFILE_DIR, interval: float = PROFILE_INTERVAL,
+                 buffer_size: int = PROFILE_BUFFER_SIZE):
+        self.threshold = threshold_ms / 1000
+        self.output_dir = output_dir
+        self.interval = interval
+        self._samples = deque(maxlen=buffer_size)  # (time, collapsed stack)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self._samples.append((now, ';'.join(reversed(stack))))
+            time.sleep(self.interval)
+
+    def dump_if_slow(self, start: float, end: float, label: str):
+        """Write the samples of [start, end] (perf_counter times) if the request was slow. Returns the file path."""
+        if end - start < self.threshold:
+            return None
+        stacks = Counter(stack for taken_at, stack in list(self._samples) if start <= taken_at <= end)
+        if not stacks:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_')
+        path = os.path.join(self.output_dir,
+                            f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{safe_label}-{(end - start) * 1000:.0f}ms.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def create_profiler():
+    """The profiler configured by CV_PROFILE_THRESHOLD_MS, or None when profiling is off"""
+    if not PROFILE_THRESHOLD_MS:
+        return None
+    profiler = SamplingProfiler(float(PROFILE_THRESHOLD_MS))
+    profiler.start()
+    return profiler
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from model.index import INDEX_DIR, current_version, open_index
+
+# How often (seconds) a worker checks whether a new index version was published
+INDEX_CHECK_INTERVAL = float(os.environ.get('CV_INDEX_CHECK_INTERVAL', '5'))
+# How long a request waits for the index while the worker is still loading it
+MODEL_WAIT_TIMEOUT = float(os.environ.get('CV_MODEL_WAIT_TIMEOUT', '10'))
+
+# Older index versions kept open for result handles created before a swap
+OLD_VERSIONS_KEPT = 2
+
+# Query run once after loading, so the first real request does not pay for
+# the scikit-learn import and the first page faults of the mapped files
+WARMUP_QUERY = "python developer with experience in sql and cloud"
+
+
+class ModelNotReady(Exception):
+    """Raised when the job index is still loading or failed to load"""
+
+
+class IndexRegistry:
+    """Job index used by this worker, loaded in the background and hot-swapped on new versions.
+
+    start() loads the current version in a background thread and runs a
+    warm-up query; the state goes from 'idle' to 'loading' to 'ready' (or
+    'failed'), with the timings of each step in status(). Requests that come
+    in while loading wait up to MODEL_WAIT_TIMEOUT seconds, then get
+    ModelNotReady. A failed load is retried by later requests.
+
+    Once ready, current() re-reads the CURRENT pointer at most every
+    check_interval seconds. A new version (e.g. from model/ingest.py) is
+    opened and warmed up before the reference is replaced, so a request keeps
+    using the index it started with while new requests get the new one. If
+    the new version cannot be opened, the old one stays.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, check_interval: float = INDEX_CHECK_INTERVAL,
+                 wait_timeout: float = MODEL_WAIT_TIMEOUT):
+        self.index_dir = index_dir
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+        self.state = 'idle'
+        self.error = None
+        self.timings = {}
+        self._index = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._old_versions = OrderedDict()  # version -> JobIndex
+
+    def _open(self, version: str = None):
+        """Open a version and warm it up; returns (index, timings in seconds)"""
+        from web.retrieval import search
+
+        timings = {}
+        start = time.perf_counter()
+        index = open_index(self.index_dir, version)
+        timings['open'] = time.perf_counter() - start
+        start = time.perf_counter()
+        vectorizer = index.vectorizer  # imports scikit-learn and rebuilds the vectorizer
+        timings['vectorizer'] = time.perf_counter() - start
+        start = time.perf_counter()
+        result = search(index, vectorizer.transform([WARMUP_QUERY]), 9)
+        for row in result.rows:
+            index.record(row)
+        timings['warmup'] = time.perf_counter() - start
+        return index, timings
+
+    def start(self):
+        """Load the current version in a background thread.
+
+        No-op while loading or once ready; after a failure, retried at most every check_interval seconds.
+        """
+        with self._lock:
+            if self.state in ('loading', 'ready'):
+                return
+            if self.state == 'failed' and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self.state = 'loading'
+            self._loaded.clear()
+        threading.Thread(target=self._load_in_background, name='index-loader', daemon=True).start()
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception:
+            pass  # already reported, state is 'failed'
+
+    def load(self):
+        """Open the current version now, in the calling thread. Raises if it cannot be loaded."""
+        with self._lock:
+            self.state = 'loading'
+        try:
+            index, timings = self._open()
+        except Exception as e:
+            with self._lock:
+                self.state = 'failed'
+                self.error = str(e)
+                self._checked_at = time.monotonic()
+            print(f"Error loading the job index from '{self.index_dir}': {e}")
+            self._loaded.set()
+            raise
+        with self._lock:
+            self._index = index
+            self._checked_at = time.monotonic()
+            self.timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+            self.state = 'ready'
+            self.error = None
+        print(f"Job index version '{index.version}' ready ({index.n_rows} job ads) in {sum(timings.values()):.2f}s")
+        self._loaded.set()
+        return index
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    def status(self) -> dict:
+        index = self._index
+        return {
+            "state": self.state,
+            "index_version": index.version if index is not None else None,
+            "job_ads": index.n_live if index is not None else None,
+            "load_seconds": self.timings,
+            "error": self.error,
+        }
+
+    def current(self):
+        """Index to use for one request; fetch it once and keep it for the whole request"""
+        index = self._index
+        if index is None:
+            self.start()
+            if not self._loaded.wait(self.wait_timeout) or self._index is None:
+                raise ModelNotReady(self.error or "The job index is still loading.")
+            return self._index
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return index
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self._index
+            self._checked_at = time.monotonic()
+            version = current_version(self.index_dir)
+            if version is None or version == self._index.version:
+                return self._index
+        # Open the new version outside the lock: other requests keep using the old one meanwhile
+        try:
+            new_index, _ = self._open(version)
+        except Exception as e:
+            print(f"Error loading job index version '{version}', keeping '{index.version}': {e}")
+            return self._index
+        with self._lock:
+            self._index = new_index
+        print(f"Switched to job index version '{version}'")
+        return new_index
+
+    def get_version(self, version: str):
+        """Index of a given version: the current one, or an older one that still exists on disk.
+
+        Raises FileNotFoundError if that version was pruned.
+        """
+        index = self.current()
+        if index.version == version:
+            return index
+        with self._lock:
+            old = self._old_versions.get(version)
+            if old is not None:
+                self._old_versions.move_to_end(version)
+                return old
+        if os.sep in version or version.startswith('.'):
+            raise FileNotFoundError(f"Invalid index version '{version}'")
+        old = open_index(self.index_dir, version)
+        with self._lock:
+            self._old_versions[version] = old
+            while len(self._old_versions) > OLD_VERSIONS_KEPT:
+                self._old_versions.popitem(last=False)
+        return old
@@ -0,0 +1,65 @@
+import os
+import secrets
+import time
+
+import numpy as np
+
+from web.cache import CACHE_BACKEND, LRUCache, SqliteCache, private_state_path
+
+# How many ranked job ads an analysis keeps for paging (the first page comes from the same ranking)
+RESULTS_DEPTH = int(os.environ.get('CV_RESULTS_DEPTH', '200'))
+# Seconds a result handle stays valid
+RESULTS_TTL = float(os.environ.get('CV_RESULTS_TTL', '1800'))
+RESULTS_MAX_ENTRIES = int(os.environ.get('CV_RESULTS_MAX_ENTRIES', '10000'))
+RESULTS_MAX_BYTES = int(os.environ.get('CV_RESULTS_MAX_BYTES', str(32 * 1024 * 1024)))
+# 'memory' (per worker) or 'sqlite' (shared by all workers, needed when running several).
+# Defaults to the analysis cache backend; results are kept even when that cache is disabled.
+RESULTS_BACKEND = os.environ.get('CV_RESULTS_BACKEND', 'sqlite' if CACHE_BACKEND == 'sqlite' else 'memory')
+# Empty: results.sqlite in the private state directory (CV_STATE_DIR)
+RESULTS_PATH = os.environ.get('CV_RESULTS_PATH', '')
+# Largest page a client can ask for
+RESULTS_PAGE_LIMIT = 50
+
+
+class ResultStore:
+    """Ranked matches of past analyses, behind an unguessable handle.
+
+    Only the ranking is stored (int32 rows and float scores, about 12 bytes
+    per job ad) together with the index version it refers to; pages are
+    built from the index when requested, so paging never re-extracts or
+    rescores the CV. Entries expire after the TTL and the least recently
+    used ones are evicted when the store is full. With the sqlite backend
+    create() and get() wait on the database: async code runs them in a
+    worker thread.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def create(self, rows, scores, index_version: str, mode: str) -> str:
+        handle = secrets.token_urlsafe(16)
+        self.backend.set(f"results:{handle}", {
+            "rows": np.asarray(rows, dtype=np.int32),
+            "scores": np.asarray(scores, dtype=np.float64),
+            "index_version": index_version,
+            "mode": mode,
+            "created_at": time.time(),
+        })
+        return handle
+
+    def get(self, handle: str):
+        """Stored ranking, or None if the handle is unknown or expired"""
+        return self.backend.get(f"results:{handle}")
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+def create_result_backend(backend: str = RESULTS_BACKEND):
+    if backend == 'sqlite':
+        return SqliteCache(path=RESULTS_PATH or private_state_path('results.sqlite'), max_entries=RESULTS_MAX_ENTRIES, max_bytes=RESULTS_MAX_BYTES,
+                           ttl=RESULTS_TTL)
+    return LRUCache(max_entries=RESULTS_MAX_ENTRIES, max_bytes=RESULTS_MAX_BYTES, ttl=RESULTS_TTL)
+
+
+result_store = ResultStore(create_result_backend())
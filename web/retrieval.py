@@ -0,0 +1,313 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from web.scoring import top_k_indices
+
+# 'exact' scores every job ad, 'pruned' walks the inverted index and only
+# scores the candidates that can still reach the top-k, 'approximate' ranks
+# the dense low-dimensional job vectors (model/projection.py)
+SEARCH_MODES = ('exact', 'pruned', 'approximate')
+DEFAULT_SEARCH_MODE = os.environ.get('CV_SEARCH_MODE', 'exact')
+# Approximate mode: the best rows by dense score that are re-scored exactly
+# with the sparse vectors (0 returns the dense scores as they are)
+APPROX_SHORTLIST = int(os.environ.get('CV_APPROX_SHORTLIST', '200'))
+# Rows of the dense job vectors multiplied at a time
+DENSE_BLOCK_ROWS = 65536
+# Exact search over at least SHARD_MIN_ROWS rows is split into SEARCH_SHARDS
+# row shards scored in parallel by SEARCH_THREADS threads (the sparse product
+# and the partial top-k release the GIL). 1 shard disables it: with several
+# gunicorn workers busy, the cores are already in use.
+SEARCH_SHARDS = int(os.environ.get('CV_SEARCH_SHARDS', '1'))
+SEARCH_THREADS = int(os.environ.get('CV_SEARCH_THREADS', '0')) or SEARCH_SHARDS
+SHARD_MIN_ROWS = int(os.environ.get('CV_SHARD_MIN_ROWS', '20000'))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Relative safety margin on the pruning threshold, so float rounding in the
+# partial sums can never drop a document that belongs in the exact top-k
+# (wider when the scorer works in float32)
+_BOUND_EPS = {np.dtype(np.float64): 1e-9, np.dtype(np.float32): 1e-5}
+
+
+class SearchResult(NamedTuple):
+    rows: np.ndarray
+    scores: np.ndarray
+    candidates_scored: int
+
+
+def score_rows(index, queries, matrix=None):
+    """(n_queries, n_rows) cosine similarity of the query rows with matrix (default: every row of the index).
+
+    The rows of a normalized index have unit length, so the cosine is the dot
+    product with the normalized query: one sparse matrix times dense vector
+    product in the precision the index is stored in, with no per-request
+    normalization or copy of the matrix. Other indexes use cosine_similarity.
+    """
+    matrix = index.matrix if matrix is None else matrix
+    if not getattr(index, 'normalized', False):
+        from sklearn.metrics.pairwise import cosine_similarity
+        return cosine_similarity(queries, matrix)
+    dense = queries.toarray()
+    norms = np.linalg.norm(dense, axis=1, keepdims=True)
+    dense = (dense / np.where(norms == 0, 1, norms)).astype(index.score_dtype)
+    if dense.shape[0] == 1:
+        scores = (matrix @ dense[0])[np.newaxis, :]
+    else:
+        scores = (matrix @ dense.T).T
+    if index.weight_scale != 1.0:
+        scores *= index.score_dtype(index.weight_scale)
+    return scores.astype(np.float64)
+
+
+def exact_search(index, query, k: int) -> SearchResult:
+    """Brute force: cosine similarity against every row, then partial top-k"""
+    if SEARCH_SHARDS > 1 and index.n_rows >= SHARD_MIN_ROWS:
+        return sharded_search(index, query, k)
+    similarities = score_rows(index, query).ravel()
+    if index.tombstones is not None:
+        # Expired job ads are never returned
+        similarities[index.tombstones] = -np.inf
+        k = min(k, index.n_live)
+    rows = top_k_indices(similarities, k)
+    return SearchResult(rows, similarities[rows], index.n_rows)
+
+
+def _shard_pool(threads: int) -> ThreadPoolExecutor:
+    """Thread pool shared by all requests of this worker, one per pool size"""
+    with _pools_lock:
+        if threads not in _pools:
+            _pools[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='search-shard')
+        return _pools[threads]
+
+
+def row_shards(matrix, n_shards: int):
+    """Split a CSR matrix into contiguous row ranges with about the same non-zeros each.
+
+    Returns (first row, CSR matrix) pairs whose data and indices are views of
+    the matrix's (memory-mapped) arrays, so sharding copies only the row pointers.
+    """
+    indptr = np.asarray(matrix.indptr)
+    cuts = np.searchsorted(indptr, np.linspace(0, indptr[-1], n_shards + 1)[1:-1], side='left')
+    bounds = np.unique(np.concatenate([[0], cuts, [matrix.shape[0]]]))
+    shards = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        first, last = indptr[start], indptr[end]
+        shard = csr_matrix((end - start, matrix.shape[1]), dtype=matrix.dtype)
+        # Assigned directly: the constructor copies slices smaller than half of their base array
+        shard.data, shard.indices = matrix.data[first:last], matrix.indices[first:last]
+        shard.indptr = indptr[start:end + 1] - first
+        shards.append((int(start), shard))
+    return shards
+
+
+def sharded_search(index, query, k: int, n_shards: int = None, threads: int = None) -> SearchResult:
+    """exact_search with the rows split into shards scored in parallel.
+
+    Every shard keeps its own top-k (ties to the lowest rows, as top_k_indices
+    does), and the global top-k is taken from their union in row order, so
+    rows, scores and tie-breaking are those of the unsharded search.
+    """
+    n_shards = n_shards or SEARCH_SHARDS
+    tombstones = index.tombstones
+    if tombstones is not None:
+        k = min(k, index.n_live)
+
+    def shard_top_k(shard):
+        start, matrix = shard
+        similarities = score_rows(index, query, matrix).ravel()
+        if tombstones is not None:
+            similarities[tombstones[start:start + matrix.shape[0]]] = -np.inf
+        top = top_k_indices(similarities, k)
+        return top + start, similarities[top]
+
+    pool = _shard_pool(threads or SEARCH_THREADS or n_shards)
+    parts = list(pool.map(shard_top_k, row_shards(index.matrix, n_shards)))
+    rows = np.concatenate([part_rows for part_rows, _ in parts])
+    scores = np.concatenate([part_scores for _, part_scores in parts])
+    # Row order, so ties at the k-th score break like the unsharded search
+    order = np.argsort(rows, kind='stable')
+    rows, scores = rows[order], scores[order]
+    top = top_k_indices(scores, k)
+    return SearchResult(rows[top], scores[top], index.n_rows)
+
+
+def dense_scores(index, query):
+    """Approximate similarity of the query with every row, from the dense job vectors.
+
+    The normalized query is projected once, then multiplied with the
+    contiguous float32 job vectors block by block into one score array.
+    """
+    query = query.tocsr()
+    norm = np.sqrt(query.multiply(query).sum())
+    vector = np.asarray(query @ index.projection, dtype=np.float32).ravel()
+    if norm:
+        vector /= np.float32(norm)
+    dense = index.dense
+    scores = np.empty(dense.shape[0], dtype=np.float32)
+    for start in range(0, dense.shape[0], DENSE_BLOCK_ROWS):
+        np.dot(dense[start:start + DENSE_BLOCK_ROWS], vector, out=scores[start:start + DENSE_BLOCK_ROWS])
+    return scores
+
+
+def approximate_search(index, query, k: int, shortlist: int = None) -> SearchResult:
+    """Top-k from the dense job vectors, with an exact re-rank of the shortlist.
+
+    The shortlist (the best max(k, shortlist) rows by dense score) is scored
+    with the sparse vectors, so the returned scores are exact and only rows the
+    projection ranked too low can be missed. With shortlist 0 the dense scores
+    are returned. Indexes without dense vectors are searched exactly.
+    """
+    if index.dense is None:
+        return exact_search(index, query, k)
+    shortlist = APPROX_SHORTLIST if shortlist is None else shortlist
+    k = min(int(k), index.n_live)
+    if k <= 0:
+        return SearchResult(np.empty(0, dtype=np.intp), np.empty(0), 0)
+    scores = dense_scores(index, query)
+    if index.tombstones is not None:
+        scores[index.tombstones] = -np.inf
+    if not shortlist:
+        rows = top_k_indices(scores, k)
+        return SearchResult(rows, scores[rows].astype(np.float64), 0)
+
+    # Row order, so ties in the exact scores break like exact_search
+    candidates = np.sort(top_k_indices(scores, min(max(k, shortlist), index.n_live)))
+    similarities = score_rows(index, query, index.matrix[candidates]).ravel()
+    top = top_k_indices(similarities, k)
+    return SearchResult(candidates[top], similarities[top], candidates.shape[0])
+
+
+def pruned_search(index, query, k: int) -> SearchResult:
+    """Exact top-k using the inverted index with MaxScore-style pruning.
+
+    1. The heads of the query terms' posting lists (sorted by weight) are
+       scored exactly; the k-th best of those scores is a lower bound on the
+       final k-th score.
+    2. The query terms with the smallest upper bounds (query weight times the
+       term's max weight) whose bounds sum below that threshold are
+       non-essential: a document that only contains those terms cannot make
+       the top-k, so their posting lists are never read.
+    3. The essential lists are accumulated, skipping (by binary search) the
+       tail of each list that cannot reach the threshold, and every document
+       whose upper bound stays below it is dropped.
+
+    The remaining candidates are scored exactly, which gives the same top-k,
+    scores and tie-breaking included, as exact_search.
+    """
+    n = index.n_rows
+    k = min(int(k), index.n_live)
+    tombstones = index.tombstones
+    if k <= 0:
+        return SearchResult(np.empty(0, dtype=np.intp), np.empty(0), 0)
+    query = query.tocsr()
+    terms, query_weights = query.indices, query.data
+    p_indptr, p_docs, p_weights, term_max = index.postings
+    bounds = query_weights * term_max[terms]
+
+    # 1. Lower bound on the k-th best score from the heads of the posting lists
+    heads = [p_docs[p_indptr[t]:min(p_indptr[t] + k, p_indptr[t + 1])] for t in terms]
+    seeds = np.unique(np.concatenate(heads)) if heads else np.empty(0, dtype=np.int64)
+    if tombstones is not None:
+        seeds = seeds[~tombstones[seeds]]
+    threshold = 0.0
+    if seeds.shape[0] >= k:
+        seed_scores = score_rows(index, query, index.matrix[seeds]).ravel()
+        threshold = np.partition(seed_scores, seeds.shape[0] - k)[seeds.shape[0] - k]
+    limit = threshold * (1 - _BOUND_EPS[np.dtype(getattr(index, 'score_dtype', np.float64))])
+
+    # 2. Non-essential terms: the smallest bounds whose sum stays below the threshold
+    order = np.argsort(bounds, kind='stable')
+    cumulative = np.cumsum(bounds[order])
+    n_non_essential = int(np.searchsorted(cumulative, limit, side='left'))
+    non_essential_bound = cumulative[n_non_essential - 1] if n_non_essential else 0.0
+    total_bound = cumulative[-1] if cumulative.shape[0] else 0.0
+
+    # 3. Accumulate the essential lists and drop documents that cannot reach the threshold.
+    # Only the documents found in those lists are accumulated (no array of n_rows per query).
+    touched, contributions = [], []
+    for term_pos in order[n_non_essential:]:
+        term, weight = terms[term_pos], query_weights[term_pos]
+        start, end = p_indptr[term], p_indptr[term + 1]
+        needed = (limit - (total_bound - bounds[term_pos])) / weight
+        if needed > 0:
+            end = start + np.searchsorted(-p_weights[start:end], -needed, side='right')
+        touched.append(p_docs[start:end])
+        contributions.append(weight * p_weights[start:end])
+    if touched:
+        docs, positions = np.unique(np.concatenate(touched), return_inverse=True)
+        partial = np.bincount(positions, weights=np.concatenate(contributions), minlength=docs.shape[0])
+        keep = partial + non_essential_bound >= limit
+        if tombstones is not None:
+            keep &= ~tombstones[docs]
+        docs = docs[keep]
+    else:
+        docs = np.empty(0, dtype=np.intp)
+    candidates = np.union1d(docs, seeds)
+    n_scored = candidates.shape[0]
+
+    if n_scored < k:
+        # Fewer documents share a term with the CV than requested: brute force
+        # would fill up with zero-score rows in row order
+        missing = np.ones(n, dtype=bool) if tombstones is None else ~tombstones
+        missing[candidates] = False
+        candidates = np.union1d(candidates, np.flatnonzero(missing)[:k - n_scored])
+
+    similarities = score_rows(index, query, index.matrix[candidates]).ravel()
+    top = top_k_indices(similarities, k)
+    return SearchResult(candidates[top], similarities[top], n_scored)
+
+
+def filtered_search(index, query, k: int, rows) -> SearchResult:
+    """Top-k among the given rows only (the output of a metadata filter).
+
+    Only those rows are read and scored, so the cost shrinks with the
+    selectivity of the filter; results and tie-breaking are those of
+    exact_search restricted to the rows.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if index.tombstones is not None:
+        rows = rows[~index.tombstones[rows]]
+    k = min(int(k), rows.shape[0])
+    if k <= 0:
+        return SearchResult(np.empty(0, dtype=np.intp), np.empty(0), 0)
+    similarities = score_rows(index, query, index.matrix[rows]).ravel()
+    top = top_k_indices(similarities, k)
+    return SearchResult(rows[top], similarities[top], rows.shape[0])
+
+
+def effective_mode(index, mode: str = None, rows=None) -> str:
+    """The strategy search() runs for a requested mode: 'filtered' when rows
+    restricts the search (the candidate set is scored directly whatever the
+    mode), 'exact' for 'approximate' on an index without dense vectors."""
+    mode = mode or DEFAULT_SEARCH_MODE
+    if rows is not None:
+        return 'filtered'
+    if mode == 'approximate' and index.dense is None:
+        return 'exact'
+    return mode
+
+
+def search(index, query, k: int, mode: str = None, rows=None) -> SearchResult:
+    """Top-k rows of the index for an already vectorized query.
+
+    rows restricts the search to a candidate set (sorted row numbers); the
+    filtered set is scored directly whatever the mode (see effective_mode).
+    """
+    mode = mode or DEFAULT_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'. Expected one of {', '.join(SEARCH_MODES)}.")
+    if rows is not None:
+        return filtered_search(index, query, k, rows)
+    if mode == 'exact':
+        return exact_search(index, query, k)
+    if mode == 'pruned':
+        return pruned_search(index, query, k)
+    if mode == 'approximate':
+        return approximate_search(index, query, k)
+    raise ValueError(f"Unknown search mode '{mode}'. Expected one of {', '.join(SEARCH_MODES)}.")
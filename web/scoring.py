@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def top_k_indices(scores, k: int):
+    """Return the row indices of the k highest scores, best first.
+
+    Uses an O(n) partial selection (argpartition) instead of sorting the whole
+    array; only the k winners are sorted. Ties are broken by row index (lower
+    index first) so the same input always gives the same ranking.
+    """
+    scores = np.asarray(scores).ravel()
+    n = scores.shape[0]
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < n:
+        # Everything strictly above the k-th best score is in, the ties at the
+        # k-th score are filled in by row index.
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth_score)
+        ties = np.flatnonzero(scores == kth_score)[:k - above.shape[0]]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def build_match_records(index, rows, scores):
+    """Build the output records (display columns + similarity) for the given rows only"""
+    records = []
+    for row, score in zip(rows, scores):
+        job = index.record(int(row))
+        job['similarity'] = float(score)
+        records.append(job)
+    return records
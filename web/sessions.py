@@ -0,0 +1,107 @@
+import math
+import os
+import re
+import secrets
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from web.cache import LRUCache, SqliteCache, private_state_path
+from web.results import RESULTS_BACKEND
+
+# 'memory' (per worker) or 'sqlite' (shared by all workers, needed when running several).
+# Defaults to the result store backend, since a session points at a result handle.
+SESSION_BACKEND = os.environ.get('CV_SESSION_BACKEND', RESULTS_BACKEND)
+# Empty: sessions.sqlite in the private state directory (CV_STATE_DIR)
+SESSION_PATH = os.environ.get('CV_SESSION_PATH', '')
+# Seconds a session lives after its last change (also the cookie max-age)
+SESSION_TTL = float(os.environ.get('CV_SESSION_TTL', '1800'))
+SESSION_MAX_ENTRIES = int(os.environ.get('CV_SESSION_MAX_ENTRIES', '10000'))
+SESSION_MAX_BYTES = int(os.environ.get('CV_SESSION_MAX_BYTES', str(8 * 1024 * 1024)))
+SESSION_COOKIE = 'cv_session'
+
+# secrets.token_urlsafe(16): 22 URL-safe characters
+_SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+
+class SessionStore:
+    """Session data kept on the server, behind a random session id.
+
+    The id is 128 random bits, so it needs no signature and no secret key:
+    every worker resolves it the same way as long as they share the backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_urlsafe(16)
+
+    def load(self, session_id: str):
+        """Session data, or None if the id is malformed, unknown or expired"""
+        if not session_id or not _SESSION_ID_RE.match(session_id):
+            return None
+        return self.backend.get(f"session:{session_id}")
+
+    def save(self, session_id: str, data: dict):
+        self.backend.set(f"session:{session_id}", dict(data))
+
+    def delete(self, session_id: str):
+        self.backend.delete(f"session:{session_id}")
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+def create_session_backend(backend: str = SESSION_BACKEND):
+    if backend == 'sqlite':
+        return SqliteCache(path=SESSION_PATH or private_state_path('sessions.sqlite'), max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES,
+                           ttl=SESSION_TTL)
+    return LRUCache(max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES, ttl=SESSION_TTL)
+
+
+class ServerSessionMiddleware:
+    """Drop-in replacement for Starlette's SessionMiddleware with the data kept in a SessionStore.
+
+    request.session works as before; the cookie only carries the session id.
+    The session is written back when a request changed it, under a fresh id
+    when the client had none (or an unknown one), and deleted when emptied.
+    The store is read and written in a worker thread, off the event loop.
+    """
+
+    def __init__(self, app, store: SessionStore = None, cookie_name: str = SESSION_COOKIE,
+                 max_age: float = SESSION_TTL, https_only: bool = False, same_site: str = 'lax'):
+        self.app = app
+        self.store = store if store is not None else SessionStore(create_session_backend())
+        self.cookie_name = cookie_name
+        self.max_age = math.ceil(max_age)
+        self.flags = f"path=/; Max-Age={self.max_age}; httponly; samesite={same_site}" + ("; secure" if https_only else "")
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket'):
+            return await self.app(scope, receive, send)
+
+        session_id = HTTPConnection(scope).cookies.get(self.cookie_name)
+        stored = await run_in_threadpool(self.store.load, session_id)
+        if stored is None:
+            session_id = None
+        scope['session'] = dict(stored or {})
+
+        async def send_wrapper(message):
+            nonlocal session_id
+            if message['type'] == 'http.response.start':
+                session = scope['session']
+                headers = MutableHeaders(scope=message)
+                if session and session != stored:
+                    session_id = session_id or self.store.new_id()
+                    await run_in_threadpool(self.store.save, session_id, session)
+                    headers.append('Set-Cookie', f"{self.cookie_name}={session_id}; {self.flags}")
+                elif not session and session_id is not None:
+                    await run_in_threadpool(self.store.delete, session_id)
+                    headers.append('Set-Cookie', f"{self.cookie_name}=null; path=/; "
+                                                 "expires=Thu, 01 Jan 1970 00:00:00 GMT; httponly")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import tempfile
+from io import BytesIO
+
+from web.metrics import metrics
+
+# Largest CV accepted by /upload and /api/analyze
+UPLOAD_MAX_BYTES = int(os.environ.get('CV_UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+# Largest request body of /api/analyze/batch (all files and archives together)
+BATCH_MAX_BYTES = int(os.environ.get('CV_BATCH_MAX_BYTES', str(100 * 1024 * 1024)))
+# Uploads up to this size stay in memory, larger ones are spooled to a temporary file
+UPLOAD_SPOOL_BYTES = int(os.environ.get('CV_UPLOAD_SPOOL_BYTES', str(1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Room for the multipart boundaries and headers around the file
+FORM_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload goes over its size limit"""
+
+    def __init__(self, limit: int):
+        super().__init__(limit)
+        self.limit = limit
+
+
+def too_large_message(limit: int) -> str:
+    return f"File size too large. Maximum size is {limit / (1024 * 1024):g}MB."
+
+
+class UploadSpool:
+    """An upload copied chunk by chunk, hashed on the way.
+
+    Kept in memory up to spool_bytes, then moved to a named temporary file so
+    the extraction process can open it by path instead of receiving the bytes.
+    """
+
+    def __init__(self, spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = BytesIO()
+        self._file = None
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size > self.spool_bytes:
+            self._file = tempfile.NamedTemporaryFile(prefix='cv-upload-', suffix='.upload', delete=False)
+            self._file.write(self._buffer.getvalue())
+            self._buffer = None
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer.write(chunk)
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def source(self):
+        """The bytes of a small upload, or the path of the spooled file"""
+        if self._file is None:
+            return self._buffer.getvalue()
+        self._file.flush()
+        return self._file.name
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            os.unlink(self._file.name)
+            self._file = None
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def spool_upload(upload, max_bytes: int = UPLOAD_MAX_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES) -> UploadSpool:
+    """Copy an UploadFile into an UploadSpool, giving up as soon as it exceeds max_bytes"""
+    spool = UploadSpool(spool_bytes)
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return spool
+            if spool.size + len(chunk) > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware rejecting oversized request bodies with a 413 before they are read.
+
+    limits maps a path to the largest upload it accepts; the body may be
+    FORM_OVERHEAD larger for the multipart framing. A Content-Length above
+    that is refused right away. Otherwise (e.g. chunked uploads) the body is
+    counted as it arrives; once the limit is crossed the 413 is sent, the
+    application sees a client disconnect and anything it tries to send
+    afterwards is dropped.
+    """
+
+    def __init__(self, app, limits: dict = None):
+        self.app = app
+        self.limits = limits if limits is not None else {
+            '/upload': UPLOAD_MAX_BYTES,
+            '/api/analyze': UPLOAD_MAX_BYTES,
+            '/api/analyze/batch': BATCH_MAX_BYTES,
+        }
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get('path')) if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+        body_limit = limit + FORM_OVERHEAD
+
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > body_limit:
+            return await self._reject(send, limit)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > body_limit:
+                    rejected = True
+                    await self._reject(send, limit)
+                    return {'type': 'http.disconnect'}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        metrics.inc('cv_upload_rejected_total')
+        body = json.dumps({"detail": too_large_message(limit)}).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body})
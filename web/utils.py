@@ -1,74 +1,123 @@
-from pdfminer.high_level import extract_text
-import re
 import sys
 import os
-import pickle
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity 
+import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from model.train_model import preprocess_text
-
-MODEL_PATH = 'model/tfidf_vectorizer.pkl'
-VECTORS_PATH = 'model/job_ads_tfidf_vectors.pkl'
-ORIGINAL_DATA_PATH = 'model/job_ads.csv'
-
-try:
-    with open(MODEL_PATH, 'rb') as f:
-        loaded_vectorizer = pickle.load(f)
-    
-    with open(VECTORS_PATH, 'rb') as f:
-        loaded_job_ads_vectors = pickle.load(f)
-    
-    loaded_job_ads_df = pd.read_csv(ORIGINAL_DATA_PATH)
-
-except FileNotFoundError as e:
-    print(f"Error: files {MODEL_PATH}, {VECTORS_PATH} and {ORIGINAL_DATA_PATH} are missing. {e}")
-    exit()
-except Exception as e:
-    print(f"Error during loading: {e}")
-    exit()
-    
-def extract_pdf_text(pdf_source):
-    """Extract and preprocess text from PDF source"""
-    try:
-        text = extract_text(pdf_source)
-        text = text.lower()
-        text = preprocess_text(text)
-        return text
-    except Exception as e:
-        print(f"Error in text extraction: {e}")
-        return ""
-    
-def find_top_matches(cv_text: str, k: int = 9):
-    """Find top k job matches for the given CV text"""
+# No pandas, scikit-learn or pdfminer at import time: the first two are loaded with the index
+# in the background, pdfminer only by the extraction processes
+from model.index import INDEX_DIR
+from web.scoring import top_k_indices, build_match_records
+from web.explain import EXPLAIN_TERMS, explain_matches
+from web.retrieval import DEFAULT_SEARCH_MODE, SEARCH_MODES, effective_mode, score_rows, search
+from web.registry import IndexRegistry, ModelNotReady
+from web.metrics import metrics
+
+# Directory of the memory-mapped job index written by model/train_model.py
+INDEX_PATH = os.environ.get('CV_INDEX_DIR', INDEX_DIR)
+
+# The index files are mapped read-only, so all workers share one copy in the page cache.
+# Loaded in the background when the app starts (or on first use); new versions
+# written by model/ingest.py are picked up without a restart.
+index_registry = IndexRegistry(INDEX_PATH)
+
+def filter_rows(index, filters):
+    """Rows passing the metadata filters (None: no filter). Raises ValueError for a column the index lacks."""
+    if not filters:
+        return None
+    with metrics.time("cv_stage_seconds", stage="filter"):
+        return index.facets.candidate_rows(filters)
+
+def rank_job_ads(cv_text: str, k: int = 9, mode: str = None, filters=None):
+    """Top k rows and scores for a CV, without building records. Returns (index, SearchResult, stats).
+
+    filters (a JobFilters) restricts the job ads before any similarity is computed.
+    """
+    # Same index version for the whole request, even if a new one is published meanwhile
+    index = index_registry.current()
+    rows = filter_rows(index, filters)
+
     # Vectorize the CV text and find the most similar job ads
-    cv_vector = loaded_vectorizer.transform([cv_text])
+    with metrics.time("cv_stage_seconds", stage="vectorize"):
+        cv_vector = index.vectorizer.transform([cv_text])
+
+    # Brute-force cosine similarity over every job ad (or the filtered ones), or inverted-index pruning
+    requested = mode or DEFAULT_SEARCH_MODE
+    ran = effective_mode(index, requested, rows)
+    with metrics.time("cv_stage_seconds", stage="similarity"), metrics.time("cv_search_seconds", mode=ran):
+        result = search(index, cv_vector, k, requested, rows)
+
+    # The mode that ran: a filtered request is scored directly whatever mode was asked for
+    stats = {
+        "mode": ran,
+        "candidates_scored": result.candidates_scored,
+        "corpus_size": index.n_live,
+        "index_version": index.version,
+    }
+    if ran != requested:
+        stats["requested_mode"] = requested
+    if rows is not None:
+        stats["filtered_rows"] = result.candidates_scored
+    return index, result, stats
 
-    # Calculate cosine similarity between the CV vector and job ads vectors
-    similarities = cosine_similarity(cv_vector, loaded_job_ads_vectors).flatten()
+def build_result_page(index, rows, scores):
+    """Output records for already ranked rows"""
+    with metrics.time("cv_stage_seconds", stage="records"):
+        return build_match_records(index, rows, scores)
 
-    # Combine the similarities with the job ads DataFrame
-    results_df = loaded_job_ads_df.copy() 
-    results_df['similarity'] = similarities
+def result_page(index_version: str, rows, scores, start: int, limit: int, explain_text: str = None,
+                explain_terms: int = EXPLAIN_TERMS):
+    """Records of rows[start:start + limit], from the index version they were ranked on.
 
-    # Order the results by similarity score
-    sorted_results = results_df.sort_values(by='similarity', ascending=False)
+    With explain_text (the CV text they were ranked for), every record also
+    gets "matched_terms": the explain_terms terms that contributed most to its similarity.
+    """
+    index = index_registry.get_version(index_version)
+    rows, scores = rows[start:start + limit], scores[start:start + limit]
+    records = build_result_page(index, rows, scores)
+    if explain_text is not None:
+        with metrics.time("cv_stage_seconds", stage="explain"):
+            query = index.vectorizer.transform([explain_text])
+            for record, terms in zip(records, explain_matches(index, query, rows, explain_terms)):
+                record['matched_terms'] = terms
+    return records
 
-    # Select the top k job ads
-    top_k_jobs = sorted_results.head(k)
-   
-    # Choose the columns to display
-    display_columns = ['Company','Role', 'Description', 'Job Link']
+def find_top_matches_with_stats(cv_text: str, k: int = 9, mode: str = None, filters=None):
+    """Find top k job matches and report how the search went (mode, candidates scored)"""
+    index, result, stats = rank_job_ads(cv_text, k, mode, filters)
+    # Build the output records only for the winning rows
+    matches = build_result_page(index, result.rows, result.scores)
+    return matches, stats
+
+def find_top_matches(cv_text: str, k: int = 9, mode: str = None, filters=None):
+    """Find top k job matches for the given CV text"""
+    matches, _ = find_top_matches_with_stats(cv_text, k, mode, filters)
+    return matches
 
-    # Convert the DataFrame to a list of dictionaries for easy reading
-    top_k_jobs_output = top_k_jobs[display_columns].to_dict(orient='records')
-    
-    # Add similarity scores to the output
-    similarities_list = sorted_results.head(k)['similarity'].tolist()
-    for i, job in enumerate(top_k_jobs_output):
-        job['similarity'] = float(similarities_list[i])
+def find_top_matches_batch(cv_texts, k: int = 9, chunk_size: int = 32, filters=None):
+    """Find top k job matches for many CV texts at once.
 
-    return top_k_jobs_output
+    All CVs are vectorized with a single transform and scored with one
+    CVs x jobs product per chunk (chunks bound the dense score block memory).
+    With filters only the matching job ads are in the product.
+    """
+    index = index_registry.current()
+    rows = filter_rows(index, filters)
+    if rows is None:
+        rows = np.arange(index.n_rows) if index.tombstones is None else np.flatnonzero(~index.tombstones)
+        # Expired job ads are never returned
+        matrix = index.matrix if index.tombstones is None else index.matrix[rows]
+    else:
+        if index.tombstones is not None:
+            rows = rows[~index.tombstones[rows]]
+        matrix = index.matrix[rows]
+    k = min(k, rows.shape[0])
+    cv_vectors = index.vectorizer.transform(cv_texts)
+    all_matches = []
+    for start in range(0, cv_vectors.shape[0], chunk_size):
+        similarities = score_rows(index, cv_vectors[start:start + chunk_size], matrix)
+        for row_similarities in similarities:
+            top = top_k_indices(row_similarities, k)
+            all_matches.append(build_match_records(index, rows[top], row_similarities[top]))
+    return all_matches
 
 
 if __name__ == "__main__":